@@ -230,15 +230,18 @@ fi
 # *** CHECK MODEL ***
 
 # Get model reporting variables, check values.
-"$common_dir/esp-query/esp-query.py" -o "$tmp_dir/query_results.txt" "$building" "model_name" "model_description" "number_zones" "CFD_domains" "zone_control" "MRT_sensors" "MRT_sensor_names" "afn_network" "zone_names" "ctm_network" "number_ctm" "afn_zon_nod_nums" "uncertainties_file"
+"$common_dir/esp-query/esp-query.py" -c "$tmp_dir/esp-query_index.json" -j -o "$tmp_dir/query_results.json" "$building" "model_name" "model_description" "number_zones" "CFD_domains" "zone_control" "MRT_sensors" "MRT_sensor_names" "afn_network" "zone_names" "ctm_network" "number_ctm" "afn_zon_nod_nums" "uncertainties_file" "CFD_contaminants"
 
 if [ "$?" -ne 0 ]; then
   echo "Error: model reporting script failed." >&2
   exit 101
 fi
 
+# Load all outputs as query_* variables (see processOutput_toShell.py).
+eval "$("$common_dir/esp-query/processOutput_toShell.py" "$tmp_dir/query_results.json")"
+
 # Check model name.
-model_name="$(awk -f "$common_dir/esp-query/processOutput_getModelName.awk" "$tmp_dir/query_results.txt")"
+model_name="$query_model_name"
 if [ "X$model_name" == "X" ]; then
 # This really should be impossible, but check anyway.
   echo "Error: model name is empty." >&2
@@ -246,7 +249,7 @@ if [ "X$model_name" == "X" ]; then
 fi
 
 # Check number of zones.
-number_zones="$(awk -f "$common_dir/esp-query/processOutput_getNumZones.awk" "$tmp_dir/query_results.txt")"
+number_zones="$query_number_zones"
 if [ "X$number_zones" == "X" ] || [ "$number_zones" -eq 0 ]; then
   echo "Error: no thermal zones found in this model." >&2
   exit 102
@@ -260,27 +263,27 @@ while [ "$i" -lt "$number_zones" ]; do
 done
 
 # Assemble array of zone names.
-zone_names="$(awk -f "$common_dir/esp-query/processOutput_getSpaceSeparatedZoneNames.awk" "$tmp_dir/query_results.txt")"
+zone_names="${query_zone_name[*]}"
 array_zone_names=($zone_names)
 
 # Check zone control.
-zone_control="$(awk -f "$common_dir/esp-query/processOutput_getZoneControl.awk" "$tmp_dir/query_results.txt")"
+zone_control="$query_zone_control"
 
 # Check for air flow and contaminant networks.
-afn_network="$(awk -f "$common_dir/esp-query/processOutput_getAFNnetwork.awk" "$tmp_dir/query_results.txt")"
+afn_network="$query_afn_network"
 if [ "X$afn_network" == "X" ]; then
   echo "Error: no air flow network defined for this model." >&2
   exit 999
 fi
 is_afn=true
-ctm_network="$(awk -f "$common_dir/esp-query/processOutput_getCTMnetwork.awk" "$tmp_dir/query_results.txt")"
+ctm_network="$query_ctm_network"
 if [ "X$ctm_network" == "X" ]; then
   echo "Error: no contaminant network defined for this model." >&2
   exit 999
 fi
 
 # Check number of contaminants.
-number_ctm="$(awk -f "$common_dir/esp-query/processOutput_getNumCTM.awk" "$tmp_dir/query_results.txt")"
+number_ctm="$query_ctm_number"
 if [ "$number_ctm" -ne "1" ]; then
   echo "Error: need 1 contaminant defined in network." >&2
   exit 999
@@ -289,7 +292,7 @@ fi
 # Check for MRT sensors.
 # While we're here, assemble an array mapping sensor indices to zones,
 # and an array of indices for looping over sensor arrays.
-MRT_sensors="$(awk -f "$common_dir/esp-query/processOutput_getSpaceSeparatedMRTsensors.awk" "$tmp_dir/query_results.txt")"
+MRT_sensors="${query_zone_MRT_sensors[*]}"
 array_MRT_sensors=($MRT_sensors)
 is_MRT=false
 number_MRT_sensors=0
@@ -319,7 +322,7 @@ if ! $is_MRT; then
 fi
 
 # Check for CFD domains.
-CFD_domains="$(awk -f "$common_dir/esp-query/processOutput_getSpaceSeparatedCFDdomains.awk" "$tmp_dir/query_results.txt")"
+CFD_domains="${query_zone_CFD_domain[*]}"
 array_CFD_domains=($CFD_domains)
 is_CFD=false
 CFDdomain_count=0
@@ -402,7 +405,7 @@ if ! [ "X$preset" == "X" ]; then
 fi
 
 # Check for uncertainties definitions.
-ucn="$(awk -f "$common_dir/esp-query/processOutput_getUncertaintiesFile.awk" "$tmp_dir/query_results.txt")"
+ucn="$query_uncertainties_file"
 if [ "X$ucn" == "X" ]; then
   is_ucn=false
 else
@@ -578,14 +581,9 @@ fi
 echo '4' > "$tmp_dir/progress.txt"
 
 # Get array of AFN zone node indices.
-AFNnod_indices="$(awk -f "$common_dir/esp-query/processOutput_getSpaceSeparatedAFNnodNums.awk" "$tmp_dir/query_results.txt")"
+AFNnod_indices="${query_zone_afn_node_number[*]}"
 array_AFNnod_indices=($AFNnod_indices)
 
-# Get CFD contaminant list.
-if $is_CFD; then
-  CFD_contam="$("$common_dir/esp-query/esp-query.py" "$building" "CFD_contaminants")"
-fi
-
 # Run res to get occupied hours.
 if ! [ "X$up_one" == "X" ]; then
   cd .. || exit 1
@@ -703,7 +701,7 @@ a"
     i0="$((i1-1))"
 
 # Check if CO2 is tracked in each CFD domain.
-    if [[ "$CFD_contam" == *zone#"$i1"=CO2* ]] || [[ "$CFD_contam" == *zone#"$i1"=CO_2* ]]; then
+    if [[ "${query_zone_CFD_contaminants[i1]}" == CO2* ]] || [[ "${query_zone_CFD_contaminants[i1]}" == CO_2* ]]; then
       array_is_CFDcontam[i0]=true
       i1_pad="$(printf "%03d" $i1)"
       res_script="$res_script
@@ -998,7 +996,7 @@ if "$do_detailed_report"; then
 
     # There are CFD results, one for each sensor.
     if "$is_CFD" && ${array_use_CFDresults[i0_zone]}; then
-      zone_sensor_names="$(awk -v zoneNum="$i1_zone" -f "$common_dir/esp-query/processOutput_getSpaceSeparatedZoneMRTsensorNames.awk" "$tmp_dir/query_results.txt")"
+      zone_sensor_names="${query_zone_MRT_sensor_names[i1_zone]}"
       array_zone_sensor_names=($zone_sensor_names)
       for sensor_name in "${array_zone_sensor_names[@]}"; do
         if [ "${array_severity[i0_result]}" -gt 0 ]; then
@@ -1057,7 +1055,7 @@ if [ "$performance_flag" -gt 0 ]; then
 
 # There are CFD results, one for each sensor.
     if "$is_CFD" && ${array_use_CFDresults[i0_zone]}; then
-      zone_sensor_names="$(awk -v zoneNum="$i1_zone" -f "$common_dir/esp-query/processOutput_getSpaceSeparatedZoneMRTsensorNames.awk" "$tmp_dir/query_results.txt")"
+      zone_sensor_names="${query_zone_MRT_sensor_names[i1_zone]}"
       array_zone_sensor_names=($zone_sensor_names)
       for sensor_name in "${array_zone_sensor_names[@]}"; do
 #      while [ "$i0_zone_sensor" -lt "${array_MRT_sensors[i0_zone]}" ]; do
@@ -1095,7 +1093,7 @@ if [ "$performance_flag" -gt 0 ]; then
       worst_time="${a[0]}/${a[1]}/$year @ ${a[2]}"
 #      while [ "$i0_zone_sensor" -lt "${array_MRT_sensors[i0_zone]}" ]; do
 
-      zone_sensor_names="$(awk -v zoneNum="$i1_zone" -f "$common_dir/esp-query/processOutput_getSpaceSeparatedZoneMRTsensorNames.awk" "$tmp_dir/query_results.txt")"
+      zone_sensor_names="${query_zone_MRT_sensor_names[i1_zone]}"
       array_zone_sensor_names=($zone_sensor_names)
       for sensor_name in "${array_zone_sensor_names[@]}"; do
 
@@ -1303,7 +1301,7 @@ if [ "$performance_flag" -gt 0 ]; then
 
 # There are CFD results, one for each sensor.
     if "$is_CFD" && ${array_use_CFDresults[i0_zone]}; then
-      zone_sensor_names="$(awk -v zoneNum="$i1_zone" -f "$common_dir/esp-query/processOutput_getSpaceSeparatedZoneMRTsensorNames.awk" "$tmp_dir/query_results.txt")"
+      zone_sensor_names="${query_zone_MRT_sensor_names[i1_zone]}"
       array_zone_sensor_names=($zone_sensor_names)
       for sensor_name in "${array_zone_sensor_names[@]}"; do
         if [ "${array_severity[i0_result]}" -gt 0 ]; then
@@ -1325,7 +1323,7 @@ if [ "$performance_flag" -gt 0 ]; then
       x="$(awk -v entryNum="$i1_result" -v isCFD=0 -f "$script_dir/get_sensorStats.awk" "$tmp_dir/CO2summary.txt")"
       a=($x)
       worst_time="${a[1]}/${a[0]} ${a[2]}"
-      zone_sensor_names="$(awk -v zoneNum="$i1_zone" -f "$common_dir/esp-query/processOutput_getSpaceSeparatedZoneMRTsensorNames.awk" "$tmp_dir/query_results.txt")"
+      zone_sensor_names="${query_zone_MRT_sensor_names[i1_zone]}"
       array_zone_sensor_names=($zone_sensor_names)
       for sensor_name in "${array_zone_sensor_names[@]}"; do
         if [ "$severity" -gt 0 ]; then
@@ -1402,7 +1400,7 @@ if [ "$performance_flag" -gt 0 ]; then
 
       # There are CFD results, one for each sensor.
       if "$is_CFD" && ${array_use_CFDresults[i0_zone]}; then
-        zone_sensor_names="$(awk -v zoneNum="$i1_zone" -f "$common_dir/esp-query/processOutput_getSpaceSeparatedZoneMRTsensorNames.awk" "$tmp_dir/query_results.txt")"
+        zone_sensor_names="${query_zone_MRT_sensor_names[i1_zone]}"
         array_zone_sensor_names=($zone_sensor_names)
         i0_mark=-1
         for sensor_name in "${array_zone_sensor_names[@]}"; do
@@ -1444,7 +1442,7 @@ if [ "$performance_flag" -gt 0 ]; then
         # However to maintain consistency, we still add a plot for each location.
         severity="${array_severity[i0_result]}"
         i1_result="$((i0_result+1))"
-        zone_sensor_names="$(awk -v zoneNum="$i1_zone" -f "$common_dir/esp-query/processOutput_getSpaceSeparatedZoneMRTsensorNames.awk" "$tmp_dir/query_results.txt")"
+        zone_sensor_names="${query_zone_MRT_sensor_names[i1_zone]}"
         array_zone_sensor_names=($zone_sensor_names)
         i0_mark=-1
         for sensor_name in "${array_zone_sensor_names[@]}"; do
@@ -225,15 +225,18 @@ fi
 # *** CHECK MODEL ***
 
 # Get model reporting variables, check values.
-"$common_dir/esp-query/esp-query.py" -o "$tmp_dir/query_results.txt" "$building" "model_name" "model_description" "number_zones" "CFD_domains" "zone_control" "zone_setpoints" "MRT_sensors" "MRT_sensor_names" "afn_network" "zone_names" "zone_floor_surfs" "uncertainties_file" "ctm_network" "number_ctm"
+"$common_dir/esp-query/esp-query.py" -c "$tmp_dir/esp-query_index.json" -j -o "$tmp_dir/query_results.json" "$building" "model_name" "model_description" "number_zones" "CFD_domains" "zone_control" "zone_setpoints" "MRT_sensors" "MRT_sensor_names" "afn_network" "zone_names" "zone_floor_surfs" "uncertainties_file" "ctm_network" "number_ctm" "CFD_contaminants"
 
 if [ "$?" -ne 0 ]; then
   echo "Error: model reporting script failed." >&2
   exit 101
 fi
 
+# Load all outputs as query_* variables (see processOutput_toShell.py).
+eval "$("$common_dir/esp-query/processOutput_toShell.py" "$tmp_dir/query_results.json")"
+
 # Check model name.
-model_name="$(awk -f "$common_dir/esp-query/processOutput_getModelName.awk" "$tmp_dir/query_results.txt")"
+model_name="$query_model_name"
 if [ "X$model_name" == "X" ]; then
 # This really should be impossible, but check anyway.
   echo "Error: model name is empty." >&2
@@ -241,7 +244,7 @@ if [ "X$model_name" == "X" ]; then
 fi
 
 # Check number of zones.
-number_zones="$(awk -f "$common_dir/esp-query/processOutput_getNumZones.awk" "$tmp_dir/query_results.txt")"
+number_zones="$query_number_zones"
 if [ "X$number_zones" == "X" ] || [ "$number_zones" -eq 0 ]; then
   echo "Error: no thermal zones found in this model." >&2
   exit 102
@@ -255,18 +258,18 @@ while [ "$i" -lt "$number_zones" ]; do
 done
 
 # Assemble array of zone names.
-zone_names="$(awk -f "$common_dir/esp-query/processOutput_getSpaceSeparatedZoneNames.awk" "$tmp_dir/query_results.txt")"
+zone_names="${query_zone_name[*]}"
 array_zone_names=($zone_names)
 
 # Check zone control.
-zone_control="$(awk -f "$common_dir/esp-query/processOutput_getZoneControl.awk" "$tmp_dir/query_results.txt")"
+zone_control="$query_zone_control"
 if [ "$zone_control" == "0" ]; then
   echo "Error: no heating or cooling detected in this model." >&2
   exit 205
 fi
 
 # Check for afn network.
-afn_network="$(awk -f "$common_dir/esp-query/processOutput_getAFNnetwork.awk" "$tmp_dir/query_results.txt")"
+afn_network="$query_afn_network"
 if [ "X$afn_network" == "X" ]; then
   is_afn=false
 else
@@ -274,8 +277,8 @@ else
 fi
 
 # Check for ctm network and number of contaminants.
-ctm_network="$(awk -f "$common_dir/esp-query/processOutput_getCTMnetwork.awk" "$tmp_dir/query_results.txt")"
-number_ctm="$(awk -f "$common_dir/esp-query/processOutput_getNumCTM.awk" "$tmp_dir/query_results.txt")"
+ctm_network="$query_ctm_network"
+number_ctm="$query_ctm_number"
 if [ "X$ctm_network" == "X" ] || [ "$number_ctm" -ne "1" ]; then
   is_1ctm=false
 else
@@ -285,7 +288,7 @@ fi
 # Check for MRT sensors.
 # While we're here, assemble an array mapping sensor indices to zones,
 # and an array of indices for looping over sensor arrays.
-MRT_sensors="$(awk -f "$common_dir/esp-query/processOutput_getSpaceSeparatedMRTsensors.awk" "$tmp_dir/query_results.txt")"
+MRT_sensors="${query_zone_MRT_sensors[*]}"
 array_MRT_sensors=($MRT_sensors)
 is_MRT=false
 number_MRT_sensors=0
@@ -316,11 +319,11 @@ if ! $is_MRT; then
 fi
 
 # Assemble array of MRT sensor names.
-MRTsensor_names="$(awk -f "$common_dir/esp-query/processOutput_getSpaceSeparatedAllMRTsensorNames.awk" "$tmp_dir/query_results.txt")"
+MRTsensor_names="${query_zone_MRT_sensor_names[*]}"
 array_MRTsensor_names=($MRTsensor_names)
 
 # Check for CFD domains.
-CFD_domains="$(awk -f "$common_dir/esp-query/processOutput_getSpaceSeparatedCFDdomains.awk" "$tmp_dir/query_results.txt")"
+CFD_domains="${query_zone_CFD_domain[*]}"
 array_CFD_domains=($CFD_domains)
 is_CFD=false
 is_CFDandMRT=false
@@ -345,9 +348,6 @@ for i in "${array_zone_indices[@]}"; do
   fi  
 done
 
-# Check CFD contaminants.
-CFD_contam="$("$common_dir/esp-query/esp-query.py" "$building" "CFD_contaminants")"
-
 # Get results file location, simulation period, timesteps and startup days if a simulation preset is defined.
 sim_results_preset=""
 mf_results_preset=""
@@ -410,7 +410,7 @@ if ! [ "X$preset" == "X" ]; then
 fi
 
 # Check for uncertainties definitions.
-ucn="$(awk -f "$common_dir/esp-query/processOutput_getUncertaintiesFile.awk" "$tmp_dir/query_results.txt")"
+ucn="$query_uncertainties_file"
 if [ "X$ucn" == "X" ]; then
   is_ucn=false
 else
@@ -1396,11 +1396,7 @@ for i0 in "${array_zone_indices[@]}"; do
     array_num_floor_surfaces[i0]=0
 
   elif [ "${array_MRT_sensors[i0]}" -gt 0 ]; then
-    floor_surfaces="$(awk -v zone="$i1" -f "$common_dir/esp-query/processOutput_getSingleZoneSpaceSeparatedFloorSurfs.awk" "$tmp_dir_tmp/query_results.txt")"
-    if [ $? -ne 0 ]; then
-      echo "Error: unable to find floor surface(s) for occupied zone ${i1}" >&2
-      exit $((300+$i1))
-    fi
+    floor_surfaces="${query_zone_floor_surfs[i1]}"
     array_floor_surfaces=($floor_surfaces)
     num_floor_surfaces="${#array_floor_surfaces[@]}"
     if [ "${num_floor_surfaces}" -eq 1 ]; then
@@ -1449,11 +1445,7 @@ for i1 in "${array_zones_with_MRTsensors[@]}"; do
   i0=$((i1-1))
 
 # Get floor surface numbers for this zone.
-  floor_surfaces="$(awk -v zone="$i1" -f "$common_dir/esp-query/processOutput_getSingleZoneSpaceSeparatedFloorSurfs.awk" "$tmp_dir_tmp/query_results.txt")"
-  if [ $? -ne 0 ]; then
-    echo "Error: unable to find floor surface(s) for occupied zone ${i1}" >&2
-    exit $((300+$i1))
-  fi
+  floor_surfaces="${query_zone_floor_surfs[i1]}"
   array_floor_surfaces=($floor_surfaces)
   num_floor_surfaces="${array_num_floor_surfaces[i0]}"
 
@@ -2185,7 +2177,7 @@ ${i1_sensor}"
 
       # If there are contaminants, and CO2 is tracked in this domain,
       # get co2 concentration.
-      if $is_1ctm && [[ "$CFD_contam" == *zone#"$i1_zone"=CO2* ]]; then
+      if $is_1ctm && [[ "${query_zone_CFD_contaminants[i1_zone]}" == CO2* ]]; then
         res_script="$res_script
 k
 b
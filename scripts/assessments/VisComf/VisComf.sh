@@ -237,15 +237,18 @@ fi
 # *** CHECK MODEL ***
 
 # Get model reporting variables, check values.
-"$common_dir/esp-query/esp-query.py" -o "$tmp_dir/query_results.txt" "$building" "model_name" "model_description" "number_zones" "zone_control" "MRT_sensors" "MRT_sensor_names" "afn_network" "zone_names" "uncertainties_file"
+"$common_dir/esp-query/esp-query.py" -c "$tmp_dir/esp-query_index.json" -j -o "$tmp_dir/query_results.json" "$building" "model_name" "model_description" "number_zones" "zone_control" "MRT_sensors" "MRT_sensor_names" "afn_network" "zone_names" "uncertainties_file"
 
 if [ "$?" -ne 0 ]; then
   echo "Error: model reporting script failed." >&2
   exit 101
 fi
 
+# Load all outputs as query_* variables (see processOutput_toShell.py).
+eval "$("$common_dir/esp-query/processOutput_toShell.py" "$tmp_dir/query_results.json")"
+
 # Check model name.
-model_name="$(awk -f "$common_dir/esp-query/processOutput_getModelName.awk" "$tmp_dir/query_results.txt")"
+model_name="$query_model_name"
 if [ "X$model_name" == "X" ]; then
 # This really should be impossible, but check anyway.
   echo "Error: model name is empty." >&2
@@ -253,21 +256,21 @@ if [ "X$model_name" == "X" ]; then
 fi
 
 # Check number of zones.
-number_zones="$(awk -f "$common_dir/esp-query/processOutput_getNumZones.awk" "$tmp_dir/query_results.txt")"
+number_zones="$query_number_zones"
 if [ "X$number_zones" == "X" ] || [ "$number_zones" -eq 0 ]; then
   echo "Error: no thermal zones found in this model." >&2
   exit 102
 fi
 
 # Assemble array of zone names.
-zone_names="$(awk -f "$common_dir/esp-query/processOutput_getSpaceSeparatedZoneNames.awk" "$tmp_dir/query_results.txt")"
+zone_names="${query_zone_name[*]}"
 array_zone_names=($zone_names)
 
 # Check zone control.
-zone_control="$(awk -f "$common_dir/esp-query/processOutput_getZoneControl.awk" "$tmp_dir/query_results.txt")"
+zone_control="$query_zone_control"
 
 # Check for afn network.
-afn_network="$(awk -f "$common_dir/esp-query/processOutput_getAFNnetwork.awk" "$tmp_dir/query_results.txt")"
+afn_network="$query_afn_network"
 if [ "X$afn_network" == "X" ]; then
   is_afn=false
 else
@@ -277,7 +280,7 @@ fi
 # Check for MRT sensors.
 # While we're here, assemble an array mapping sensor indices to zones,
 # and an array of indices for looping over sensor arrays.
-MRT_sensors="$(awk -f "$common_dir/esp-query/processOutput_getSpaceSeparatedMRTsensors.awk" "$tmp_dir/query_results.txt")"
+MRT_sensors="${query_zone_MRT_sensors[*]}"
 array_MRT_sensors=($MRT_sensors)
 is_MRT=false
 number_MRT_sensors=0
@@ -308,7 +311,7 @@ if ! $is_MRT; then
 fi
 
 # Assemble array of MRT sensor names.
-MRTsensor_names="$(awk -f "$common_dir/esp-query/processOutput_getSpaceSeparatedAllMRTsensorNames.awk" "$tmp_dir/query_results.txt")"
+MRTsensor_names="${query_zone_MRT_sensor_names[*]}"
 array_MRTsensor_names=($MRTsensor_names)
 
 # Get results file location, simulation period, timesteps and startup days if a simulation preset is defined.
@@ -359,7 +362,7 @@ if ! [ "X$preset" == "X" ]; then
 fi
 
 # Check for uncertainties definitions.
-ucn="$(awk -f "$common_dir/esp-query/processOutput_getUncertaintiesFile.awk" "$tmp_dir/query_results.txt")"
+ucn="$query_uncertainties_file"
 if [ "X$ucn" == "X" ]; then
   is_ucn=false
 else
@@ -584,7 +587,7 @@ if ! $is_occ; then
 fi
 
 # Check for MRT sensors.
-MRT_sensors="$(awk -f "$common_dir/esp-query/processOutput_getSpaceSeparatedMRTsensors.awk" "$tmp_dir/query_results.txt")"
+MRT_sensors="${query_zone_MRT_sensors[*]}"
 array_MRT_sensors=($MRT_sensors)
 is_MRT=false
 number_MRT_sensors=0
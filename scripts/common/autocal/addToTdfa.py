@@ -1,12 +1,15 @@
 #! /usr/bin/env python3
 
 # This script takes a csv file of measured data (output from ../chips/get_H2G_cal.sh) and adds this data to an existing ESP-r tdfa.
-# Currently, functionality is hard coded per estate ('Challenger' and 'NUIG').
-# Assumes that current directory is a job directory with a model in it, and file "../chips/measured_data.csv" exists from script location.
+# Each csv column becomes a tdfa item, with tag and type as given for that sensor in ../chips/[estate].calvar_template (sensor,tag,type per line); an existing item with the same tag is replaced.
+# Assumes that current directory is a job directory with a model in it.
+# The csv file is given by the optional 6th argument, otherwise file "../chips/measured_data.csv" from script location is used.
+# Prints the index (from 1) of the tdfa item of the first csv column, which may be an existing item that was replaced, for addCalAssociation.sh.
 
 import sys
 import os
 import datetime
+import tdfa
 
 # Read command line input.
 estate=sys.argv[1]
@@ -22,142 +25,54 @@ s_csvYear=tf.strftime('%Y')
 s_nsteps=sys.argv[4]
 i_nsteps=int(s_nsteps)
 s_oldTdfa=sys.argv[5]
+if len(sys.argv)>6:
+  s_csv=sys.argv[6]
+else:
+  s_csv=os.path.dirname(__file__)+'/../chips/measured_data.csv'
 
 # Initialise.
 scriptPath=os.path.dirname(__file__)
 i_startup=5 # this should match value in PAMs
-os.rename(s_oldTdfa,s_oldTdfa+'_bkup')
-s_newTdfa=s_oldTdfa
-s_oldTdfa=s_oldTdfa+'_bkup'
-
-# Calculate periods.
-i_numDays_csv =i_csvEndJDay-i_csvStartJDay+1
-i_numDays_tdfa=i_csvEndJDay-i_csvStartJDay+1+i_startup
 
 # If estate not recognised, exit.
-if estate!='NUIG': sys.exit(1)
-
-# Open files.
-f_oldTdfa=open(s_oldTdfa,'r')
-f_newTdfa=open(s_newTdfa,'w')
-f_csv=open(scriptPath+'/../chips/measured_data.csv','r')
-
-if estate=='NUIG':
-
-    # Get first day of csv data.
-    i_line=0
-    ll_firstDay=[]
-    ll_lastDay=[]
-    for s_line in f_csv:
-        i_line+=1
-        if i_line==1: continue
-        ls_line=s_line.strip().split(',')
-        t=datetime.datetime.strptime(ls_line[0],'%Y-%m-%d %H:%M:%S')
-        r_time=float(t.strftime('%j'))+(float(t.strftime('%H'))+1.0+(float(t.strftime('%M'))/60.0))/24.0
-        ll_firstDay.append([r_time]+ls_line[1:])
-        if i_line==24*i_nsteps+1: break
-    f_csv.seek(0)
-
-    # Loop over lines in the old tdfa.
-    data=False
-    pointers=False
-    i1_line=0
-    i0_dataLine=-1
-    for s_line in f_oldTdfa:
-        i1_line+=1
-        ls_line=s_line.strip().split(',')
-
-        if i1_line==3:
-            ls_line=s_line.strip().split()
-            s_numItems=str(int(ls_line[1])+1)
-            s_tdfaNsteps=ls_line[2]
-            assert s_tdfaNsteps==s_nsteps
-            s_year=s_csvYear
-            i_tdfaStartJDay=int(ls_line[4])
-            if i_tdfaStartJDay>(i_csvStartJDay-i_startup):
-                print('Error: start day of existing tdf is not early enough')
-                sys.exit(1)
-            s_tdfaStartJDay=str(i_tdfaStartJDay)
-            i_tdfaEndJDay=int(ls_line[5])
-            if i_tdfaEndJDay<(i_csvEndJDay):
-                print('Error: end day of existing tdf is not late enough')
-                sys.exit(1)
-            s_tdfaEndJDay=str(i_tdfaEndJDay)
-            i_numCols=int(ls_line[6])+1
-            s_numCols=str(i_numCols)
-            f_newTdfa.write(' '.join([s_numCols,s_numItems,s_nsteps,s_year,s_tdfaStartJDay,s_tdfaEndJDay,s_numCols])+'\n')
-
-        elif i1_line==5:
-            ls_line=s_line.strip().split()
-            s_numTS=ls_line[2]
-            f_newTdfa.write(' '.join(['1',str(i_numCols+1),s_numTS])+'\n')
-
-        elif ls_line[0]=='*pointers': 
-            f_newTdfa.write('''*items
-*tag,mixed_air   
-*type,DBTZNOBS
-*menu,Zone db T (observed):           
-*aide,Observed zone DB temp               
-*other,   0   1
-*fields, 1
-REAL  1   1      0.000    -49.000     49.000  Obs Zn DB temperature (C):        
-*end_item
-''')
-            f_newTdfa.write(s_line)
-            pointers=True
-
-        elif pointers:
-            f_newTdfa.write(','.join(ls_line+[str(int(ls_line[-1])+1)])+'\n')
-            pointers=False
-
-        elif s_line[:12]=='# Time Col 1':
-            f_newTdfa.write(s_line)
-            data=True
-            f_csv.readline()
-            i_jDay=i_tdfaStartJDay-1
-
-        elif data:
-            if ls_line[0]=='*end_tabular_data':
-                f_newTdfa.write(s_line)
-                break
-
-            i0_dataLine+=1
-            if i0_dataLine%(24*i_nsteps)==0: 
-                i_jDay+=1
-                i_hour=-1
-            if i0_dataLine%(i_nsteps)==0:
-                i_hour+=1
-                i_minute=0
-            else:
-                i_minute=int(i_minute+60/i_nsteps)
-
-            if i_jDay<i_csvStartJDay:
-                if i_hour==0 and i_minute==0:
-                    i0_firstDay=0
-                else:
-                    i0_firstDay+=1
-                f_newTdfa.write(','.join(ls_line+ll_firstDay[i0_firstDay][1:])+'\n')
-
-            elif i_jDay>=i_csvStartJDay and i_jDay<i_csvEndJDay:
-                ls_csvLine=f_csv.readline().strip().split(',')
-                f_newTdfa.write(','.join(ls_line+ls_csvLine[1:])+'\n')
-
-            elif i_jDay==i_csvEndJDay:
-                ls_csvLine=f_csv.readline().strip().split(',')
-                ll_lastDay.append(ls_csvLine)
-                f_newTdfa.write(','.join(ls_line+ls_csvLine[1:])+'\n')
-
-            elif i_jDay>i_csvEndJDay:
-                if i_hour==0 and i_minute==0:
-                    i0_lastDay=0
-                else:
-                    i0_lastDay+=1
-                f_newTdfa.write(','.join(ls_line+ll_lastDay[i0_lastDay][1:])+'\n')
-
-        else:
-            f_newTdfa.write(s_line)
-
+s_template=scriptPath+'/../chips/'+estate+'.calvar_template'
+if not os.path.isfile(s_template): sys.exit(1)
+
+# Read items for each sensor.
+dict_items={}
+f_template=open(s_template,'r')
+for s_line in f_template:
+  ls_line=s_line.strip().split(',')
+  if len(ls_line)<3: continue
+  dict_items[ls_line[0]]=tdfa.new_item(ls_line[1],ls_line[2])
+f_template.close()
+
+# Read the old tdfa, and check its period.
+tdf=tdfa.read(s_oldTdfa)
+if tdf['nsteps']!=i_nsteps:
+  print('Error: time steps of existing tdf do not match')
+  sys.exit(1)
+if tdf['start_day']>(i_csvStartJDay-i_startup):
+  print('Error: start day of existing tdf is not early enough')
+  sys.exit(1)
+if tdf['end_day']<(i_csvEndJDay):
+  print('Error: end day of existing tdf is not late enough')
+  sys.exit(1)
+tdf['year']=int(s_csvYear)
+
+# Add an item for each csv column. Days outside the csv period take the data
+# of the first or last day.
+t,ls_names,data=tdfa.read_csv(s_csv)
+try:
+  for i,s_name in enumerate(ls_names):
+    tdfa.set_item(tdf,dict_items[s_name],tdfa.on_grid(tdf,t,data[:,i]))
+except (KeyError,ValueError) as e:
+  print('Error: could not add '+s_name+' to tdfa: '+str(e))
+  sys.exit(1)
+
+# Keep a backup of the old tdfa.
+os.rename(s_oldTdfa,s_oldTdfa+'_bkup')
+tdfa.write(s_oldTdfa,tdf)
 
-f_oldTdfa.close()
-f_newTdfa.close()
-f_csv.close()
+ls_tags=[item['tag'] for item in tdf['items']]
+print(ls_tags.index(dict_items[ls_names[0]]['tag'])+1)
@@ -1,12 +1,14 @@
 #! /usr/bin/env python3
 
 # This script takes a csv file of measured data (output from ../chips/get_H2G_cal.sh) and creates an ESP-r tdfa from it.
-# Currently, functionality is hard coded per estate ('Challenger' and 'NUIG').
-# Assumes that current directory is a job directory with a model in it, and file "../chips/measured_data.csv" exists from script location.
+# Each csv column becomes a tdfa item, with tag and type as given for that sensor in ../chips/[estate].calvar_template (sensor,tag,type per line).
+# Assumes that current directory is a job directory with a model in it.
+# The csv file is given by the optional 5th argument, otherwise file "../chips/measured_data.csv" from script location is used.
 
 import sys
 import os
 import datetime
+import tdfa
 
 # Read command line input.
 estate=sys.argv[1]
@@ -18,75 +20,37 @@ tf=datetime.datetime.strptime(dateF,'%d/%m/%Y')
 tf_jDay=tf.strftime('%j')
 s_nsteps=sys.argv[4]
 i_nsteps=int(s_nsteps)
+if len(sys.argv)>5:
+  s_csv=sys.argv[5]
+else:
+  s_csv=os.path.dirname(__file__)+'/../chips/measured_data.csv'
 
 # Initialise.
 scriptPath=os.path.dirname(__file__)
 i_startup=5 # this should match value in PAMs
 
-# Calculate periods.
-i_numDays_csv =int(tf_jDay)-int(ts_jDay)+1
-i_numDays_tdfa=int(tf_jDay)-int(ts_jDay)+1+i_startup
-
 # If estate not recognised, exit.
-if estate!='NUIG': sys.exit(1)
-
-# Open files.
-f_tdfa=open('model/dbs/measured_data.tdfa','w')
-f_csv=open(scriptPath+'/../chips/measured_data.csv','r')
-
-if estate=='NUIG':
-  # Write tdfa header.
-  f_tdfa.write('''ASCIITDF3   
-# NWPR NITDF NTSPH itdyear,itdbdoy,itdedoy,columns
-  1 1 '''+s_nsteps+' '+ts.strftime('%Y')+' '+str(int(ts_jDay)-i_startup)+' '+str(int(tf_jDay))+''' 1
-# NEXTRC,NEXTCL,NDBSTP
-  1 2 '''+str(i_numDays_tdfa*24*i_nsteps)+'''
-*tdaid1,measured data from H2G platform
-*tdaid2,-
-*items
-*tag,mixed_air   
-*type,DBTZNOBS
-*menu,Zone db T (observed):           
-*aide,Observed zone DB temp               
-*other,   0   1
-*fields, 1
-REAL  1   1      0.000    -49.000     49.000  Obs Zn DB temperature (C):        
-*end_item
-*pointers
- 5
-*tabular_data
-# Time Col 1 Col 2 Col 3 Col 4 Col 5 Col 6 Col 7 Col 8...
-''')
-
-  # Get first day of csv data.
-  i_line=0
-  ll_firstDay=[]
-  for s_line in f_csv:
-    i_line+=1
-    if i_line==1: continue
-    ls_line=s_line.strip().split(',')
-    t=datetime.datetime.strptime(ls_line[0],'%Y-%m-%d %H:%M:%S')
-    r_time=float(t.strftime('%j'))+(float(t.strftime('%H'))+1.0+(float(t.strftime('%M'))/60.0))/24.0
-    ll_firstDay.append([r_time]+ls_line[1:])
-    if i_line==25: break
-  
-  # Write first day data for each start up day.
-  for i_day in range(i_startup):
-    for l_firstDay in ll_firstDay:
-      r_time=l_firstDay[0]-float(i_startup-i_day)
-      f_tdfa.write(','.join(['{:.6f}'.format(r_time)]+l_firstDay[1:])+'\n')
-    
-  # Write actual data.
-  f_csv.seek(0)
-  i_line=0
-  for s_line in f_csv:
-    i_line+=1
-    if i_line==1: continue
-    ls_line=s_line.strip().split(',')
-    t=datetime.datetime.strptime(ls_line[0],'%Y-%m-%d %H:%M:%S')
-    r_time=float(t.strftime('%j'))+(float(t.strftime('%H'))+1.0+(float(t.strftime('%M'))/60.0))/24.0
-    f_tdfa.write(','.join(['{:.6f}'.format(r_time)]+ls_line[1:])+'\n')
-  
-f_tdfa.write('*end_tabular_data')
-f_tdfa.close()
-f_csv.close()
+s_template=scriptPath+'/../chips/'+estate+'.calvar_template'
+if not os.path.isfile(s_template): sys.exit(1)
+
+# Read items for each sensor.
+dict_items={}
+f_template=open(s_template,'r')
+for s_line in f_template:
+  ls_line=s_line.strip().split(',')
+  if len(ls_line)<3: continue
+  dict_items[ls_line[0]]=tdfa.new_item(ls_line[1],ls_line[2])
+f_template.close()
+
+# Create tdfa for the period including start up days, and add an item for
+# each csv column. Start up days take the data of the first day.
+tdf=tdfa.new(ts.year,int(ts_jDay)-i_startup,int(tf_jDay),i_nsteps)
+t,ls_names,data=tdfa.read_csv(s_csv)
+try:
+  for i,s_name in enumerate(ls_names):
+    tdfa.set_item(tdf,dict_items[s_name],tdfa.on_grid(tdf,t,data[:,i]))
+except (KeyError,ValueError) as e:
+  print('Error: could not add '+s_name+' to tdfa: '+str(e))
+  sys.exit(1)
+
+tdfa.write('model/dbs/measured_data.tdfa',tdf)
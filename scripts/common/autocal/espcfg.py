@@ -0,0 +1,183 @@
+# Python module to make changes to an ESP-r model cfg file directly, rather
+# than through prj keystroke scripts.
+
+# Example usage:
+#   import espcfg
+#   cfg = espcfg.read('model/cfg/model.cfg')
+#   espcfg.set_tdf(cfg, '../dbs/measured_data.tdfa')
+#   espcfg.add_preset(cfg, 'H2Gcal', 5, 4, (31, 1), (3, 2))
+#   espcfg.write(cfg)
+
+# A cfg is held as a dictionary:
+# file  - cfg file name
+# lines - list of lines of the file
+# Changes are made to the lines, and checked (see validate) before the file
+# is replaced, in one write, atomically.
+
+# Simulation presets are held between "*sps" and "*end_sps" lines. The *sps
+# line holds: number of presets, start up days, building time steps per hour,
+# plant time steps per building time step, save level, averaging flag. Each
+# preset is a period line, then result file lines (e.g. "*sblr file.res")
+# and "*end_set". The period line is either "d1 m1 d2 m2 name" (old presets,
+# which use the start up days and time steps on the *sps line), or "startup
+# steps plant_steps save averaging d1 m1 d2 m2 name" (new presets), as read
+# by the assessment scripts (e.g. ../../assessments/ThermComf/
+# get_simPreset_period.awk).
+
+import os
+import tdfa
+
+# Read a cfg file.
+# Returns a cfg dictionary.
+# Raises ValueError if the file is not a cfg file.
+def read(filename):
+  handle = open(filename, 'r')
+  lines = handle.read().splitlines()
+  handle.close()
+  if not lines or not lines[0].startswith('* CONFIGURATION'):
+    raise ValueError(filename + ' is not an ESP-r cfg file')
+  return {'file': filename, 'lines': lines}
+
+# Find the first line starting with a keyword, e.g. "*tdf".
+# Returns the line index, or -1 if not found.
+def find(cfg, key, start=0):
+  for i in range(start, len(cfg['lines'])):
+    ls_line = cfg['lines'][i].split()
+    if ls_line and ls_line[0] == key:
+      return i
+  return -1
+
+# Get the value of a keyword line, e.g. the file name of "*tdf file".
+# Returns the value, or None if there is no such line.
+def get(cfg, key):
+  i = find(cfg, key)
+  if i < 0:
+    return None
+  ls_line = cfg['lines'][i].split()
+  return ls_line[1] if len(ls_line) > 1 else ''
+
+# Set the tdfa file of the model (relative to the cfg folder). A new *tdf
+# line goes after the *ctl line, or failing that the *clm line.
+# Raises ValueError if there is neither.
+def set_tdf(cfg, path):
+  line = '*tdf  ' + path
+  i = find(cfg, '*tdf')
+  if i >= 0:
+    cfg['lines'][i] = line
+    return
+  for key in ('*ctl', '*clm', '*stdclm'):
+    i = find(cfg, key)
+    if i >= 0:
+      cfg['lines'].insert(i + 1, line)
+      return
+  raise ValueError('no place for a tdf file in ' + cfg['file'])
+
+# Get the simulation presets of the model.
+# Returns a list of dictionaries, one per preset:
+# name    - preset name
+# startup - start up days
+# nsteps  - building time steps per hour
+# period  - (d1, m1, d2, m2)
+# files   - result file lines, e.g. ['*sblr file.res']
+def get_presets(cfg):
+  presets = []
+  i = find(cfg, '*sps')
+  if i < 0:
+    return presets
+  ls_head = cfg['lines'][i].split()
+  preset = None
+  for line in cfg['lines'][i+1:]:
+    ls_line = line.split('#')[0].split()
+    if not ls_line:
+      continue
+    if ls_line[0] == '*end_sps':
+      break
+    elif ls_line[0] == '*end_set':
+      presets.append(preset)
+      preset = None
+    elif ls_line[0].startswith('*'):
+      preset['files'].append(line.strip())
+    elif len(ls_line) >= 10:
+      preset = {'name': ls_line[9], 'startup': int(ls_line[0]), 'nsteps': int(ls_line[1]),
+                'period': tuple([int(s) for s in ls_line[5:9]]), 'files': []}
+    else:
+      preset = {'name': ls_line[4], 'startup': int(ls_head[2]), 'nsteps': int(ls_head[3]),
+                'period': tuple([int(s) for s in ls_line[0:4]]), 'files': []}
+  return presets
+
+# Add a simulation preset, for the period from start to end ((day, month)),
+# with results in resfile (default [name].res). The preset is written in the
+# same form as existing presets; for old presets this sets the start up days
+# and time steps of all presets.
+# Returns the number of presets.
+def add_preset(cfg, name, startup, nsteps, start, end, resfile=None):
+  if resfile is None:
+    resfile = name + '.res'
+  i = find(cfg, '*sps')
+  if i < 0:
+    # No presets yet; new block after the *year line, or the *tdf or *ctl line.
+    for key in ('*year', '*tdf', '*ctl'):
+      j = find(cfg, key)
+      if j >= 0:
+        break
+    if j < 0:
+      raise ValueError('no place for simulation presets in ' + cfg['file'])
+    cfg['lines'][j+1:j+1] = ['*sps' + ''.join(['%4d' % n for n in (0, startup, nsteps, 1, 4, 0)]), '*end_sps']
+    i = j + 1
+  ls_head = [int(s) for s in cfg['lines'][i].split()[1:7]]
+  presets = get_presets(cfg)
+
+  # Old presets have 5 items on the period line.
+  j = find(cfg, '*end_sps', i)
+  old = False
+  for line in cfg['lines'][i+1:j]:
+    ls_line = line.split('#')[0].split()
+    if ls_line and not ls_line[0].startswith('*'):
+      old = len(ls_line) < 10
+      break
+  if old:
+    period = '%4d%4d%4d%4d  %s' % (start[0], start[1], end[0], end[1], name)
+    ls_head[1] = startup
+    ls_head[2] = nsteps
+  else:
+    period = ''.join(['%4d' % n for n in (startup, nsteps, ls_head[3], ls_head[4], ls_head[5], start[0], start[1], end[0], end[1])]) + '  ' + name
+  ls_head[0] = len(presets) + 1
+  cfg['lines'][i] = '*sps' + ''.join(['%4d' % n for n in ls_head])
+  cfg['lines'][j:j] = [period, '*sblr ' + resfile, '*end_set']
+  return ls_head[0]
+
+# Check a cfg for the changes made here: the tdfa file can be read, and the
+# presets are complete and their number matches the *sps line.
+# Raises ValueError if not.
+def validate(cfg):
+  cfgdir = os.path.dirname(cfg['file'])
+  s_tdf = get(cfg, '*tdf')
+  if s_tdf is not None:
+    try:
+      tdfa.read(os.path.join(cfgdir, s_tdf))
+    except (OSError, ValueError, IndexError) as e:
+      raise ValueError('tdf file ' + s_tdf + ' cannot be read: ' + str(e))
+  i = find(cfg, '*sps')
+  if i >= 0:
+    if find(cfg, '*end_sps', i) < 0:
+      raise ValueError('simulation presets have no *end_sps')
+    try:
+      presets = get_presets(cfg)
+    except (IndexError, ValueError, TypeError, AttributeError):
+      raise ValueError('simulation presets cannot be read')
+    if len(presets) != int(cfg['lines'][i].split()[1]):
+      raise ValueError('number of simulation presets does not match *sps')
+    for preset in presets:
+      if not preset['files']:
+        raise ValueError('simulation preset ' + preset['name'] + ' has no result file')
+
+# Check and write a cfg file. The file is replaced atomically.
+# Raises ValueError if the cfg does not validate, in which case the file is
+# not changed.
+def write(cfg):
+  validate(cfg)
+  tmpfile = cfg['file'] + '.' + str(os.getpid())
+  handle = open(tmpfile, 'w')
+  handle.write('\n'.join(cfg['lines']) + '\n')
+  handle.close()
+  os.replace(tmpfile, cfg['file'])
@@ -1,11 +1,34 @@
 #! /bin/bash
 
+# This script calibrates ESP-r model 'model/cfg/*.cfg' against measured data
+# associated with it (see addCalAssociation.sh).
+# If the uncertainties file of the model (ual, relative to the cfg folder) has
+# uncertainties that simfarm.py can sample, these are first simulated in
+# parallel with simulation preset preset_name, into 'model/cfg/samples'. This
+# is not needed for calibration, so if there is nothing to sample or the
+# samples fail, calibration goes ahead. prj then runs the calibration with
+# simulation preset preset_letter.
+# Currently, functionality is hard coded per estate ('NUIG').
+# Assumes that current directory is a job directory with a model in it.
+
 estate="$1"
 preset_letter="$2"
+preset_name="$3"
+ual="$4"
 
-cd model/cfg || exit 1
+script_dir="$(dirname "$0")"
 
 if [ "$estate" == 'NUIG' ]; then
+  cfg="$(cd model && ls cfg/*.cfg | head -n 1)"
+  "$script_dir/simfarm.py" -p "$preset_name" -u "$ual" -t tmp/farm -o model/cfg/samples model "$cfg"
+  farm_status=$?
+  if [ $farm_status -eq 0 ]; then
+    rm -rf tmp/farm
+  elif [ $farm_status -ne 2 ]; then
+    echo "Warning: uncertainty samples not all simulated, see tmp/farm." >&2
+  fi
+
+  cd model/cfg || exit 1
   prj -file ./*.cfg -mode script <<XXX
 m
 v
@@ -24,4 +47,4 @@ f
 -
 -
 XXX
-fi
\ No newline at end of file
+fi
@@ -0,0 +1,283 @@
+#! /usr/bin/env python3
+
+# Python module to run variants of an ESP-r model (e.g. uncertainty samples or
+# calibration candidates) as independent bps simulations, in parallel.
+
+# Example usage:
+#   import simfarm
+#   plan = simfarm.ual_plan('model', 'cfg/model.cfg', 'model.ual', 'H2Gcal', 20)
+#   results = simfarm.run(plan, 'model', 'tmp/farm', 'model/cfg/samples')
+# or from the command line, in a job directory:
+#   simfarm.py -p H2Gcal -u model.ual -n 20 model cfg/model.cfg
+# (see simfarm.py -h).
+
+# Samples are generated from the uncertainties file of the model (the *ual
+# line of the cfg file, as reported by esp-query.py as uncertainties_file).
+# Uncertainties that simfarm can sample are lines of the form:
+#   *ucn name file line field type range
+# name  - name of the uncertain parameter
+# file  - model file, relative to the cfg folder
+# line  - line number (from 1)
+# field - field number (from 1), fields being separated by white space and/or
+#         commas
+# type  - "%" for a range relative to the value in the model, or "abs" for an
+#         absolute range
+# range - the value is sampled uniformly within value +/- range
+# Other lines are left to ESP-r. If there are no *ucn lines there is nothing
+# for simfarm to do, and the command line exits with status 2. Samples are
+# drawn by latin hypercube, so each parameter is spread evenly over its range
+# whatever the number of samples.
+
+# A plan is a dictionary of:
+# cfg     - cfg file, relative to the model folder, e.g. "cfg/model.cfg"
+# preset  - name of the simulation preset to run (see espcfg.py)
+# period  - optional (startup, nsteps, (d1, m1), (d2, m2)); if given, a preset
+#           of that name is added to each sample, for models without one
+# samples - list of samples, each a dictionary of:
+#           name  - sample name, used for its scratch folder and results
+#           edits - list of changes to the model, each a dictionary of:
+#                   file  - model file, relative to the model folder
+#                   line  - line number (from 1)
+#                   field - field number (from 1)
+#                   value - new value of the field
+#                   param - name of the uncertain parameter
+
+# Each sample is run in its own scratch copy of the model. Scratch copies are
+# made with "cp -a --reflink=auto", so they share blocks with the model where
+# the file system allows, but every file - including results libraries, mass
+# flow and CFD results and ACC files that bps writes - is the sample's own.
+# bps runs the preset without interaction ("-p preset silent"). The results
+# library of each sample is moved into the results folder as [name].res, with
+# samples.json listing the status and parameter values of each sample, and
+# the scratch copies of successful samples are removed.
+
+import os
+import sys
+import re
+import json
+import random
+import shutil
+import argparse
+from subprocess import run as run_cmd, DEVNULL, STDOUT
+from multiprocessing import Pool
+import espcfg
+
+# Split a line into fields and separators, so the layout of the line is kept
+# when a field is changed.
+# Returns the parts, and the index of the part holding the field, or -1 if
+# there is no such field.
+def split_fields(line, field):
+  parts = re.split(r'([\s,]+)', line)
+  j = 2 * (field - 1) + (2 if parts[0] == '' else 0)
+  if field < 1 or j >= len(parts) or parts[j] == '':
+    return parts, -1
+  return parts, j
+
+# Read the uncertainties of a model that can be sampled.
+# Returns a list of dictionaries of name, file (relative to the model folder),
+# line, field, value (in the model), low and high.
+# Raises ValueError if an uncertainty is incomplete, or its field does not hold
+# a number.
+def read_ual(model_dir, cfg, ual):
+  cfgdir = os.path.dirname(cfg)
+  handle = open(os.path.join(model_dir, cfgdir, ual), 'r')
+  lines = handle.read().splitlines()
+  handle.close()
+  params = []
+  for line in lines:
+    ls_line = line.split('#')[0].split()
+    if not ls_line or ls_line[0] != '*ucn':
+      continue
+    if len(ls_line) < 7 or ls_line[5] not in ('%', 'abs'):
+      raise ValueError(ual + ' has an incomplete uncertainty: ' + line.strip())
+    name = ls_line[1]
+    filename = os.path.normpath(os.path.join(cfgdir, ls_line[2]))
+    i_line = int(ls_line[3])
+    i_field = int(ls_line[4])
+    rng = float(ls_line[6])
+    handle = open(os.path.join(model_dir, filename), 'r')
+    model_lines = handle.read().split('\n')
+    handle.close()
+    if i_line < 1 or i_line > len(model_lines):
+      raise ValueError(name + ': ' + filename + ' has no line ' + str(i_line))
+    parts, j = split_fields(model_lines[i_line-1], i_field)
+    if j < 0:
+      raise ValueError(name + ': ' + filename + ' line ' + str(i_line) + ' has no field ' + str(i_field))
+    value = float(parts[j])
+    if ls_line[5] == '%':
+      rng = abs(value) * rng / 100
+    params.append({'name': name, 'file': filename, 'line': i_line, 'field': i_field,
+                   'value': value, 'low': value - rng, 'high': value + rng})
+  return params
+
+# Make a plan of samples from the uncertainties file of a model.
+# Returns a plan dictionary, or None if there are no uncertainties that can be
+# sampled (e.g. the file only holds uncertainties for ESP-r).
+def ual_plan(model_dir, cfg, ual, preset, nsamples, seed=None, period=None):
+  params = read_ual(model_dir, cfg, ual)
+  if not params:
+    return None
+  rand = random.Random(seed)
+  # Latin hypercube: one sample in each of nsamples strata of every
+  # parameter, with strata paired at random.
+  columns = []
+  for param in params:
+    strata = list(range(nsamples))
+    rand.shuffle(strata)
+    columns.append([param['low'] + (param['high'] - param['low']) * (k + rand.random()) / nsamples for k in strata])
+  samples = []
+  for i in range(nsamples):
+    edits = [{'file': param['file'], 'line': param['line'], 'field': param['field'],
+              'value': '%.6g' % columns[n][i], 'param': param['name']} for n, param in enumerate(params)]
+    samples.append({'name': 'sample%03d' % (i + 1), 'edits': edits})
+  plan = {'cfg': cfg, 'preset': preset, 'samples': samples}
+  if period is not None:
+    plan['period'] = period
+  return plan
+
+# Make a scratch copy of a model.
+def copy_model(model_dir, scratch_dir):
+  run_cmd(['cp', '-a', '--reflink=auto', model_dir, scratch_dir], check=True)
+
+# Apply the edits of a sample to a scratch copy of a model.
+# Raises ValueError if a line or field does not exist.
+def apply_edits(scratch_dir, edits):
+  byfile = {}
+  for edit in edits:
+    byfile.setdefault(edit['file'], []).append(edit)
+  for name, file_edits in byfile.items():
+    filename = os.path.join(scratch_dir, name)
+    handle = open(filename, 'r')
+    lines = handle.read().split('\n')
+    handle.close()
+    for edit in file_edits:
+      i = edit['line'] - 1
+      if i < 0 or i >= len(lines):
+        raise ValueError(name + ' has no line ' + str(edit['line']))
+      parts, j = split_fields(lines[i], edit['field'])
+      if j < 0:
+        raise ValueError(name + ' line ' + str(edit['line']) + ' has no field ' + str(edit['field']))
+      parts[j] = str(edit['value'])
+      lines[i] = ''.join(parts)
+    handle = open(filename, 'w')
+    handle.write('\n'.join(lines))
+    handle.close()
+
+# Run one sample: make its scratch copy, apply its edits and simulate.
+# Returns a dictionary of name, status ("ok" or an error message), parameter
+# values and the results library in the scratch copy.
+def run_sample(args):
+  model_dir, scratch_dir, plan, resfile, sample = args
+  sample_dir = os.path.join(scratch_dir, sample['name'])
+  cfgfile = os.path.join(sample_dir, plan['cfg'])
+  cfgdir = os.path.dirname(cfgfile)
+  result = {'name': sample['name'], 'status': 'ok',
+            'params': {edit['param']: edit['value'] for edit in sample['edits'] if 'param' in edit},
+            'file': os.path.join(cfgdir, resfile)}
+  try:
+    if os.path.isdir(sample_dir):
+      shutil.rmtree(sample_dir)
+    copy_model(model_dir, sample_dir)
+    apply_edits(sample_dir, sample['edits'])
+    if 'period' in plan:
+      startup, nsteps, start, end = plan['period']
+      cfg = espcfg.read(cfgfile)
+      espcfg.add_preset(cfg, plan['preset'], startup, nsteps, start, end, resfile)
+      espcfg.write(cfg)
+    if os.path.isfile(result['file']):
+      os.remove(result['file'])
+    handle = open(os.path.join(sample_dir, 'bps.out'), 'w')
+    res = run_cmd(['bps', '-file', os.path.basename(cfgfile), '-mode', 'text', '-p', plan['preset'], 'silent'],
+                  cwd=cfgdir, stdin=DEVNULL, stdout=handle, stderr=STDOUT)
+    handle.close()
+    if res.returncode != 0:
+      result['status'] = 'bps exited with ' + str(res.returncode)
+    elif not os.path.isfile(result['file']):
+      result['status'] = 'no results library'
+  except Exception as e:
+    result['status'] = str(e)
+  return result
+
+# Run all samples of a plan, on up to workers processes at once.
+# Returns a list of sample results, as run_sample, with results libraries
+# moved to results_dir.
+# Raises ValueError if the preset is not in the model.
+def run(plan, model_dir, scratch_dir, results_dir, workers=None):
+  if workers is None:
+    workers = os.cpu_count()
+  resfile = None
+  if 'period' in plan:
+    resfile = plan['preset'] + '.res'
+  else:
+    cfg = espcfg.read(os.path.join(model_dir, plan['cfg']))
+    for preset in espcfg.get_presets(cfg):
+      if preset['name'] == plan['preset']:
+        for line in preset['files']:
+          if line.split()[0] == '*sblr':
+            resfile = line.split()[1]
+  if resfile is None:
+    raise ValueError('no simulation preset ' + plan['preset'] + ' with a results library in ' + plan['cfg'])
+
+  os.makedirs(scratch_dir, exist_ok=True)
+  os.makedirs(results_dir, exist_ok=True)
+  ls_args = [(model_dir, scratch_dir, plan, resfile, sample) for sample in plan['samples']]
+  results = []
+  pool = Pool(min(workers, max(len(ls_args), 1)))
+  try:
+    # Gather results as samples finish.
+    for result in pool.imap_unordered(run_sample, ls_args):
+      if result['status'] == 'ok':
+        dst = os.path.join(results_dir, result['name'] + '.res')
+        shutil.move(result['file'], dst)
+        result['file'] = dst
+        shutil.rmtree(os.path.join(scratch_dir, result['name']), ignore_errors=True)
+      results.append(result)
+  finally:
+    pool.close()
+    pool.join()
+
+  # Keep the order of the plan in the listing.
+  order = {sample['name']: i for i, sample in enumerate(plan['samples'])}
+  results.sort(key=lambda result: order[result['name']])
+  handle = open(os.path.join(results_dir, 'samples.json'), 'w')
+  json.dump({'preset': plan['preset'], 'samples': results}, handle, indent=1)
+  handle.close()
+  return results
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Run the uncertainty samples of an ESP-r model as parallel bps simulations.')
+  parser.add_argument('model', help='model folder')
+  parser.add_argument('cfg', help='cfg file, relative to the model folder')
+  parser.add_argument('-u', dest='ual', required=True, help='uncertainties file, relative to the cfg folder')
+  parser.add_argument('-p', dest='preset', help='simulation preset')
+  parser.add_argument('-P', dest='period', type=int, nargs=6, metavar=('STARTUP', 'NSTEPS', 'D1', 'M1', 'D2', 'M2'),
+                      help='simulation period, for models without a preset')
+  parser.add_argument('-n', dest='nsamples', type=int, default=20, help='number of samples (default 20)')
+  parser.add_argument('-s', dest='seed', type=int, help='random seed')
+  parser.add_argument('-w', dest='workers', type=int, help='number of parallel simulations (default number of cores)')
+  parser.add_argument('-t', dest='scratch', default='tmp/farm', help='scratch folder (default tmp/farm)')
+  parser.add_argument('-o', dest='results', help='results folder (default samples in the cfg folder)')
+  args = parser.parse_args()
+  if (args.preset is None) == (args.period is None):
+    parser.error('one of -p and -P is required')
+  if args.period is None:
+    preset = args.preset
+    period = None
+  else:
+    preset = 'simfarm'
+    period = (args.period[0], args.period[1], tuple(args.period[2:4]), tuple(args.period[4:6]))
+  results_dir = args.results
+  if results_dir is None:
+    results_dir = os.path.join(args.model, os.path.dirname(args.cfg), 'samples')
+  try:
+    plan = ual_plan(args.model, args.cfg, args.ual, preset, args.nsamples, args.seed, period)
+    if plan is None:
+      print(args.ual + ' has no uncertainties that can be sampled')
+      sys.exit(2)
+    results = run(plan, args.model, args.scratch, results_dir, args.workers)
+  except (OSError, ValueError) as e:
+    print('ERROR: ' + str(e))
+    sys.exit(1)
+  nfailed = len([result for result in results if result['status'] != 'ok'])
+  print(str(len(results) - nfailed) + ' samples simulated, ' + str(nfailed) + ' failed')
+  sys.exit(1 if nfailed else 0)
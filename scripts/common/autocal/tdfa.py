@@ -0,0 +1,255 @@
+# Python module to read, change and write ESP-r temporal data files (tdfa).
+
+# Example usage:
+#   import tdfa
+#   tdf = tdfa.read('model/dbs/measured_data.tdfa')
+#   times, names, values = tdfa.read_csv('measured_data.csv')
+#   tdfa.set_item(tdf, tdfa.new_item('mixed_air', 'DBTZNOBS'), tdfa.on_grid(tdf, times, values[:, 0]))
+#   tdfa.write('model/dbs/measured_data.tdfa', tdf)
+
+# A tdfa is held as a dictionary:
+# format    - first line of the file, e.g. "ASCIITDF3"
+# nsteps    - time steps per hour
+# year      - year
+# start_day - first day of the year of the data
+# end_day   - last day of the year of the data
+# tdaid1    - description
+# tdaid2    - description
+# items     - list of items, each a dictionary of:
+#             tag     - item tag
+#             lines   - lines of the item, from *tag to the last field
+#             nfields - number of fields, i.e. data columns, of the item
+# pointers  - list of item pointers
+# data      - NumPy array of (time steps, columns) holding the data of the
+#             items in order
+# Counts in the file header follow from these, and the time column from the
+# period (see get_times), so they are not held.
+
+# The time of each time step is written as day of year plus a fraction, with
+# the time step ending at the hour after its start, as in createTdfa.py:
+# day + (hour + 1 + minute/60)/24.
+
+import os
+import numpy as np
+
+time_fmt = '%.6f'
+value_fmt = '%.10g'
+
+# Item templates by type, as lines following *tag.
+item_types = {
+  'DBTZNOBS': [
+    '*type,DBTZNOBS',
+    '*menu,Zone db T (observed):           ',
+    '*aide,Observed zone DB temp               ',
+    '*other,   0   1',
+    '*fields, 1',
+    'REAL  1   1      0.000    -49.000     49.000  Obs Zn DB temperature (C):        ']}
+
+# Make an empty tdfa for days start_day to end_day of year.
+# Returns a tdfa dictionary with no items.
+def new(year, start_day, end_day, nsteps, tdaid1='measured data from H2G platform', tdaid2='-'):
+  nrows = (end_day - start_day + 1) * 24 * nsteps
+  return {'format': 'ASCIITDF3   ', 'nsteps': nsteps, 'year': year, 'start_day': start_day, 'end_day': end_day,
+          'tdaid1': tdaid1, 'tdaid2': tdaid2, 'items': [], 'pointers': [], 'data': np.zeros((nrows, 0))}
+
+# Make an item of a type in item_types.
+# Returns an item dictionary.
+# Raises KeyError if the type is not known.
+def new_item(tag, itemtype):
+  lines = ['*tag,' + tag.ljust(12)] + item_types[itemtype]
+  return {'tag': tag, 'lines': lines, 'nfields': get_nfields(lines)}
+
+# Get the number of fields of an item from its lines.
+def get_nfields(lines):
+  for line in lines:
+    if line.startswith('*fields'):
+      return int(line.split(',')[1])
+  return 0
+
+# Read a tdfa file.
+# Returns a tdfa dictionary.
+# Raises ValueError if the file is not a tdfa, or the data does not match
+# the header.
+def read(filename):
+  handle = open(filename, 'r')
+  lines = handle.read().splitlines()
+  handle.close()
+  if len(lines) < 5 or not lines[0].startswith('ASCIITDF'):
+    raise ValueError(filename + ' is not an ESP-r tdfa file')
+  ls_head = lines[2].split()
+  tdf = new(int(ls_head[3]), int(ls_head[4]), int(ls_head[5]), int(ls_head[2]))
+  tdf['format'] = lines[0]
+  ncols = int(ls_head[6])
+  nrows = int(lines[4].split()[2])
+
+  i = 5
+  item = None
+  datalines = None
+  while i < len(lines):
+    line = lines[i]
+    i += 1
+    if datalines is not None:
+      if line.startswith('*end_tabular_data'):
+        break
+      if not line.startswith('#') and line.strip() != '':
+        datalines.append(line)
+    elif line.startswith('*tdaid1,'):
+      tdf['tdaid1'] = line[8:]
+    elif line.startswith('*tdaid2,'):
+      tdf['tdaid2'] = line[8:]
+    elif line.startswith('*tag,'):
+      item = {'tag': line[5:].strip(), 'lines': [line]}
+    elif line.startswith('*end_item'):
+      item['nfields'] = get_nfields(item['lines'])
+      tdf['items'].append(item)
+      item = None
+    elif item is not None:
+      item['lines'].append(line)
+    elif line.startswith('*pointers'):
+      tdf['pointers'] = [int(s) for s in lines[i].replace(',', ' ').split()]
+      i += 1
+    elif line.startswith('*tabular_data'):
+      datalines = []
+
+  # Parse the data block in one go; the first column is time.
+  if datalines is None:
+    raise ValueError(filename + ' has no tabular data')
+  values = np.array(' '.join(datalines).replace(',', ' ').split(), dtype=float)
+  if len(values) != nrows * (ncols + 1) or nrows != len(get_times(tdf)):
+    raise ValueError(filename + ' does not have ' + str(ncols) + ' columns for ' + str(nrows) + ' time steps')
+  tdf['data'] = values.reshape(nrows, ncols + 1)[:, 1:]
+  if sum([item['nfields'] for item in tdf['items']]) != ncols:
+    raise ValueError(filename + ' items do not match ' + str(ncols) + ' columns')
+  return tdf
+
+# Write a tdfa file, in one buffered pass. The file is replaced atomically.
+def write(filename, tdf):
+  ncols = tdf['data'].shape[1]
+  nrows = tdf['data'].shape[0]
+  buf = [tdf['format'],
+         '# NWPR NITDF NTSPH itdyear,itdbdoy,itdedoy,columns',
+         '  ' + ' '.join([str(ncols), str(len(tdf['items'])), str(tdf['nsteps']), str(tdf['year']), str(tdf['start_day']), str(tdf['end_day']), str(ncols)]),
+         '# NEXTRC,NEXTCL,NDBSTP',
+         '  ' + ' '.join(['1', str(ncols + 1), str(nrows)]),
+         '*tdaid1,' + tdf['tdaid1'],
+         '*tdaid2,' + tdf['tdaid2']]
+  for item in tdf['items']:
+    buf += ['*items'] + item['lines'] + ['*end_item']
+  buf += ['*pointers', ' ' + ','.join([str(p) for p in tdf['pointers']]),
+          '*tabular_data',
+          '# Time Col 1 Col 2 Col 3 Col 4 Col 5 Col 6 Col 7 Col 8...']
+  table = np.column_stack([get_times(tdf), tdf['data']])
+  fmt = ','.join([time_fmt] + [value_fmt] * ncols)
+  buf += [fmt % tuple(row) for row in table.tolist()]
+  buf.append('*end_tabular_data\n')
+
+  tmpfile = filename + '.' + str(os.getpid())
+  handle = open(tmpfile, 'w')
+  handle.write('\n'.join(buf))
+  handle.close()
+  os.replace(tmpfile, filename)
+
+# Get the time column of a tdfa.
+# Returns an array of times.
+def get_times(tdf):
+  n = tdf['nsteps']
+  steps = np.arange((tdf['end_day'] - tdf['start_day'] + 1) * 24 * n)
+  step = steps % (24 * n)
+  # Time steps are 60/n minutes, which need not be whole minutes.
+  return tdf['start_day'] + steps // (24 * n) + (step // n + 1 + (step % n) / n) / 24.0
+
+# Get the time step of each time (datetime64) in a tdfa, which may be outside
+# the data (negative or beyond the last time step).
+# Returns an array of time step indices.
+def get_rows(tdf, times):
+  n = tdf['nsteps']
+  t0 = np.datetime64(str(tdf['year']), 'D') + np.timedelta64(tdf['start_day'] - 1, 'D')
+  seconds = (times - t0.astype('datetime64[s]')) // np.timedelta64(1, 's')
+  # Time steps are 3600/n seconds, which need not be whole seconds, so count
+  # them within each hour. A time less than a second before the start of a
+  # time step (as its start written to whole seconds) is in that time step.
+  return (seconds // 3600) * n + ((seconds % 3600 + 1) * n - 1) // 3600
+
+# Read a csv file of measured data, as written by mkcalcsv.py (header line
+# "Time,sensor,...", then "YYYY-MM-DD HH:MM:SS,value,...").
+# Returns an array of times (datetime64), a list of column names and an
+# array of (times, columns) values.
+def read_csv(filename):
+  handle = open(filename, 'r')
+  names = handle.readline().strip().split(',')[1:]
+  lines = [line.strip().split(',') for line in handle if line.strip() != '']
+  handle.close()
+  times = np.array([line[0].replace(' ', 'T') for line in lines], dtype='datetime64[s]')
+  values = np.array([line[1:] for line in lines], dtype=float).reshape(len(lines), len(names))
+  return times, names, values
+
+# Put measured values (one or more columns) at times (datetime64) onto the
+# time steps of a tdfa. Time steps before the first measured day are filled
+# with the values at the same time of day on the first measured day (e.g. for
+# start up days), and those after the last measured day likewise from the
+# last day.
+# Returns an array of (time steps, columns).
+# Raises ValueError if there are time steps with no value within the
+# measured period, or no values in the tdfa period.
+def on_grid(tdf, times, values):
+  values = np.asarray(values, dtype=float)
+  if values.ndim == 1:
+    values = values[:, np.newaxis]
+  nday = 24 * tdf['nsteps']
+  nrows = len(get_times(tdf))
+  rows = get_rows(tdf, times)
+  inside = (rows >= 0) & (rows < nrows)
+  if not np.any(inside):
+    raise ValueError('no measured data in tdfa period')
+  grid = np.full((nrows, values.shape[1]), np.nan)
+  grid[rows[inside]] = values[inside]
+  r0 = rows[inside].min()
+  r1 = rows[inside].max()
+  if np.isnan(grid[r0:r1+1]).any():
+    raise ValueError('measured data has missing time steps')
+  ind = np.arange(nrows)
+  src = np.where(ind < r0, r0 + (ind - r0) % nday, np.where(ind > r1, r1 - (r1 - ind) % nday, ind))
+  src = np.minimum(np.maximum(src, r0), r1)
+  return grid[src]
+
+# Add an item with values (time steps, fields) to a tdfa, or replace the
+# values of the item with the same tag.
+# Returns the index (from 0) of the first column of the item.
+def set_item(tdf, item, values):
+  values = np.asarray(values, dtype=float).reshape(tdf['data'].shape[0], item['nfields'])
+  col = 0
+  for i, old in enumerate(tdf['items']):
+    if old['tag'] == item['tag']:
+      tdf['items'][i] = item
+      tdf['data'] = np.column_stack([tdf['data'][:, :col], values, tdf['data'][:, col+old['nfields']:]])
+      return col
+    col += old['nfields']
+  tdf['items'].append(item)
+  if tdf['pointers']:
+    tdf['pointers'].append(tdf['pointers'][-1] + 1)
+  else:
+    tdf['pointers'].append(5)
+  tdf['data'] = np.column_stack([tdf['data'], values])
+  return col
+
+# Add days to the start of a tdfa, filled with the data of the first day
+# (e.g. for start up days).
+def pad_start(tdf, days):
+  nday = 24 * tdf['nsteps']
+  tdf['data'] = np.concatenate([np.tile(tdf['data'][:nday], (days, 1)), tdf['data']])
+  tdf['start_day'] -= days
+
+# Change the number of time steps per hour of a tdfa. Going to more time
+# steps repeats values, and going to fewer averages them.
+# Raises ValueError if one number of time steps is not a multiple of the
+# other.
+def resample(tdf, nsteps):
+  old = tdf['nsteps']
+  if nsteps % old == 0:
+    tdf['data'] = np.repeat(tdf['data'], nsteps // old, axis=0)
+  elif old % nsteps == 0:
+    ncols = tdf['data'].shape[1]
+    tdf['data'] = tdf['data'].reshape(-1, old // nsteps, ncols).mean(axis=1)
+  else:
+    raise ValueError('cannot resample ' + str(old) + ' to ' + str(nsteps) + ' time steps per hour')
+  tdf['nsteps'] = nsteps
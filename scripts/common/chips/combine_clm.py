@@ -0,0 +1,101 @@
+# Python file to combine measured climate data for an estate with the
+# estate's TMY climate, giving the ESP-r binary climate file [estate].clm.
+
+# Command line arguments:
+# 1: estate, e.g. "NUIG"
+# 2: start date "DD-MM-YYYY"
+# 3: end date "DD-MM-YYYY"
+
+# Which columns are measured is taken from [estate].clmvar_template, kept with
+# this script: as for mkespclm.py, its 6 lines are the sensors for dry bulb
+# temperature, diffuse solar, direct solar, wind speed, wind direction and
+# relative humidity, with 0 for any not measured. Measured columns are read
+# from [estate].clm.a (made by mkespclm.py) in the current directory, and
+# everything else comes from the TMY base. Adding an estate only needs a
+# template and a TMY base.
+
+# The TMY base is [estate]_TMY.clm, if it is kept with this script. Files kept
+# with this script are never written. For estates with only
+# [estate]_TMY.epw or [estate]_TMY.clm.a, the base is made from the newer of
+# these into cache/tmy at the top of the repository (next to the H2G store of
+# h2gstore.py), once, and kept there for later jobs; it is made again if the
+# source is newer. The result is a copy of the TMY base in which only the
+# days of the simulation period are rewritten, in place through a memory map
+# (see espclm.py).
+
+import os
+import sys
+import shutil
+from datetime import datetime
+import espclm
+
+scriptdir = os.path.dirname(os.path.abspath(__file__))
+basedir = os.path.join(scriptdir, "..", "..", "..", "cache", "tmy")
+
+# Get the binary TMY base for an estate, making it if needed.
+# Returns the file name.
+def get_base(estate):
+  basefile = os.path.join(scriptdir, estate + "_TMY.clm")
+  if os.path.isfile(basefile) and os.path.getsize(basefile) > 0:
+    return basefile
+  basefile = os.path.join(basedir, estate + "_TMY.clm")
+  sources = []
+  for ext, reader in ((".epw", espclm.read_epw), (".clm.a", espclm.read_ascii)):
+    srcfile = os.path.join(scriptdir, estate + "_TMY" + ext)
+    if os.path.isfile(srcfile):
+      sources.append((os.path.getmtime(srcfile), srcfile, reader))
+  if sources:
+    srctime, srcfile, reader = max(sources, key=lambda source: source[0])
+    if not os.path.isfile(basefile) or os.path.getsize(basefile) == 0 or os.path.getmtime(basefile) < srctime:
+      print("Making TMY base " + basefile + " from " + srcfile)
+      # Write to a temporary file first, as other jobs may be reading the base.
+      os.makedirs(basedir, exist_ok=True)
+      tmpfile = basefile + "." + str(os.getpid())
+      espclm.write(tmpfile, reader(srcfile))
+      os.replace(tmpfile, basefile)
+  if not os.path.isfile(basefile) or os.path.getsize(basefile) == 0:
+    raise OSError("no TMY climate for " + estate)
+  return basefile
+
+# Get the columns measured for an estate from its clmvar template.
+# Returns a list of column numbers.
+def get_columns(estate):
+  handle = open(os.path.join(scriptdir, estate + ".clmvar_template"), "r")
+  lines = [line.strip() for line in handle]
+  handle.close()
+  if len(lines) != 6:
+    raise ValueError("number of lines in " + estate + ".clmvar_template is not 6")
+  return [i + 1 for i, line in enumerate(lines) if line != "0"]
+
+# Get the julian day of a date "DD-MM-YYYY", as mkespclm.py counts them.
+def get_day(date):
+  d = datetime.strptime(date, '%d-%m-%Y')
+  return min((d - datetime(d.year, 1, 1)).days + 1, 365)
+
+if len(sys.argv) != 4:
+  print("Usage: python3 combine_clm.py estate DD-MM-YYYY DD-MM-YYYY")
+  sys.exit(1)
+estate = sys.argv[1]
+
+try:
+  columns = get_columns(estate)
+  basefile = get_base(estate)
+  first_day = get_day(sys.argv[2])
+  last_day = get_day(sys.argv[3])
+  meas = espclm.read(estate + ".clm.a")
+except (OSError, ValueError) as e:
+  print("ERROR: " + str(e))
+  sys.exit(1)
+
+# Copy the base, and rewrite the simulation period.
+newclmfile = estate + ".clm"
+shutil.copyfile(basefile, newclmfile)
+comb = espclm.read_binary(newclmfile, 'r+')
+comb['year'] = meas['year']
+if first_day <= last_day:
+  espclm.splice(comb, meas, columns, first_day, last_day)
+else:
+  # Period over the end of the year.
+  espclm.splice(comb, meas, columns, first_day, 365)
+  espclm.splice(comb, meas, columns, 1, last_day)
+comb.flush()
@@ -0,0 +1,169 @@
+# Python module to read and write ESP-r climate files, so that climate files
+# can be made without ASCII intermediates or running clm -act asci2bin.
+
+# Example usage:
+#   import espclm
+#   base = espclm.read("NUIG_TMY.clm")      # binary, memory mapped
+#   meas = espclm.read("NUIG.clm.a")        # ASCII
+#   comb = base.copy()
+#   espclm.splice(comb, meas, [1, 4, 6])    # measured columns onto the base
+#   espclm.write("NUIG.clm", comb)
+# or from the command line:
+#   python3 espclm.py epw2bin NUIG_TMY.epw NUIG_TMY.clm
+#   python3 espclm.py asci2bin NUIG_TMY.clm.a NUIG_TMY.clm
+
+# A climate file is held as a NumPy structured array of dtype clm_dtype (see
+# below), which is also the layout of the binary file. Fields are:
+# data      - (365 days, 24 hours, 10 columns) integers; columns 1-7 are, as
+#             in files written by ESP-r, dry bulb temperature (tenths deg C),
+#             diffuse horizontal solar (W/m**2), direct normal solar (W/m**2),
+#             wind speed (tenths m/s), wind direction (deg clockwise from
+#             north), relative humidity (percent), atmospheric pressure (Pa)
+# year      - year
+# location  - climate location (30 characters)
+# latitude  - latitude
+# longitude - longitude difference from the time zone meridian
+# columns   - column of each of the 10 ESP-r metrics, 0 if not present
+# version   - 2, as in "*CLIMATE 2"
+
+# The binary file has 369 records of 960 bytes, one for each day and then one
+# each for the year, the location, the columns and the version, padded with
+# zeros. Integers and reals are 4 byte little endian.
+
+import sys
+import numpy as np
+
+clm_dtype = np.dtype([
+  ('data', '<i4', (365, 24, 10)),
+  ('year', '<i4'), ('pad366', 'V956'),
+  ('location', 'S30'), ('latitude', '<f4'), ('longitude', '<f4'), ('pad367', 'V922'),
+  ('columns', '<i4', (10,)), ('pad368', 'V920'),
+  ('version', '<i4'), ('pad369', 'V956')])
+
+default_columns = [1, 2, 3, 0, 4, 5, 6, 0, 0, 7]
+
+# Make an empty climate file.
+# Returns a climate array with all data 0.
+def new(year=0, location="unknown", latitude=0.0, longitude=0.0, columns=default_columns):
+  clm = np.zeros((), dtype=clm_dtype)
+  clm['year'] = year
+  clm['location'] = location.ljust(30)[:30].encode()
+  clm['latitude'] = latitude
+  clm['longitude'] = longitude
+  clm['columns'] = columns
+  clm['version'] = 2
+  return clm
+
+# Read a climate file, binary or ASCII.
+def read(filename, mode='r'):
+  handle = open(filename, "rb")
+  magic = handle.read(8)
+  handle.close()
+  if magic == b"*CLIMATE":
+    return read_ascii(filename)
+  return read_binary(filename, mode)
+
+# Memory map a binary climate file. mode is as for numpy.memmap; use 'r+' to
+# change the file in place.
+# Returns a climate array.
+def read_binary(filename, mode='r'):
+  return np.memmap(filename, dtype=clm_dtype, mode=mode, shape=(1,)).reshape(())
+
+# Read an ASCII climate file, as written by ESP-r or mkespclm.py.
+# Returns a climate array.
+# Raises ValueError if the file is not a climate file.
+def read_ascii(filename):
+  handle = open(filename, "r")
+  lines = handle.read().splitlines()
+  handle.close()
+  if not lines or not lines[0].startswith("*CLIMATE"):
+    raise ValueError(filename + " is not an ESP-r climate file")
+
+  # Header lines are location; year, latitude, longitude; columns; period.
+  header = []
+  i = 1
+  while len(header) < 4 and i < len(lines):
+    line = lines[i].split('#')[0].strip()
+    i += 1
+    if line != "":
+      header.append(line)
+  if len(header) < 4:
+    raise ValueError(filename + " has an incomplete header")
+  year, latitude, longitude = header[1].split(',')[:3]
+  columns = [int(s) for s in header[2].split(',')[:10]]
+  first_day, last_day = [int(s) for s in header[3].split(',')[:2]]
+  clm = new(int(year), header[0], float(latitude), float(longitude), columns)
+
+  # Data lines are one per hour, with day lines starting with "*" between.
+  datalines = [line for line in lines[i:] if line.strip() != "" and not line.startswith("*")]
+  ncol = max(columns)
+  values = np.loadtxt(datalines, delimiter=',', dtype=int, ndmin=2)[:, :ncol]
+  if values.shape[0] != (last_day - first_day + 1) * 24:
+    raise ValueError(filename + " does not have 24 hours for each day from " + str(first_day) + " to " + str(last_day))
+  clm['data'][first_day-1:last_day, :, :ncol] = values.reshape(-1, 24, ncol)
+  return clm
+
+# Write a climate array to a binary climate file.
+def write(filename, clm):
+  handle = open(filename, "wb")
+  handle.write(np.asarray(clm, dtype=clm_dtype).tobytes())
+  handle.close()
+
+# Round half away from zero, as ESP-r does.
+def nint(x):
+  return (np.sign(x) * np.floor(np.abs(x) + 0.5)).astype(int)
+
+# Read an EnergyPlus weather file.
+# The longitude difference is the longitude less that of the time zone
+# meridian. 29 February is dropped from leap years.
+# Returns a climate array.
+def read_epw(filename):
+  handle = open(filename, "r")
+  lines = handle.read().splitlines()
+  handle.close()
+  loc = lines[0].split(',')
+  if loc[0] != "LOCATION":
+    raise ValueError(filename + " is not an EnergyPlus weather file")
+  latitude = float(loc[6])
+  longitude = float(loc[7]) - 15 * float(loc[8])
+
+  # Data lines follow the header, which ends with DATA PERIODS.
+  for i, line in enumerate(lines):
+    if line.startswith("DATA PERIODS"):
+      break
+  rows = [line.split(',') for line in lines[i+1:] if line.strip() != ""]
+  rows = [row for row in rows if not (row[1] == "2" and row[2] == "29")]
+  if len(rows) != 8760:
+    raise ValueError(filename + " does not have 8760 hours")
+  epw = np.array([row[6:22] for row in rows], dtype=float)
+
+  clm = new(int(rows[0][0]), ' '.join(loc[1:4]), latitude, longitude)
+  data = clm['data'].reshape(8760, 10)
+  data[:, 0] = nint(epw[:, 0] * 10)   # dry bulb
+  data[:, 1] = nint(epw[:, 9])        # diffuse horizontal
+  data[:, 2] = nint(epw[:, 8])        # direct normal
+  data[:, 3] = nint(epw[:, 15] * 10)  # wind speed
+  data[:, 4] = nint(epw[:, 14])       # wind direction
+  data[:, 5] = nint(epw[:, 2])        # relative humidity
+  data[:, 6] = nint(epw[:, 3])        # atmospheric pressure
+  return clm
+
+# Copy columns (numbered from 1, as in the file) of climate array clm onto
+# climate array base, for days first_day to last_day (julian days).
+def splice(base, clm, columns, first_day=1, last_day=365):
+  cols = [c - 1 for c in columns]
+  base['data'][first_day-1:last_day, :, cols] = clm['data'][first_day-1:last_day, :, cols]
+
+if __name__ == "__main__":
+  if len(sys.argv) != 4 or sys.argv[1] not in ("epw2bin", "asci2bin"):
+    print("Usage: python3 espclm.py epw2bin|asci2bin input_file output_file")
+    sys.exit(1)
+  try:
+    if sys.argv[1] == "epw2bin":
+      clm = read_epw(sys.argv[2])
+    else:
+      clm = read_ascii(sys.argv[2])
+  except (OSError, ValueError, IndexError) as e:
+    print("ERROR: could not read " + sys.argv[2] + ": " + str(e))
+    sys.exit(1)
+  write(sys.argv[3], clm)
@@ -1,13 +1,16 @@
 #! /bin/bash
 
-path="$(dirname "$0")"
-cd "$path" || exit 1
+path="$(cd "$(dirname "$0")" && pwd)"
 
 # Command line arguments:
-# 1: estate "Challenger" or "NUIG"
+# 1: estate, e.g. "NUIG", with a [estate].calvar_template kept with this
+#    script
 # 2: start date "DD-MM-YYYY"
 # 3: end date "DD-MM-YYYY"
 # 4: number time steps per hour
+# 5: [optional] working directory, where all files for this request are
+#    written, including the session cookie and the resulting
+#    measured_data.csv (default: the directory of this script)
 
 estate="$1"
 dateS="$2"
@@ -19,24 +22,32 @@ dfy="${dateF:6:4}"
 dfm="${dateF:3:2}"
 dfd="${dateF:0:2}"
 nsteps="$4"
+workdir="${5:-$path}"
 
-if [ "$estate" == "Challenger" ]; then
+mkdir -p "$workdir" || exit 1
+cd "$workdir" || exit 1
+
+# Sensors are those in the estate's calvar template (see createTdfa.py).
+if [ ! -f "$path/${estate}.calvar_template" ]; then
     echo "not currently supported"
     exit 1
-elif [ "$estate" == "NUIG" ]; then
-    echo "NUIG_Network7_No_01_AHU103_Ctrls_01_Mixed_Air_Temp__DATALOG1,${dsy}-${dsm}-${dsd}T00:00:00,${dfy}-${dfm}-${dfd}T23:59:59" > var2get
 fi
+cut -d, -f1 "$path/${estate}.calvar_template" | grep -v -x '' | sed "s/\$/,${dsy}-${dsm}-${dsd}T00:00:00,${dfy}-${dfm}-${dfd}T23:59:59/" > var2get
 
+# Get data, using the local store (see h2gstore.py).
 err=false
-./chips -g
-python3 mkcalcsv.py "$nsteps"
-if [ $? -ne 0 ]; then 
+python3 "$path/h2gstore.py"
+if [ $? -ne 0 ]; then
     err=true
-    echo "Error: No data available"
+    echo "Error: Failed to get data"
+else
+    python3 "$path/mkcalcsv.py" "$nsteps"
+    if [ $? -ne 0 ]; then 
+        err=true
+        echo "Error: No data available"
+    fi
 fi
 
-if [ "$estate" == "NUIG" ]; then
-    rm NUIG_Network7_*
-fi
+rm -f $(sed 's/,.*/_from_*/' var2get)
 
 if $err; then exit 1; fi
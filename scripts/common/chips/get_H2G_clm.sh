@@ -1,12 +1,15 @@
 #! /bin/bash
 
-path="$(dirname $0)"
-cd $path
+path="$(cd "$(dirname "$0")" && pwd)"
 
 # Command line arguments:
-# 1: estate "Challenger" or "NUIG"
+# 1: estate, e.g. "Challenger" or "NUIG", with a [estate].clmvar_template
+#    and TMY climate kept with this script
 # 2: start date "DD-MM-YYYY"
 # 3: end date "DD-MM-YYYY"
+# 4: [optional] working directory, where all files for this request are
+#    written, including the session cookie and the resulting climate file
+#    (default: the directory of this script)
 
 estate="$1"
 dateS="$2"
@@ -17,42 +20,37 @@ dateF="$3"
 dfy="${dateF:6:4}"
 dfm="${dateF:3:2}"
 dfd="${dateF:0:2}"
+workdir="${4:-$path}"
 
-if [ "$estate" == "Challenger" ]; then
-    echo "CHA_METEO_RAY-GLOB,${dsy}-${dsm}-${dsd}T00:00:00,${dfy}-${dfm}-${dfd}T23:59:59
-CHA_METEO_Temperature,${dsy}-${dsm}-${dsd}T00:00:00,${dfy}-${dfm}-${dfd}T23:59:59
-CHA_METEO_RAY-DIR,${dsy}-${dsm}-${dsd}T00:00:00,${dfy}-${dfm}-${dfd}T23:59:59
-CHA_METEO_Humidity,${dsy}-${dsm}-${dsd}T00:00:00,${dfy}-${dfm}-${dfd}T23:59:59" > var2get
-    cp Challenger.clmvar_template Challenger.clmvar
-elif [ "$estate" == "NUIG" ]; then
-    echo "NUIG_AspectGroup_Weather_Current_Wind_Speed,${dsy}-${dsm}-${dsd}T00:00:00,${dfy}-${dfm}-${dfd}T23:59:59
-NUIG_AspectGroup_Weather_Current_Humidity,${dsy}-${dsm}-${dsd}T00:00:00,${dfy}-${dfm}-${dfd}T23:59:59
-NUIG_AspectGroup_Weather_Current_Temperature,${dsy}-${dsm}-${dsd}T00:00:00,${dfy}-${dfm}-${dfd}T23:59:59" > var2get
-    cp NUIG.clmvar_template NUIG.clmvar
+mkdir -p "$workdir" || exit 1
+cd "$workdir" || exit 1
+
+# Sensors are those in the estate's clmvar template (see combine_clm.py).
+if [ ! -f "$path/${estate}.clmvar_template" ]; then
+    echo "Error: No climate sensors for estate $estate"
+    exit 1
 fi
+grep -v -x -e '0' -e '' "$path/${estate}.clmvar_template" | sed "s/\$/,${dsy}-${dsm}-${dsd}T00:00:00,${dfy}-${dfm}-${dfd}T23:59:59/" > var2get
+cp "$path/${estate}.clmvar_template" "${estate}.clmvar"
 
+# Get data, using the local store (see h2gstore.py).
 err=false
-./chips -g
-python3 mkespclm.py
-if [ $? -ne 0 ]; then 
+python3 "$path/h2gstore.py"
+if [ $? -ne 0 ]; then
     err=true
-    echo "Error: No data available"
+    echo "Error: Failed to get data"
+else
+    python3 "$path/mkespclm.py"
+    if [ $? -ne 0 ]; then 
+        err=true
+        echo "Error: No data available"
+    fi
 fi
 
-if [ "$estate" == "Challenger" ]; then
-    if ! $err; then
-        if [ -f Challenger.clm ]; then rm Challenger.clm; fi
-        python3 combine_clm_Challenger.py
-        clm -file Challenger.clm -act asci2bin silent Challenger_comb.clm.a
-    fi
-    rm Challenger.clm.a Challenger.clmvar CHA_METEO_*
-elif [ "$estate" == "NUIG" ]; then
-    if ! $err; then
-        if [ -f NUIG.clm ]; then rm NUIG.clm; fi
-        python3 combine_clm_NUIG.py
-        clm -file NUIG.clm -act asci2bin silent NUIG_comb.clm.a
-    fi
-    rm NUIG.clm.a NUIG.clmvar NUIG_AspectGroup_Weather_Current_*
+if ! $err; then
+    python3 "$path/combine_clm.py" "$estate" "$dateS" "$dateF"
+    if [ $? -ne 0 ]; then err=true; fi
 fi
+rm -f "${estate}.clm.a" "${estate}.clmvar" $(sed 's/,.*/_from_*/' var2get)
 
 if $err; then exit 1; fi
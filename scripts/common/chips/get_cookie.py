@@ -1,9 +1,11 @@
 import datetime
 import os
-import subprocess
+import h2g
 
-# 1. If session_cookie is more than 1 hour old then get another cookie using ./chips script
+# 1. If session_cookie is more than 1 hour old then get another cookie (see h2g.py)
 # 2. Read the file session_cookie and return the cookie inside to calling function
+# session_cookie is in the current directory, so each job can keep its own.
+# New code should use h2g.connect instead, which renews the cookie as needed.
 
 def get_cookie():
   now = datetime.datetime.now()
@@ -11,8 +13,8 @@ def get_cookie():
   cookie_age = now - got_cookie_at
   cookie_age = cookie_age.total_seconds()
   tmpstr = str(cookie_age)
-  if(cookie_age > 3500): # if is one hour old (with 100s factor of safety)
-    subprocess.call(['./chips','-d'])
+  if(cookie_age > h2g.cookie_age_limit): # if is one hour old (with 100s factor of safety)
+    h2g.connect()
 
   # get cookie
   handle = open('session_cookie','r')
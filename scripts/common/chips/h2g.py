@@ -0,0 +1,190 @@
+# Python client for the Hit2Gap portal timeseries API.
+# This does what chips does with curl, but keeps one connection open for all
+# requests, so there is only one TLS handshake per connection rather than one
+# per request, and downloads series concurrently.
+
+# Example usage:
+#   import h2g
+#   conn = h2g.connect()
+#   failed = h2g.get_all(conn, [(variable_name, start_time, end_time), ...])
+# which writes variable_name_from_start_time_to_end_time.json for each series
+# in the current directory, as ./chips -g does.
+
+# A session is started with the SSL certificate (as ./chips does), and the
+# session cookie is kept in the connection and written to file session_cookie
+# in the current directory. The cookie is renewed in this process when it is
+# more than cookie_age_limit seconds old, or if the portal rejects it.
+
+# Series are requested in windows of window_days days, which are downloaded
+# concurrently (compressed, if the portal supports it) and streamed to
+# temporary files before being joined, so large series are never held in
+# memory as one response.
+
+import os
+import json
+import time
+import threading
+from glob import glob
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import urllib3
+
+scriptdir = os.path.dirname(os.path.abspath(__file__))
+
+# Defaults, as in chips.
+default_cert = os.path.join(scriptdir, "uos_bps.keycrt.pem")
+default_host = "https://h2g-platform-core.nobatek.com/api/v0"
+auth_path = "/auth/cert"
+timeseries = "/timeseries"
+cookie_age_limit = 3500
+window_days = 7
+default_workers = 8
+
+# The portal certificate is not verified (curl -k in chips).
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# Create a connection to the portal.
+# Returns a dictionary holding the connection state:
+# session     - requests session, which keeps connections alive
+# host        - portal API url
+# cert        - certificate file
+# cookie_file - file the session cookie is written to
+# cookie_time - time the session cookie was obtained
+# lock        - lock held while the session cookie is renewed
+def connect(cert=default_cert, host=default_host, workers=default_workers, cookie_file="session_cookie"):
+  session = requests.Session()
+  adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+  session.mount("https://", adapter)
+  session.verify = False
+  session.headers["Accept-Encoding"] = "gzip"
+  conn = {'session': session, 'host': host, 'cert': cert, 'cookie_file': cookie_file, 'cookie_time': None, 'lock': threading.Lock()}
+  login(conn)
+  return conn
+
+# Start a session with the SSL certificate and get a session cookie.
+# Raises an error if the portal does not return 200 OK.
+def login(conn):
+  with conn['lock']:
+    r = conn['session'].post(conn['host'] + auth_path, cert=conn['cert'])
+    if r.status_code != 200:
+      raise RuntimeError("connection not established, portal returned " + str(r.status_code) + ": " + r.text)
+    conn['cookie_time'] = time.time()
+    cookie = conn['session'].cookies.get('session')
+    if cookie is not None and conn['cookie_file'] is not None:
+      handle = open(conn['cookie_file'], "w")
+      handle.write(cookie + "\n")
+      handle.close()
+
+# Make a request to the portal, renewing the session cookie if it is too old
+# or is rejected. Extra arguments are passed to requests.
+# Returns the response.
+def request(conn, method, path, **kwargs):
+  if time.time() - conn['cookie_time'] > cookie_age_limit:
+    login(conn)
+  cookie_time = conn['cookie_time']
+  r = conn['session'].request(method, conn['host'] + path, **kwargs)
+  if r.status_code in (401, 403):
+    r.close()
+    # Another thread may have renewed the cookie already.
+    if conn['cookie_time'] == cookie_time:
+      login(conn)
+    r = conn['session'].request(method, conn['host'] + path, **kwargs)
+  return r
+
+# Split the period from start_time to end_time (format YYYY-MM-DDTHH:MM:SS)
+# into windows of window_days days.
+# Returns a list of (start time, end time) tuples.
+def get_windows(start_time, end_time):
+  ts = datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S')
+  tf = datetime.strptime(end_time, '%Y-%m-%dT%H:%M:%S')
+  windows = []
+  while ts <= tf:
+    te = min(ts + timedelta(days=window_days) - timedelta(seconds=1), tf)
+    windows.append((ts.strftime('%Y-%m-%dT%H:%M:%S'), te.strftime('%Y-%m-%dT%H:%M:%S')))
+    ts = te + timedelta(seconds=1)
+  return windows
+
+# Download one window of a series to file partfile. Further pages given by a
+# "next" link in the response headers are written to partfile.1, partfile.2,
+# etc.
+# Returns the list of files written.
+def get_window(conn, varname, start_time, end_time, partfile):
+  path = timeseries + "/" + varname
+  params = {'start_time': start_time, 'end_time': end_time}
+  pagefiles = []
+  while True:
+    r = request(conn, "GET", path, params=params, stream=True)
+    if r.status_code != 200:
+      r.close()
+      raise RuntimeError("portal returned " + str(r.status_code) + " for " + start_time + " to " + end_time)
+    if pagefiles:
+      pagefile = partfile + "." + str(len(pagefiles))
+    else:
+      pagefile = partfile
+    handle = open(pagefile, "wb")
+    for chunk in r.iter_content(chunk_size=65536):
+      handle.write(chunk)
+    handle.close()
+    pagefiles.append(pagefile)
+    r.close()
+    if "next" not in r.links:
+      break
+    path = r.links["next"]["url"]
+    if path.startswith(conn['host']): path = path[len(conn['host']):]
+    params = None
+  return pagefiles
+
+# Join the pages of a series, given as futures returning lists of page files,
+# into one file, as returned by the portal for a single request.
+def join_pages(filename, futures):
+  handle = open(filename, "w")
+  try:
+    handle.write('{"data": [')
+    first = True
+    for future in futures:
+      for pagefile in future.result():
+        with open(pagefile) as uglyjson:
+          items = json.load(uglyjson)["data"]
+        for item in items:
+          if not first: handle.write(", ")
+          handle.write(json.dumps(item))
+          first = False
+    handle.write("]}\n")
+  finally:
+    handle.close()
+
+# Download the series listed in var_list (a list of (variable_name,
+# start_time, end_time) tuples) concurrently, and write each to file
+# variable_name_from_start_time_to_end_time.json in directory outdir.
+# Returns a list of the variable names that could not be downloaded.
+def get_all(conn, var_list, outdir=".", workers=default_workers):
+  pool = ThreadPoolExecutor(max_workers=workers)
+  series = []
+  for varname, start_time, end_time in var_list:
+    filename = os.path.join(outdir, varname + "_from_" + start_time + "_to_" + end_time + ".json")
+    futures = []
+    for i, (ws, we) in enumerate(get_windows(start_time, end_time)):
+      futures.append(pool.submit(get_window, conn, varname, ws, we, filename + ".part" + str(i)))
+    series.append((varname, filename, futures))
+
+  failed = []
+  for varname, filename, futures in series:
+    try:
+      join_pages(filename, futures)
+    except (OSError, ValueError, KeyError, TypeError, RuntimeError, requests.RequestException) as e:
+      print("WARNING: failed to get " + varname + ": " + str(e))
+      failed.append(varname)
+      if os.path.isfile(filename): os.remove(filename)
+  pool.shutdown()
+
+  # Remove pages.
+  for varname, filename, futures in series:
+    for pagefile in glob(filename + ".part*"):
+      os.remove(pagefile)
+  return failed
+
+# Upload data to a series. payload is the json to send, as in data2upload.
+# Returns the response.
+def patch_series(conn, varname, payload):
+  return request(conn, "PATCH", timeseries + "/" + varname, json=payload)
@@ -0,0 +1,160 @@
+# Python module to read the json files of series data written by chips,
+# h2g.py and h2gstore.py ({"data": [{"timestamp": ..., "value": ...}, ...]})
+# without loading a whole file into memory.
+
+# Example usage:
+#   import h2gjson
+#   for item in h2gjson.iter_items(filename): ...
+# or, to average samples onto a grid of time steps:
+#   first, W, N = h2gjson.bin_series([filename, ...], np.timedelta64(900,'s'))
+
+# Files are read in chunks of chunk_size characters, and the items of the data
+# array are decoded one at a time as the chunks arrive. Samples are converted
+# to arrays and binned in batches of batch_size items, so memory use is
+# bounded by the binned grid and one batch, not by the size of the files.
+
+# Time steps are counted from 1970-01-01T00:00:00, so they start at midnight
+# for any time step that divides a day. Timestamps are used as given, i.e.
+# local time, ignoring the UTC offset.
+
+import json
+import numpy as np
+
+chunk_size = 1048576
+batch_size = 65536
+epoch = np.datetime64('1970-01-01T00:00:00', 's')
+
+# Read the items of the array under key (by default "data") of the top level
+# object in a json file, one at a time.
+# Yields each item.
+# Raises json.JSONDecodeError if the file is not valid json.
+def iter_items(filename, key="data"):
+  decoder = json.JSONDecoder()
+  handle = open(filename, "r")
+  buf = ""
+  pos = 0
+  eof = False
+
+  # Read the next chunk, dropping what has been decoded.
+  def more():
+    nonlocal buf, pos, eof
+    chunk = handle.read(chunk_size)
+    if chunk == "":
+      eof = True
+    buf = buf[pos:] + chunk
+    pos = 0
+
+  # Skip white space.
+  # Returns the next character, or "" at the end of the file.
+  def skip():
+    nonlocal pos
+    while True:
+      while pos < len(buf) and buf[pos] in " \t\r\n":
+        pos += 1
+      if pos < len(buf) or eof:
+        return buf[pos:pos+1]
+      more()
+
+  # Decode the next value. A value that ends at the end of the chunk may be
+  # incomplete (e.g. a number), so is decoded again with the next chunk.
+  def value():
+    nonlocal pos
+    skip()
+    while True:
+      try:
+        obj, end = decoder.raw_decode(buf, pos)
+        if end < len(buf) or eof:
+          pos = end
+          return obj
+      except json.JSONDecodeError:
+        if eof: raise
+      more()
+
+  # Check for the next character, and skip it.
+  # Returns the character.
+  def expect(chars):
+    nonlocal pos
+    c = skip()
+    if c == "" or c not in chars:
+      raise json.JSONDecodeError("Expecting one of " + repr(chars), buf, pos)
+    pos += 1
+    return c
+
+  try:
+    expect("{")
+    if skip() == "}":
+      return
+    while True:
+      name = value()
+      expect(":")
+      if name != key:
+        value()
+      else:
+        expect("[")
+        if skip() == "]":
+          pos += 1
+        else:
+          while True:
+            yield value()
+            if expect(",]") == "]":
+              break
+      if expect(",}") == "}":
+        break
+  finally:
+    handle.close()
+
+# Read the samples in a json file in batches.
+# Yields arrays of times (datetime64[s]) and values (float) for each batch.
+# Raises json.JSONDecodeError if the file is not valid json, and KeyError,
+# TypeError or ValueError if an item has no valid timestamp or value.
+def iter_batches(filename, key="data"):
+  times = []
+  values = []
+  for item in iter_items(filename, key):
+    times.append(item['timestamp'][:19])
+    values.append(item['value'])
+    if len(times) == batch_size:
+      yield np.array(times, dtype='datetime64[s]'), np.array(values, dtype=float)
+      times = []
+      values = []
+  if times:
+    yield np.array(times, dtype='datetime64[s]'), np.array(values, dtype=float)
+
+# Sum the samples in json files into time steps of length step
+# (timedelta64), as they are read.
+# Returns the start time of the first time step with samples, and arrays of
+# the sum (W) and number (N) of samples in each time step from there to the
+# last time step with samples; or None if there are no samples.
+# Raises the errors of iter_batches.
+def bin_series(filenames, step):
+  step = step.astype('timedelta64[s]')
+  row0 = None
+  rowN = None
+  W = None
+  N = None
+  for filename in filenames:
+    for times, values in iter_batches(filename):
+      rows = (times - epoch) // step
+      lo = int(rows.min())
+      hi = int(rows.max())
+      if W is None:
+        row0 = lo
+        rowN = hi
+        W = np.zeros(hi - lo + 1)
+        N = np.zeros(hi - lo + 1)
+      if lo < row0:
+        W = np.concatenate([np.zeros(row0 - lo), W])
+        N = np.concatenate([np.zeros(row0 - lo), N])
+        row0 = lo
+      if hi - row0 >= len(W):
+        # Grow by at least double, as samples usually arrive in time order.
+        grow = max(hi - row0 + 1, 2 * len(W)) - len(W)
+        W = np.concatenate([W, np.zeros(grow)])
+        N = np.concatenate([N, np.zeros(grow)])
+      rowN = max(rowN, hi)
+      # Bin over the span of this batch only.
+      W[lo-row0:hi-row0+1] += np.bincount(rows - lo, weights=values, minlength=hi-lo+1)
+      N[lo-row0:hi-row0+1] += np.bincount(rows - lo, minlength=hi-lo+1)
+  if W is None:
+    return None
+  return epoch + row0 * step, W[:rowN-row0+1], N[:rowN-row0+1]
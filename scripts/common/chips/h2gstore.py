@@ -0,0 +1,195 @@
+# Python file to get data for the sensors listed in var2get, using a local
+# store of previously downloaded data so that only days not already held are
+# requested from the portal.
+# This is a drop in replacement for ./chips -g: it reads var2get (format
+# variable_name,start_time,end_time) and writes the same json files, named
+# variable_name_from_start_time_to_end_time.json, which mkespclm.py and
+# mkcalcsv.py read.
+
+# The store is kept with the other caches of the service (cache/h2gstore at
+# the top of the repository, next to the model and results caches of
+# main.py), with one file per sensor and day (h2gstore/[variable_name]/
+# YYYY-MM-DD.json). A day file holds the list of items (timestamp, value, ...)
+# returned by the portal with timestamps on that day, so only the requested
+# days are read. Day files are written to a temporary file and renamed into
+# place, so a day is held once and readers never see a partial file. Only
+# complete days (before today) that have data are stored, so today's data and
+# days missing on the portal are always requested.
+
+# Sensor files of the older store (store/[variable_name].jsonl next to this
+# script, one {"day": ..., "data": [...]} line per day, appended to, the last
+# line for a day winning) are split into day files, under a lock, the first
+# time the sensor is used, and then removed.
+
+# Days missing from the store are gathered into ranges of consecutive days,
+# which are all fetched concurrently over one connection (see h2g.py).
+
+# var2get, the json files and session_cookie are in the current directory,
+# so each job can use its own working directory. The store is shared.
+
+# Exits with status 1 if any request fails, in which case no json file is
+# written for that sensor.
+
+import os
+import json
+import sys
+import fcntl
+from datetime import *
+import h2g
+
+scriptdir = os.path.dirname(os.path.abspath(__file__))
+storedir = os.path.join(scriptdir, "..", "..", "..", "cache", "h2gstore")
+oldstoredir = os.path.join(scriptdir, "store")
+
+# Write a day of data to the store for a sensor. The file is replaced
+# atomically.
+def write_day(varname, day, data):
+  sensordir = os.path.join(storedir, varname)
+  os.makedirs(sensordir, exist_ok=True)
+  dayfile = os.path.join(sensordir, day + ".json")
+  tmpfile = dayfile + "." + str(os.getpid())
+  handle = open(tmpfile, "w")
+  json.dump(data, handle)
+  handle.close()
+  os.replace(tmpfile, dayfile)
+
+# Read a day held in the store for a sensor.
+# Returns the list of data items, or None if the day is not held.
+def read_day(varname, day):
+  try:
+    handle = open(os.path.join(storedir, varname, day + ".json"), "r")
+  except OSError:
+    return None
+  try:
+    data = json.load(handle)
+  except ValueError:
+    data = None
+  handle.close()
+  return data
+
+# Split the sensor file of the older store, if any, into day files. Days
+# already held as day files are kept.
+def convert_old_store(varname):
+  oldfile = os.path.join(oldstoredir, varname + ".jsonl")
+  if not os.path.isfile(oldfile):
+    return
+  handle = open(oldfile, "r")
+  fcntl.flock(handle, fcntl.LOCK_EX)
+  # Another job may have converted it while waiting for the lock.
+  if os.path.isfile(oldfile):
+    days = {}
+    for line in handle:
+      try:
+        entry = json.loads(line)
+        days[entry["day"]] = entry["data"]
+      except (ValueError, KeyError):
+        # Partly written line, ignore.
+        continue
+    for day in days:
+      if not os.path.isfile(os.path.join(storedir, varname, day + ".json")):
+        write_day(varname, day, days[day])
+    os.remove(oldfile)
+  handle.close()
+
+# Split a sorted list of dates into ranges of consecutive dates.
+# Returns a list of (first date, last date) tuples.
+def get_ranges(dates):
+  ranges = []
+  for d in dates:
+    if ranges and d - ranges[-1][1] == timedelta(days=1):
+      ranges[-1] = (ranges[-1][0], d)
+    else:
+      ranges.append((d, d))
+  return ranges
+
+if not os.path.isfile("var2get"):
+  print("WARNING: no var2get file found in this folder")
+  sys.exit(1)
+
+handle = open("var2get", "r")
+requests = []
+for line in handle:
+  line = line.strip()
+  if line == "": continue # skip blank lines
+  requests.append(line.split(','))
+handle.close()
+
+today = date.today()
+failed = []
+fetched = {}
+
+# Work out which days need to be fetched for each sensor.
+fetchlines = []
+stored = {}
+for varname, start_time, end_time in requests:
+  if varname not in stored:
+    convert_old_store(varname)
+    stored[varname] = {}
+  first = datetime.strptime(start_time[:10], '%Y-%m-%d').date()
+  last = datetime.strptime(end_time[:10], '%Y-%m-%d').date()
+  missing = []
+  d = first
+  while d <= last:
+    day = d.isoformat()
+    if d < today and day not in stored[varname]:
+      data = read_day(varname, day)
+      if data is not None:
+        stored[varname][day] = data
+    if d >= today or day not in stored[varname]:
+      missing.append(d)
+    d += timedelta(days=1)
+  print(varname + ": " + str((last - first).days + 1 - len(missing)) + " days in store, " + str(len(missing)) + " to fetch")
+  # Always fetch whole days, so that fetched days can be stored.
+  for rfirst, rlast in get_ranges(missing):
+    fetchlines.append((varname, rfirst.isoformat() + "T00:00:00", rlast.isoformat() + "T23:59:59"))
+
+# Fetch missing days.
+if fetchlines:
+  try:
+    conn = h2g.connect()
+    h2g.get_all(conn, fetchlines)
+  except Exception as e:
+    print("WARNING: could not connect to portal: " + str(e))
+
+  for varname, rstart, rend in fetchlines:
+    filename = varname + "_from_" + rstart + "_to_" + rend + ".json"
+    try:
+      with open(filename) as uglyjson:
+        j = json.load(uglyjson)
+      items = j["data"]
+    except (OSError, ValueError, KeyError, TypeError):
+      print("WARNING: failed to get data for " + varname + " from " + rstart + " to " + rend)
+      failed.append(varname)
+      continue
+    finally:
+      if os.path.isfile(filename): os.remove(filename)
+
+    # Split items by day.
+    days = {}
+    for item in items:
+      days.setdefault(item["timestamp"][:10], []).append(item)
+    fetched.setdefault(varname, {}).update(days)
+
+    # Store complete days.
+    for day in days:
+      if day < today.isoformat():
+        write_day(varname, day, days[day])
+
+# Write json files for the requested periods.
+for varname, start_time, end_time in requests:
+  if varname in failed:
+    continue
+  days = dict(stored[varname])
+  days.update(fetched.get(varname, {}))
+  items = []
+  for day in sorted(days):
+    for item in days[day]:
+      if start_time <= item["timestamp"][:19] <= end_time:
+        items.append(item)
+  filename = varname + "_from_" + start_time + "_to_" + end_time + ".json"
+  handle = open(filename, "w")
+  json.dump({"data": items}, handle)
+  handle.close()
+
+if failed:
+  sys.exit(1)
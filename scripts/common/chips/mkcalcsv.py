@@ -5,165 +5,108 @@
 # script reads json files names as given in var2get and makes a csv
 # file from the data in the json.
 
+# Samples are binned onto a grid of time steps, from the time step of the
+# first sample to the time step of the last sample (of any sensor), and
+# averaged per time step. Times are as given in the timestamps, i.e. local
+# time. Time steps with no samples are interpolated linearly from the nearest
+# time steps either side with samples, and those before the first or after the
+# last sample of a sensor take the value of that sample, if the missing data
+# spans no more than 3 hours; otherwise, the script fails. All sensors are handled together as
+# arrays of (sensors, time steps). Files are read as they stream, and only the
+# binned series are kept (see h2gjson.py).
+
 #################
 ### IMPORTANT ###
 #################
 # This script assumes that the following command has already been run
-# ./chips -g
+# ./chips -g (or python3 h2gstore.py)
 
 # 1 Command line argument = number of time steps per hour.
 import os
 import json
 import sys
-from datetime import *
-from subprocess import call
+import numpy as np
+import h2gjson
 
 i_nsteps=int(sys.argv[1])
+i_maxgap=3*i_nsteps # maximum interpolation span, in time steps
 
-var2getfilefound = False # error trap
-for file in os.listdir("."):
-  if file == "var2get":
-    var2getfilefound = True  # error trap
-    # W[parameter][hour] sum of data per hour
-    # N[parameter][hour] number of data items per hour
-    W = []
-    N = []
-
-    print("\n ...working on " + file + "\n")
-    handle = open(file,"r")
-    varind=0
-    varnames=[]
-    nhours=0
-    iyear=0
-    for line in handle:
-      line = line.strip()
-      if line == "": continue # skip blank lines
-      varname=line.split(',')[0]
-      varnames.append(varname)
-
-      # find data files that begin with this string
-      thisfilefound = False # error trap
-      for file1 in os.listdir("."):
-        if(file1.startswith(varname)):
-          thisfilefound = True
-          print("Reading " + file1)
-          with open(file1) as uglyjson:
-            try:
-              j = json.load(uglyjson)
-            except ValueError:
-              print ("WARNING: "+ file1 + " is not a valid json file")
-              sys.exit(1)         
-            W.append([])
-            N.append([])
-            startDay=-1
-            for items in j['data']:
-              tmpstr = items['timestamp']
-              val = items['value']
-              if ":" == tmpstr[-3:-2]:
-                tmpstr = tmpstr[:-3]+tmpstr[-2:] # remove last :
-                ts = datetime.strptime(tmpstr,'%Y-%m-%dT%H:%M:%S%z')
-                if iyear==0: iyear=ts.year
-                if startDay<0:
-                  startDay=int(ts.strftime('%j'))
-                day=int(ts.strftime('%j'))-startDay
-                iind=day*24*i_nsteps+ts.hour*i_nsteps+int(ts.minute/(60/i_nsteps))
-                try: 
-                  W[varind][iind] += val
-                  N[varind][iind] += 1
-                except IndexError:
-                  # In case of missing data, fill in gaps with 0s.
-                  # This will be interpolated later.
-                  while len(W[varind]) < iind:
-                    W[varind].append(0)
-                    N[varind].append(0)                  
-                  W[varind].append(val)
-                  N[varind].append(1)
-              else:
-                print ("WARNING: invalid data in file "+ file1)
-                sys.exit(1)
-            varind+=1
-      if(not thisfilefound): # error trap
-        print("WARNING: data file " + varname + "... not found") # error trap
-        sys.exit(1)
-
-    print(" \n ...finished with " + file + "\n")
-    handle.close()
-
-    # now begin writing csv file
-    newcsvfile = "measured_data.csv"
-    w_handle = open(newcsvfile,"w+")
-
-    w_handle.write(','.join(['Time']+varnames)+'\n')
-    dayOfYear=startDay-1
-    for row in range(len(W[0])):
-      if row%(24*i_nsteps)==0: 
-        dayOfYear+=1
-        hour=-1
-      if row%(i_nsteps)==0:
-        hour+=1
-        minute=0
-      else:
-        minute+=60/i_nsteps
-      day=dayOfYear-startDay
-      ts=datetime.strptime('{:d} {:d} {:d} {:d}'.format(iyear,dayOfYear,hour,int(minute)),'%Y %j %H %M')
-      tmpstr=ts.strftime('%Y-%m-%d %H:%M:%S')
-      for WW,NN in zip(W,N):
-        # If there's no value for this time row, interpolate.
-        # Find previous and next time row with values.
-        # Allow interpolation for 3 hours maximum, any more and throw an error.       
-        if NN[row]==0:
-          offset=0
-          bval=None
-          while boffset<3*i_nsteps and brow>0:
-            boffset+=1
-            brow=row-boffset
-            if NN[brow]>0:
-              bval=WW[brow]/NN[brow]
-              break
-
-          offset=0
-          fval=None
-          while foffset<3*i_nsteps and frow<(len(W[0])-1):
-            foffset+=1
-            frow=row+foffset
-            if NN[frow]>0:
-              fval=WW[frow]/NN[frow]
-              break
-          
-          if bval and fval and (boffset+foffset)<=3*i_nsteps:
-            rowrange=frow-brow
-            valrange=fval-bval
-            tmpstr=tmpstr+',{:.2f}'.format(bval+valrange*(boffset/rowrange))
-          else:
-            print("WARNING: missing data spanning more than 3 hours in file "+file1)
-            sys.exit(1)
-          
-        else:
-          tmpstr=tmpstr+',{:.2f}'.format(WW[row]/NN[row])
-      w_handle.write(tmpstr+'\n')
-
-    w_handle.close()
-
-if(not var2getfilefound): # error trap
+if not os.path.isfile("var2get"):
   print("WARNING: No csv file written because no var2get file found in this folder") # error trap
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-##
+  sys.exit(1)
+
+print("\n ...working on var2get\n")
+handle = open("var2get","r")
+varnames=[]
+for line in handle:
+  line = line.strip()
+  if line == "": continue # skip blank lines
+  varnames.append(line.split(',')[0])
+handle.close()
+
+# Bin samples for each variable as they are read (see h2gjson.py), so only
+# the binned series are held in memory.
+td_step=np.timedelta64(3600//i_nsteps,'s')
+binned=[]
+for varname in varnames:
+  # find data files that begin with this string
+  files=[file1 for file1 in sorted(os.listdir(".")) if file1.startswith(varname)]
+  for file1 in files:
+    print("Reading " + file1)
+  try:
+    series=h2gjson.bin_series(files,td_step)
+  except json.JSONDecodeError:
+    print ("WARNING: data file(s) for "+ varname + " not valid json")
+    sys.exit(1)
+  except (ValueError, KeyError, TypeError):
+    print ("WARNING: invalid data in file(s) for "+ varname)
+    sys.exit(1)
+  if series is None:
+    print("WARNING: data file " + varname + "... not found or empty") # error trap
+    sys.exit(1)
+  binned.append(series)
+
+print(" \n ...finished with var2get\n")
+
+# Set up time step grid, and get means per time step.
+t_start=min([first for first,W1,N1 in binned])
+i_nrows=max([int((first-t_start)//td_step)+len(W1) for first,W1,N1 in binned])
+W=np.zeros((len(varnames),i_nrows))
+N=np.zeros((len(varnames),i_nrows))
+for i,(first,W1,N1) in enumerate(binned):
+  row=int((first-t_start)//td_step)
+  W[i,row:row+len(W1)]=W1
+  N[i,row:row+len(N1)]=N1
+del binned
+valid=N>0
+M=np.divide(W,N,out=np.zeros_like(W),where=valid)
+
+# Interpolate time steps with no samples.
+# For each time step, find the nearest time steps at or before (brow) and at
+# or after (frow) with samples; these are -1 before the first sample and
+# i_nrows after the last, so missing data at either end is measured from just
+# outside the grid.
+rowind=np.arange(i_nrows)
+brow=np.maximum.accumulate(np.where(valid,rowind,-1),axis=1)
+frow=np.minimum.accumulate(np.where(valid,rowind,i_nrows)[:,::-1],axis=1)[:,::-1]
+gaps=~valid
+if np.any(gaps & (frow-brow>i_maxgap)):
+  print("WARNING: missing data spanning more than 3 hours")
+  sys.exit(1)
+if np.any(gaps):
+  bval=np.take_along_axis(M,np.clip(brow,0,i_nrows-1),axis=1)
+  fval=np.take_along_axis(M,np.clip(frow,0,i_nrows-1),axis=1)
+  # Before the first or after the last sample, hold the value of that sample.
+  bval=np.where(brow<0,fval,bval)
+  fval=np.where(frow>=i_nrows,bval,fval)
+  span=np.where(gaps,frow-brow,1)
+  M=np.where(gaps,bval+(fval-bval)*(rowind-brow)/span,M)
+
+# now write csv file
+newcsvfile = "measured_data.csv"
+timestr=np.char.replace(np.datetime_as_string(t_start+rowind*td_step,unit='s'),'T',' ')
+valstr=np.char.mod('%.2f',M.T)
+lines=[','.join([s_time]+list(ls_vals)) for s_time,ls_vals in zip(timestr,valstr)]
+w_handle = open(newcsvfile,"w")
+w_handle.write(','.join(['Time']+varnames)+'\n'+'\n'.join(lines)+'\n')
+w_handle.close()
@@ -5,92 +5,121 @@
 # script reads json files names as given in *.clmvar and makes relevant ESP-r
 # climate files. If a json file is not present for any climate
 # parameter this is indicated by a 0 in the clmvar file
-# Climate parameters for one day are expected only and the same
-# data is repeated for all days in the ESP-r clm file i.e.
-# ONLY ONE JSON FILE PER ENTRY IN EVERY *.clmvar FILE IS EXPECTED
-# If more files are present only the first file is read
+
+# Samples are averaged per hour into an array of (days, 24 hours, 6
+# parameters), starting on the day of the first sample. Days of the year
+# before the data are filled with the first day of data, and days after with
+# the last day. Times are as given in the timestamps, i.e. local time. The
+# climate file is for the year of the first sample; data after the end of
+# that year is not used. Files are read as they stream, and only the hourly
+# sums are kept (see h2gjson.py).
 
 #################
 ### IMPORTANT ###
 #################
 # This script assumes that the following command has already been run
-# ./chips -g -p i.e. get previous days information
+# ./chips -g (or python3 h2gstore.py)
 # This script also assumes that all weather parameters are present in var2get
 import os
+import io
+import sys
 import json
-from datetime import *
-from subprocess import call
+import numpy as np
+import h2gjson
+
+clm_desc = ["dry bulb temperature","diffuse solar","direct solar","wind speed","wind direction","relative humidity"]
+clm_scale = np.array([10,1,1,10,1,1]) # dry bulb and wind speed are in tenths
 
 clmvarfilesfound = False # error trap
-for file in os.listdir("."):
+for file in sorted(os.listdir(".")):
   if file.endswith(".clmvar"):
     clmvarfilesfound = True  # error trap
-    # W[climate parameter 0-5][hours 0-23] N is number of times it occurs
-    W = [[] for y in range(6)]
-    N = [[] for y in range(6)]
 
     print("\n ...working on " + file + "\n")
     handle = open(file,"r")
-    count = len(open(file).readlines()) # error trap
-    if(count != 6): # error trap
+    lines = [line.rstrip() for line in handle]
+    handle.close()
+    if(len(lines) != 6): # error trap
       print ("ERROR: number of lines in file " + file + " is not 6, not writing this climate file") # error trap
-      break # error trap
-    linenum = 0
-    while True:
-      line = handle.readline()
-      if not line:
-        break
-      line = line.rstrip() # remove trailing newline
-      clm_desc = ["dry bulb temperature","diffuse solar","direct solar","wind speed","wind direction","relative humidity"]
+      continue
 
-      # find data files that begin with this string
+    # Sum samples per hour for each climate parameter as they are read (see
+    # h2gjson.py), so only the hourly series are held in memory.
+    binned = [None]*6
+    for linenum, line in enumerate(lines):
       if (line == "0"):
         print("WARNING: variable "+clm_desc[linenum]+" not present in "+file+", setting to 0")
-      else:
-        thisfilefound = False # error trap
-        for file1 in os.listdir("."):
-          if(file1.startswith(line)):
-            thisfilefound = True
-            print("Reading " + file1)
-            with open(file1) as uglyjson:
-              try:
-                j = json.load(uglyjson)
-                startDay=-1
-                for items in j['data']:
-                  tmpstr = items['timestamp']
-                  val = items['value']
-                  if ":" == tmpstr[-3:-2]:
-                    tmpstr = tmpstr[:-3]+tmpstr[-2:] # remove last :
-                    ts = datetime.strptime(tmpstr,'%Y-%m-%dT%H:%M:%S%z')
-                    if startDay<0:
-                      startDay=int(ts.strftime('%j'))
-                    day=int(ts.strftime('%j'))-startDay
-                    iind=day*24+ts.hour
-                    try: 
-                      W[linenum][iind] += val
-                      N[linenum][iind] += 1
-                    except IndexError:
-                      W[linenum].append(val)
-                      N[linenum].append(1)
-
-                  else:
-                    # File is probably empty
-                    print ("WARNING: "+ file1 + " is probably empty")
-                    sys.exit(1)
-                endDay=int(ts.strftime('%j'))
-              except ValueError as e:
-                print ("WARNING: "+ file1 + " is not a valid json file -- setting "+clm_desc[linenum]+" to 0")
-        if(not thisfilefound): # error trap
-          print("WARNING: data file " + line + "... not found, setting "+clm_desc[linenum]+" to 0" ) # error trap
-      linenum += 1
+        continue
+      # find data files that begin with this string, only the first is read
+      thisfilefound = False # error trap
+      for file1 in sorted(os.listdir(".")):
+        if(file1.startswith(line)):
+          thisfilefound = True
+          print("Reading " + file1)
+          try:
+            binned[linenum] = h2gjson.bin_series([file1], np.timedelta64(1,'h'))
+          except json.JSONDecodeError:
+            print ("WARNING: "+ file1 + " is not a valid json file -- setting "+clm_desc[linenum]+" to 0")
+            break
+          except (ValueError, KeyError, TypeError):
+            print ("WARNING: invalid data in file "+ file1)
+            sys.exit(1)
+          if binned[linenum] is None:
+            # File is probably empty
+            print ("WARNING: "+ file1 + " is probably empty")
+            sys.exit(1)
+          break
+      if(not thisfilefound): # error trap
+        print("WARNING: data file " + line + "... not found, setting "+clm_desc[linenum]+" to 0" ) # error trap
 
     print(" \n ...finished with " + file + "\n")
-    handle.close()
 
-    # now begin writing clm file
+    if all([b is None for b in binned]):
+      print ("WARNING: no data found for " + file)
+      sys.exit(1)
+
+    # Set up hourly grid, from midnight on the day of the first sample to the
+    # end of the day of the last sample, but within the year.
+    t_first = min([b[0] for b in binned if b is not None])
+    t_last = max([b[0] + np.timedelta64(len(b[1])-1,'h') for b in binned if b is not None])
+    d_first = t_first.astype('datetime64[D]')
+    s_year = str(t_first.astype('datetime64[Y]'))
+    d_yearStart = t_first.astype('datetime64[Y]').astype('datetime64[D]')
+    # The file has 365 days, so data starting on 31 December of a leap year
+    # is taken as day 365 (as combine_clm.py counts days).
+    i_startDay = min(int((d_first - d_yearStart) / np.timedelta64(1,'D')) + 1, 365)
+    i_endDay = max(min(int((t_last.astype('datetime64[D]') - d_yearStart) / np.timedelta64(1,'D')) + 1, 365), i_startDay)
+    i_ndays = i_endDay - i_startDay + 1
+
+    # Get hourly means (0 where there is no data).
+    W = np.zeros((6, i_ndays*24))
+    N = np.zeros((6, i_ndays*24))
+    for p in range(6):
+      if binned[p] is None: continue
+      first, W1, N1 = binned[p]
+      hour = int((first - d_first.astype('datetime64[s]')) // np.timedelta64(1,'h'))
+      n = min(len(W1), i_ndays*24 - hour)
+      if n <= 0: continue
+      W[p, hour:hour+n] = W1[:n]
+      N[p, hour:hour+n] = N1[:n]
+    M = np.divide(W, N, out=np.zeros_like(W), where=N>0)
+
+    # Arrange as (days, hours, parameters) and fill in the whole year.
+    D = M.T.reshape(i_ndays, 24, 6)
+    Y = np.concatenate([np.repeat(D[:1], i_startDay-1, axis=0), D, np.repeat(D[-1:], 365-i_endDay, axis=0)])
+    Y = (Y * clm_scale).astype(int)
+
+    # now write clm file
+    buf = io.StringIO()
+    np.savetxt(buf, Y.reshape(-1, 6), fmt='%d', delimiter=',')
+    hourlines = buf.getvalue().splitlines()
+    daylines = []
+    for day in range(365):
+      daylines.append("* day  " + str(day+1))
+      daylines += hourlines[day*24:(day+1)*24]
+
     newclmfile = os.path.splitext(file)[0] + ".clm.a"
     w_handle = open(newclmfile,"w+")
-    s_year=datetime.strftime(ts,'%Y')
     w_handle.write('''*CLIMATE 2
 # Col | Metric                   | Unit
 #   1 | dry bulb temperature     | tenths deg C            
@@ -104,89 +133,8 @@ for file in os.listdir("."):
  '''+s_year+''',00.00,00.00   # year, latitude, longitude difference
  01,02,03,00,04,05,06,00,00,00    # columns for each metric
  1,365    # period (julian days)
-''')
-
-    dayper=0
-    for day in range(1,366):
-      w_handle.write("* day  " + str(day) + "\n")
-      tmpstr = ""
-
-      # Fill in days before our period with the first day from our period.
-      if day<startDay:
-        for t in range(0,24):
-          for p in range(0,6):
-            hour_value = 0
-            if t>=len(N[p]): 
-              hour_value=0
-            elif(N[p][t] != 0):
-              hour_value = W[p][t] / N[p][t]
-            if(p == 0 or p == 3):
-              hour_value = hour_value * 10
-            hour_value = int(hour_value)
-            tmpstr = str(hour_value)
-            if(p != 5):
-              tmpstr += ","
-            w_handle.write(tmpstr)
-          w_handle.write("\n")
-
-      # Fill in days after our period with the last day from our period.
-      elif day>endDay:
-        for t in range(-24,0):
-          for p in range(0,6):
-            hour_value = 0
-            if t<-len(N[p]): 
-              hour_value=0
-            elif(N[p][t] != 0):
-              hour_value = W[p][t] / N[p][t]
-            if(p == 0 or p == 3):
-              hour_value = hour_value * 10
-            hour_value = int(hour_value)
-            tmpstr = str(hour_value)
-            if(p != 5):
-              tmpstr += ","
-            w_handle.write(tmpstr)
-          w_handle.write("\n")
-
-      else:
-        for t in range(0,24):
-          for p in range(0,6):
-            iind=dayper*24+t
-            hour_value = 0            
-            if t>=len(N[p]): 
-              hour_value=0
-            elif(N[p][iind] != 0):
-              hour_value = W[p][iind] / N[p][iind]
-            if(p == 0 or p == 3):
-              hour_value = hour_value * 10
-            hour_value = int(hour_value)
-            tmpstr = str(hour_value)
-            if(p != 5):
-              tmpstr += ","
-            w_handle.write(tmpstr)
-          w_handle.write("\n")
-        dayper += 1
+'''+'\n'.join(daylines)+'\n')
     w_handle.close()
 
 if(not clmvarfilesfound): # error trap
   print("WARNING: No ESP-r climate files written because no *.clmvar files found in this folder") # error trap
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-##
@@ -18,9 +18,9 @@ def getLine(f,n):
 # END FUNCTION
 
 
-# FUNCTION get_zone_setpoints
+# FUNCTION scan_zone_setpoints
 # Scan control file for zone control setpoints.
-def get_zone_setpoints(f_ctl,i_numDayTypes):
+def scan_zone_setpoints(f_ctl,i_numDayTypes):
     
     s='zone_setpoints:'    
     s=s+'\n  number_of_calender_daytypes='+str(i_numDayTypes)
@@ -109,12 +109,129 @@ def get_zone_setpoints(f_ctl,i_numDayTypes):
 # END FUNCTION
 
 
-import sys,argparse
-from os import path
+# FUNCTION parseValue
+# Convert an output value to int or float if it is a number, None if blank.
+def parseValue(s):
+    for t in (int,float):
+        try:
+            return t(s)
+        except ValueError:
+            pass
+    if s=='' or s=='n/a': return None
+    return s
+# END FUNCTION
+
+
+# FUNCTION parseZoneBlock
+# Get the per-zone lists of a block output ("name:" then "  zone#n=a,b" lines).
+def parseZoneBlock(s_val):
+    lls=[]
+    for s_line in s_val.split('\n')[1:]:
+        if '=' in s_line:
+            lls.append([s for s in s_line.split('=',1)[1].split(',') if s!=''])
+    return lls
+# END FUNCTION
+
+
+# FUNCTION parseTree
+# Convert an indented block output (e.g. zone_setpoints) to nested
+# dictionaries. Numbered headers (e.g. "function#1:") become lists (e.g.
+# "functions").
+def parseTree(s_val):
+    dict_root={}
+    l_stack=[(-1,dict_root)]
+    for s_line in s_val.split('\n')[1:]:
+        if s_line.strip()=='': continue
+        i_indent=len(s_line)-len(s_line.lstrip())
+        while l_stack[-1][0]>=i_indent: l_stack.pop()
+        dict_parent=l_stack[-1][1]
+        s_line=s_line.strip()
+        if s_line[-1]==':':
+            dict_new={}
+            s_key=s_line[:-1].split('#')[0]
+            if '#' in s_line:
+                dict_parent.setdefault(s_key+'s',[]).append(dict_new)
+            else:
+                dict_parent[s_key]=dict_new
+            l_stack.append((i_indent,dict_new))
+        else:
+            s_key,s=s_line.split('=',1)
+            dict_parent[s_key]=parseValue(s)
+    return dict_root
+# END FUNCTION
+
+
+# FUNCTION toJSON
+# Convert the requested outputs to one dictionary for JSON output. Model wide
+# outputs are top level keys (grouped for rad, afn, ctm and tdfa), and per-zone
+# outputs are keys of each entry in "zones", e.g.
+# {"model_name": "office", "number_zones": 2,
+#  "zones": [{"index": 1, "name": "room", "MRT_sensors": 1, ...}, ...],
+#  "tdfa": {"file": "../dbs/x.tdfa", "timestep": 4, ...}, ...}
+# Numbers are numbers, flags are booleans, lists are lists, and blank values
+# are null.
+def toJSON():
+    dict_out={'cfg_file':s_inCfgFile}
+    def val(i):
+        return ls_outputVals[i].split('=',1)[1] if '=' in ls_outputVals[i] else ''
+
+    # Model wide outputs: index, group (None if top level), key.
+    for i,s_group,s_key in [(0,None,'model_name'),(4,None,'model_description'),(1,None,'number_zones'),
+                            (16,None,'zone_control'),(3,None,'zone_setpoints'),(9,'rad','scene'),
+                            (8,'rad','viewpoints'),(11,'afn','network'),(12,'ctm','network'),(13,'ctm','number'),
+                            (20,'tdfa','file'),(21,'tdfa','timestep'),(22,'tdfa','startday'),(23,'tdfa','endday'),
+                            (24,'tdfa','entities'),(25,None,'uncertainties_file'),(26,None,'number_presets')]:
+        if not lb_display[i]: continue
+        if i==3:
+            v=parseTree(ls_outputVals[i]) if '\n' in ls_outputVals[i] else None
+        elif i==16:
+            v=val(i)=='1'
+        elif i==8:
+            v=[s for s in val(i).split(',') if s!='']
+        elif i in (0,4):
+            v=val(i)
+        else:
+            v=parseValue(val(i))
+        if s_group is None:
+            dict_out[s_key]=v
+        else:
+            dict_out.setdefault(s_group,{})[s_key]=v
+
+    # Per-zone outputs: index, key, block output, value type.
+    ll_zones=[]
+    for i,s_key,b_block,t in [(5,'name',False,str),(6,'MRT_sensors',False,int),(19,'MRT_sensor_names',True,str),
+                              (7,'floor_surfs',True,int),(10,'win_surfs',True,int),(2,'CFD_domain',False,int),
+                              (18,'CFD_domain_file',False,str),(17,'CFD_contaminants',True,str),
+                              (14,'afn_node',False,str),(15,'afn_node_number',False,int)]:
+        if not lb_display[i]: continue
+        if b_block:
+            # "0" (no floor found) and "none" mark zones with nothing listed.
+            l=[[t(s) for s in ls if s!='none' and not (t is int and s=='0')] for ls in parseZoneBlock(ls_outputVals[i])]
+        elif val(i)=='':
+            l=[]
+        else:
+            l=[None if s=='' or (i==14 and s=='0') else t(s) for s in val(i).split(',')]
+        ll_zones.append((s_key,l))
+    if ll_zones:
+        i_numZones=max([len(l) for s_key,l in ll_zones])
+        dict_out['zones']=[]
+        for i_zone in range(i_numZones):
+            dict_zone={'index':i_zone+1}
+            for s_key,l in ll_zones:
+                dict_zone[s_key]=l[i_zone] if i_zone<len(l) else None
+            dict_out['zones'].append(dict_zone)
+    return dict_out
+# END FUNCTION
+
+
+import sys,argparse,json,io,zipfile,tarfile
+from os import path,stat,getpid,replace,cpu_count
+from multiprocessing import get_context
 from datetime import datetime
 
 # OUTPUT MAPPINGS
-# New outputs must be added here (also add help text in the parser below).
+# New outputs must be added here, with a function get_[output] (see OUTPUTS
+# below) and help text in the parser below.
 #            0            1              2             3                4                   5            6
 ls_outputs=['model_name','number_zones','CFD_domains','zone_setpoints','model_description','zone_names','MRT_sensors',
 #            7                  8                9           10               11            12            13
@@ -123,16 +240,6 @@ ls_outputs=['model_name','number_zones','CFD_domains','zone_setpoints','model_de
             'afn_zone_nodes','afn_zon_nod_nums','zone_control','CFD_contaminants','CFD_domain_files','MRT_sensor_names',
 #            20          21              22              23            24              25                   26
             'tdfa_file','tdfa_timestep','tdfa_startday','tdfa_endday','tdfa_entities','uncertainties_file','number_presets']
-# Prerequisites.
-#            0            1              2             3                4                   5            6
-lli_needs= [[]          ,[]            ,[1,18]       ,[16]            ,[]                 ,[1]         ,[1]  ,
-#            7                  8                9           10               11            12            13
-            [1]               ,[]              ,[]         ,[1]             ,[]           ,[]           ,[12],
-#            14               15                 16             17                 18                 19
-            [11]            ,[11,14,1]         ,[]            ,[1,18]            ,[1]               ,[1,6]   ,
-#            20          21              22              23            24              25                   26
-            []         ,[20]           ,[20]           ,[20]         ,[20]           ,[]                  ,[] ]
-
 # Argument parser and help text.
 parser=argparse.ArgumentParser(description='Script to query an ESP-r model for various data.\n'
                                            'Assumes default model directory setup.\n'
@@ -140,6 +247,24 @@ parser=argparse.ArgumentParser(description='Script to query an ESP-r model for v
                                formatter_class=argparse.RawTextHelpFormatter)
 parser.add_argument('-o','--output-file',
                     help='write outputs to OUTPUT_FILE instead of stdout')
+parser.add_argument('-j','--json',
+                    action='store_true',
+                    help='write outputs as one JSON document, with per-zone outputs\n'
+                         'nested under "zones" (see toJSON in this script)')
+parser.add_argument('-c','--cache',
+                    metavar='INDEX_FILE',
+                    help='keep outputs in INDEX_FILE between runs, and take them from it\n'
+                         'while the model files they were read from are unchanged\n'
+                         '(see INDEX in this script)')
+parser.add_argument('-b','--batch',
+                    action='store_true',
+                    help='query many models: CFG_FILE is a file listing the models ("-" for\n'
+                         'stdin), one per line, each a .cfg file or a model archive (.zip,\n'
+                         '.tar or .tar.gz, read in place); outputs are written as JSON lines\n'
+                         '(see queryModel in this script)')
+parser.add_argument('-p','--processes',
+                    type=int,
+                    help='with -b, query up to PROCESSES models at once (default number of cpus)')
 parser.add_argument('CFG_FILE',
                     help='the .cfg file of the model to be queried')
 parser.add_argument('OUTPUTS',
@@ -182,6 +307,11 @@ args=parser.parse_args()
 s_outputFile=args.output_file
 s_inCfgFile=args.CFG_FILE
 ls_inOutputs=args.OUTPUTS
+b_json=args.json
+s_indexFile=args.cache
+b_batch=args.batch
+if b_batch and s_indexFile:
+    parser.error('-c cannot be used with -b')
 
 # Open output file if required.
 curDateTime=datetime.now()
@@ -189,614 +319,763 @@ s_dateTime=curDateTime.strftime('%a %b %d %X %Y')
 s='*** esp-query output for model "'+s_inCfgFile+'" @ '+s_dateTime+' ***\n'   
 if s_outputFile: 
     f_output=open(s_outputFile,'w')
-    f_output.write(s+'\n')
-else:
+    if not b_json and not b_batch: f_output.write(s+'\n')
+elif not b_json and not b_batch:
     print(s)
 
-# Set arrays for required outputs.
-i_numOutputs=len(ls_outputs)
-lb_outputs=[False]*i_numOutputs
-lb_display=[False]*i_numOutputs
-li_order=[0]*i_numOutputs
-for i,s_output in enumerate(ls_outputs):
-    if s_output in ls_inOutputs: 
-        lb_outputs[i]=True
-        lb_display[i]=True
-        if len(lli_needs[i])>0:
-            for i_need in lli_needs[i]:
-                lb_outputs[i_need]=True
-        li_order[i]=ls_inOutputs.index(s_output)
-ls_outputVals=['']*i_numOutputs
-ls_outputText=['']*len(ls_inOutputs)
-
-# Get path to model files and open cfg file.
+# Get path to model files.
 s_cfgPath,s_cfgFile=path.split(s_inCfgFile)
 if s_cfgPath=='': s_cfgPath='.'
-f_cfg=open(s_cfgPath+'/'+s_cfgFile,'r')
-
-# Initialise.
-if lb_outputs[5]: i_numZonesDone=0
-
-# Scan cfg file.
-i_countdown=-1
-i_countdown2=-1
-b_ctl=False
-b_vwf=False
-b_cfd=False
-i_afn=0
-i_numZonesDone=0
-for s_line in f_cfg:
-    s_line=s_line.strip()
-    ls_line=s_line.split()
 
-    if i_countdown>=0: i_countdown=i_countdown-1
-    if i_countdown2>=0: i_countdown2=i_countdown2-1
 
-    # Get model name.
-    i_ind=0
-    if lb_outputs[i_ind]:
-        if ls_line[0]=='*root':
-            s=ls_outputs[i_ind]+'='+ls_line[1]
-            ls_outputVals[i_ind]=s
-            lb_outputs[i_ind]=False
+# *** MODEL FILES ***
+# Model files are read through getFile, so that each is opened at most once,
+# and read only as far as the outputs need.
 
-    # Get number of zones.
-    i_ind=1
-    if lb_outputs[i_ind]:
-        if ls_line[0:2]==['*','Building']:
-            i_countdown=2
-        elif i_countdown==0:
-            s=ls_outputs[i_ind]+'='+ls_line[0]
-            ls_outputVals[i_ind]=s
-            lb_outputs[i_ind]=False
-
-    # Get model description.
-    i_ind=4
-    if lb_outputs[i_ind]:
-        if ls_line[0:2]==['*','Building']:
-            i_countdown2=1
-        elif i_countdown2==0:
-            s=ls_outputs[i_ind]+'='+' '.join(ls_line)
-            ls_outputVals[i_ind]=s
-            lb_outputs[i_ind]=False
-
-    # Keep track of how many zones we've scanned and the zone index.
-    # These should be the same.
-    if ls_line[0]=='*zon':
-        i_numZonesDone+=1
-        s_zonInd=ls_line[1]
-        assert int(s_zonInd)==i_numZonesDone
-
-    # Get zone names.
-    # Assumes that we already have number of zones.
-    i_ind=5
-    if lb_outputs[i_ind]:
-        if ls_line[0]=='*geo':
-            s_geo=s_cfgPath+'/'+ls_line[1]
-            f_geo=open(s_geo,'r')
-            s='#'
-            while s[0]=='#':
-                s=f_geo.readline()            
-            f_geo.close()
-            s=s.strip()
-            s=s.split('#')[0]
-            s_tmp=s.split()[0]
-            if s_tmp=='*Geometry':
-                # old geo file            
-                s=s.split(',')[2]
-            elif s_tmp=='GEN':
-                # new geo file
-                s=s.split()[1]
+# CLASS ModelArchive
+# A model archive (.zip, .tar or .tar.gz) whose files are read in place,
+# without extracting it.
+class ModelArchive:
+    def __init__(self,s_file):
+        if s_file.endswith('.zip'):
+            self.z=zipfile.ZipFile(s_file)
+            self.dict_members={path.normpath(s):s for s in self.z.namelist() if not s.endswith('/')}
+        else:
+            self.z=tarfile.open(s_file)
+            self.dict_members={path.normpath(m.name):m for m in self.z.getmembers() if m.isfile()}
+
+    # Open a file in the archive, as open(s_path,'r').
+    def open(self,s_path):
+        s_key=path.normpath(s_path)
+        if s_key not in self.dict_members:
+            raise FileNotFoundError('no file '+s_key+' in model archive')
+        if isinstance(self.z,zipfile.ZipFile):
+            return io.TextIOWrapper(self.z.open(self.dict_members[s_key]))
+        return io.TextIOWrapper(self.z.extractfile(self.dict_members[s_key]))
+
+    # Get the cfg file of the model. As for an extracted model, it must be the
+    # only one in the cfg folder, which is at the top of the archive or inside
+    # one folder.
+    def findCfg(self):
+        ls_cfg=[s for s in self.dict_members if s.endswith('.cfg') and
+                path.basename(path.dirname(s))=='cfg' and s.count('/')<=2]
+        if len(ls_cfg)==0:
+            raise FileNotFoundError('cfg file not found in model cfg directory')
+        elif len(ls_cfg)>1:
+            raise ValueError('more than one cfg file found in model cfg directory')
+        return ls_cfg[0]
+# END CLASS
+
+# Archive the model files are read from, or None if they are files.
+archive=None
+
+# CLASS ModelFile
+# A model file that is read line by line as lines are asked for. Lines that
+# have been read are kept.
+class ModelFile:
+    def __init__(self,s_path):
+        if archive is None:
+            self.f=open(s_path,'r')
+        else:
+            self.f=archive.open(s_path)
+        self.ls_lines=[]
+
+    # Get line n (from 1) as read, or '' past the end of the file.
+    def line(self,n):
+        while len(self.ls_lines)<n and self.f is not None:
+            s=self.f.readline()
+            if s=='':
+                self.f.close()
+                self.f=None
             else:
-                sys.stderr.write('esp-query error: unrecognised format in file '+s_geo+'\n')
+                self.ls_lines.append(s)
+        if n<=len(self.ls_lines): return self.ls_lines[n-1]
+        return ''
+
+    # Get line n split by whitespace (as getLine).
+    def split(self,n):
+        return self.line(n).strip().split()
+
+    # Get all lines.
+    def lines(self):
+        self.line(sys.maxsize)
+        return self.ls_lines
+# END CLASS
+
+dict_files={}
+
+# FUNCTION getFile
+# Get the ModelFile for a path. The file is noted as read for the outputs
+# being evaluated (see INDEX below), with its size and modification time from
+# before it is read.
+def getFile(s_path):
+    s_key=path.normpath(s_path)
+    if s_key not in dict_files:
+        if s_indexFile: getStat(path.abspath(s_key))
+        dict_files[s_key]=ModelFile(s_path)
+    for set_files,ls_warnings in lt_evaluating:
+        set_files.add(path.abspath(s_key))
+    return dict_files[s_key]
+# END FUNCTION
+
+# FUNCTION getCfg
+# Get the lines of the cfg file, split by whitespace.
+lls_cfg=None
+def getCfg():
+    global lls_cfg
+    if lls_cfg is None:
+        lls_cfg=[s.split() for s in getFile(s_cfgPath+'/'+s_cfgFile).lines()]
+    return lls_cfg
+# END FUNCTION
+
+# FUNCTION warn
+# Write a warning, noting it for the outputs being evaluated so that it is
+# written again when they are taken from the index.
+def warn(s):
+    sys.stderr.write(s)
+    for set_files,ls_warnings in lt_evaluating:
+        ls_warnings.append(s)
+# END FUNCTION
+
+
+# *** INDEX ***
+# With -c, outputs are kept between runs in an index file (json), by absolute
+# path of the cfg file:
+# {"[cfg]": {"cfg_path": "[cfg folder as given]",
+#            "outputs": {"[output]": {"value": "[output text]",
+#                                     "warnings": ["[warning]", ...],
+#                                     "files": {"[file]": [size, mtime], ...}}}}}
+# where files are all model files the output was read from (including those
+# of the outputs it needs, and always the cfg file). An output is taken from
+# the index if none of its files have changed size or modification time, so
+# only outputs whose files have changed are evaluated (i.e. parsed) again.
+
+dict_stats={}
+
+# FUNCTION getStat
+# Get [size, modification time (ns)] of a file (absolute path), or None if
+# it cannot be found.
+def getStat(s_file):
+    if s_file not in dict_stats:
+        try:
+            st=stat(s_file)
+            dict_stats[s_file]=[st.st_size,st.st_mtime_ns]
+        except OSError:
+            dict_stats[s_file]=None
+    return dict_stats[s_file]
+# END FUNCTION
+
+s_cfgKey=path.abspath(s_inCfgFile)
+dict_index={}
+dict_model={'cfg_path':s_cfgPath,'outputs':{}}
+b_indexChanged=False
+if s_indexFile:
+    try:
+        f_index=open(s_indexFile,'r')
+        dict_index=json.load(f_index)
+        f_index.close()
+    except (OSError,ValueError):
+        # No index yet, or not readable; start a new one.
+        dict_index={}
+    if not isinstance(dict_index,dict): dict_index={}
+    # Outputs give paths as the cfg folder was given, so they only hold for
+    # the same cfg folder.
+    if s_cfgKey in dict_index and dict_index[s_cfgKey].get('cfg_path')==s_cfgPath:
+        dict_model=dict_index[s_cfgKey]
+    dict_index[s_cfgKey]=dict_model
+
+# FUNCTION getIndexed
+# Get the index entry of an output, or None if there is none or any of its
+# files have changed.
+def getIndexed(s_output):
+    if not s_indexFile or s_output not in dict_model['outputs']: return None
+    dict_entry=dict_model['outputs'][s_output]
+    for s_file,l_stat in dict_entry['files'].items():
+        if getStat(s_file)!=l_stat: return None
+    return dict_entry
+# END FUNCTION
+
+# FUNCTION writeIndex
+# Write the index file, if changed. The file is replaced atomically.
+def writeIndex():
+    if not s_indexFile or not b_indexChanged: return
+    s_tmpFile=s_indexFile+'.'+str(getpid())
+    f_index=open(s_tmpFile,'w')
+    json.dump(dict_index,f_index)
+    f_index.close()
+    replace(s_tmpFile,s_indexFile)
+# END FUNCTION
+
+
+# FUNCTION findCfg
+# Get the index of the first cfg line from i_start with keyword s_key, or -1.
+def findCfg(s_key,i_start=0):
+    lls_cfg=getCfg()
+    for i in range(i_start,len(lls_cfg)):
+        if lls_cfg[i] and lls_cfg[i][0]==s_key: return i
+    return -1
+# END FUNCTION
+
+# FUNCTION findBuilding
+# Get the index of the "* Building" cfg line, or -1.
+def findBuilding():
+    for i,ls_line in enumerate(getCfg()):
+        if ls_line[0:2]==['*','Building']: return i
+    return -1
+# END FUNCTION
+
+# FUNCTION getZones
+# Get the files of each zone, in order of the *zon lines, as a list of
+# dictionaries of keyword (without "*") to file name. For *ivf and *cfd the
+# file name is blank if *zend comes first.
+ldict_zones=None
+def getZones():
+    global ldict_zones
+    if ldict_zones is None:
+        ldict_zones=[]
+        for ls_line in getCfg():
+            if not ls_line: continue
+            if ls_line[0]=='*zon':
+                assert int(ls_line[1])==len(ldict_zones)+1
+                ldict_zones.append({})
+            elif not ldict_zones:
+                continue
+            elif ls_line[0]=='*geo':
+                ldict_zones[-1].setdefault('geo',ls_line[1])
+            elif ls_line[0] in ['*ivf','*cfd']:
+                ldict_zones[-1].setdefault(ls_line[0][1:],ls_line[1])
+            elif ls_line[0]=='*zend':
+                ldict_zones[-1].setdefault('ivf','')
+                ldict_zones[-1].setdefault('cfd','')
+    return ldict_zones
+# END FUNCTION
+
+# FUNCTION getZoneValues
+# Get a value for each zone up to the number of zones that has a file of
+# keyword s_key, as fn(zone number, file name).
+# Returns a list of values, or None if the last zone has no such file.
+def getZoneValues(s_key,fn):
+    s=getOutput('number_zones')
+    if s is None: return None
+    i_numZones=int(s.split('=')[1])
+    ldict=getZones()[:i_numZones]
+    if i_numZones==0 or len(ldict)<i_numZones or s_key not in ldict[-1]: return None
+    return [fn(i+1,dict_zone[s_key]) for i,dict_zone in enumerate(ldict) if s_key in dict_zone]
+# END FUNCTION
+
+# FUNCTION getAFN
+# Get the air flow network type (0 if none), and the cfg line index of the
+# network file name, from the lines after *cnn.
+# Returns a tuple, or None if there is no *cnn line.
+t_afn=False
+def getAFN():
+    global t_afn
+    if t_afn is False:
+        t_afn=None
+        i=findCfg('*cnn')
+        if i>=0:
+            lls_cfg=getCfg()
+            for j in range(i+1,len(lls_cfg)):
+                if lls_cfg[j] and lls_cfg[j][0] in ['0','1','3']:
+                    t_afn=(int(lls_cfg[j][0]),j+1)
+                    break
+    return t_afn
+# END FUNCTION
+
+
+# *** OUTPUTS ***
+# Each output has a function to get it, written as text ("name=value", or
+# "name:" followed by indented lines). The functions get other outputs they
+# need through getOutput, which only evaluates each output once, so only the
+# outputs and files needed for the requested outputs are ever evaluated and
+# read. Functions return None if an output cannot be found.
+
+# Get model name.
+def get_model_name():
+    i=findCfg('*root')
+    if i<0: return None
+    return 'model_name='+getCfg()[i][1]
+
+# Get number of zones.
+def get_number_zones():
+    i=findBuilding()
+    lls_cfg=getCfg()
+    if i<0 or i+2>=len(lls_cfg) or not lls_cfg[i+2]: return None
+    return 'number_zones='+lls_cfg[i+2][0]
+
+# Get model description.
+def get_model_description():
+    i=findBuilding()
+    lls_cfg=getCfg()
+    if i<0 or i+1>=len(lls_cfg): return None
+    return 'model_description='+' '.join(lls_cfg[i+1])
+
+# Get zone names.
+def get_zone_names():
+    def fn(i_zone,s_file):
+        s_geo=s_cfgPath+'/'+s_file
+        f_geo=getFile(s_geo)
+        n=1
+        while f_geo.line(n)[0:1]=='#':
+            n+=1
+        s=f_geo.line(n).strip()
+        s=s.split('#')[0]
+        ls=s.split()
+        if ls and ls[0]=='*Geometry':
+            # old geo file
+            s=s.split(',')[2]
+        elif ls and ls[0]=='GEN':
+            # new geo file
+            s=ls[1]
+        else:
+            sys.stderr.write('esp-query error: unrecognised format in file '+s_geo+'\n')
+            sys.exit(1)
+        return s.strip()
+    ls=getZoneValues('geo',fn)
+    if ls is None: return None
+    return 'zone_names='+','.join(ls)
+
+# Get zone floor surface numbers.
+def get_zone_floor_surfs():
+    def fn(i_zone,s_file):
+        s_geo=s_cfgPath+'/'+s_file
+        f_geo=getFile(s_geo)
+        n=1
+        while not f_geo.line(n)[0:10]=='*base_list':
+            if f_geo.line(n)=='':
+                sys.stderr.write('esp-query error: could not find base list in file '+s_geo+'\n')
                 sys.exit(1)
-            s=s.strip()
-            if i_numZonesDone==1:
-                ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+s
-            else:
-                ls_outputVals[i_ind]=ls_outputVals[i_ind]+','+s
-            if i_numZonesDone==int(ls_outputVals[lli_needs[i_ind][0]].split('=')[1]): lb_outputs[i_ind]=False
-
-    # Get zone floor surface numbers.
-    # Assumes that we already have number of zones.
-    i_ind=7
-    if lb_outputs[i_ind]:
-        if ls_line[0]=='*geo':
-            s_geo=s_cfgPath+'/'+ls_line[1]
-            f_geo=open(s_geo,'r')
-            s='#'
-            while not s[0:10]=='*base_list':
-                try:
-                    s=f_geo.readline()
-                    if s=='':
-                        sys.stderr.write('esp-query error: could not find base list in file '+s_geo+'\n')
-                        sys.exit(1)
-                except:
-                    sys.stderr.write('esp-query error: unrecognised format in file '+s_geo+'\n')
-                    sys.exit(1)
-            f_geo.close()
-            s=s.strip()
-            s=s.split('#')[0]
-            ls=s.split(',')
-            if ls[1]=='0':
-                sys.stderr.write('esp-query warning: unable to find floor surface for zone '+str(i_numZonesDone)+'\n')
-                s='0'
-            else:
-                s=','.join(ls[2:2+int(ls[1])])
-
-            if i_numZonesDone==1: ls_outputVals[i_ind]=ls_outputs[i_ind]+':\n'
-            ls_outputVals[i_ind]=ls_outputVals[i_ind]+'  zone#'+str(i_numZonesDone)+'='+s+'\n'
-            if i_numZonesDone==int(ls_outputVals[lli_needs[i_ind][0]].split('=')[1]): lb_outputs[i_ind]=False
-
-    # Get number of MRT sensors.
-    # Assumes that we already have number of zones.
-    i_ind=6
-    if lb_outputs[i_ind]:
-        if ls_line[0]=='*zon':
-            b_vwf=True
-        elif b_vwf and ls_line[0]=='*ivf':
-            f_vwf=open(s_cfgPath+'/'+ls_line[1],'r')
-            ls=getLine(f_vwf,5)
-            f_vwf.close()
-            s=ls[0]
-            if i_numZonesDone==1:
-                ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+s
-            else:
-                ls_outputVals[i_ind]=ls_outputVals[i_ind]+','+s
-            if i_numZonesDone==int(ls_outputVals[lli_needs[i_ind][0]].split('=')[1]): lb_outputs[i_ind]=False
-
-            # Get MRT sensor names.
-            ii_ind=19
-            if lb_outputs[ii_ind]:
-                f_vwf=open(s_cfgPath+'/'+ls_line[1],'r')
-                i=0
-                i_countdown1=0
-                i_countdown2=0
-                active1=0
-                active2=0
-                ls2=[]
-                j=0
-                ls3=[]
-                for s_line in f_vwf:
-                    i+=1
-                    if i_countdown1>0:
-                        i_countdown1-=1
-                        if i_countdown1==0: active1=1
-                    if i_countdown2>0:
-                        i_countdown2-=1
-                        if i_countdown2==0: active2=1
-                    if i==5:
-                        ls=s_line.strip().split()
-                        i_nsen=int(ls[0])
-                        i_nsur=int(ls[1])
-                    elif s_line.strip()=='*MRT_SENSOR':
-                        i_countdown1=2
-                    elif active1:
-                        ls=s_line.strip().split()
-                        ls2.append(ls[8])
-                        if len(ls2)==i_nsen: 
-                            break
-                        active1=0
-                    elif s_line.strip()=='*MRTVIEW':
-                        i_countdown2=1
-                    elif active2:
-                        ls4=s_line.strip().split(',')
-                        if ls4[-1]=='': 
-                            ls4.pop()
-                        ls3+=ls4
-                        if len(ls3)==i_nsur:
-                            ls3=[]
-                            j+=1
-                            if j==6: 
-                                active1=1
-                                active2=0
-                                j=0
-
-                f_vwf.close()
-                s2=','.join(ls2)
-                if i_numZonesDone==1: ls_outputVals[ii_ind]=ls_outputs[ii_ind]+':\n'
-                ls_outputVals[ii_ind]=ls_outputVals[ii_ind]+'  zone#'+str(i_numZonesDone)+'='+s2+'\n'
-                if i_numZonesDone==int(ls_outputVals[lli_needs[ii_ind][0]].split('=')[1]): lb_outputs[ii_ind]=False
-
-            b_vwf=False
-
-        elif b_vwf and ls_line[0]=='*zend':
+            n+=1
+        s=f_geo.line(n).strip()
+        s=s.split('#')[0]
+        ls=s.split(',')
+        if ls[1]=='0':
+            warn('esp-query warning: unable to find floor surface for zone '+str(i_zone)+'\n')
             s='0'
-            if i_numZonesDone==1:
-                ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+s
-            else:
-                ls_outputVals[i_ind]=ls_outputVals[i_ind]+','+s
-            if i_numZonesDone==int(ls_outputVals[lli_needs[i_ind][0]].split('=')[1]): lb_outputs[i_ind]=False
-
-            ii_ind=19
-            if lb_outputs[ii_ind]:
-                s2=''
-                if i_numZonesDone==1: ls_outputVals[ii_ind]=ls_outputs[ii_ind]+':\n'
-                ls_outputVals[ii_ind]=ls_outputVals[ii_ind]+'  zone#'+str(i_numZonesDone)+'='+s2+'\n'
-                if i_numZonesDone==int(ls_outputVals[lli_needs[ii_ind][0]].split('=')[1]): lb_outputs[ii_ind]=False
-
-            b_vwf=False
-
-    # Get CFD domain files.
-    i_ind=18
-    if lb_outputs[i_ind]:       
-        if ls_line[0]=='*zon':
-            b_cfd=True
-        elif b_cfd and ls_line[0]=='*cfd':
-            s=s_cfgPath+'/'+ls_line[1]
-            if i_numZonesDone==1:
-                ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+s
-            else:
-                ls_outputVals[i_ind]=ls_outputVals[i_ind]+','+s
-            if i_numZonesDone==int(ls_outputVals[lli_needs[i_ind][0]].split('=')[1]): lb_outputs[i_ind]=False
-            b_cfd=False
-        elif b_cfd and ls_line[0]=='*zend':
-            s=''
-            if i_numZonesDone==1:
-                ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+s
-            else:
-                ls_outputVals[i_ind]=ls_outputVals[i_ind]+','+s
-            if i_numZonesDone==int(ls_outputVals[lli_needs[i_ind][0]].split('=')[1]): lb_outputs[i_ind]=False
-            b_cfd=False
-
-    # Get CFD domain indicators.
-    i_ind=2
-    if lb_outputs[i_ind]:  
-        if not lb_outputs[lli_needs[i_ind][1]]:
-            ls_outputVals[i_ind]=ls_outputs[i_ind]+'='
-            s=''
-            for s_cfd in ls_outputVals[lli_needs[i_ind][1]].split('=')[1].split(','):
-                if len(s_cfd)==0:
-                    s='0'
-                else:
-                    f_cfd=open(s_cfd,'r')
-                    ls=getLine(f_cfd,2)
-                    f_cfd.close()
-                    if ls[1]=='0': s='1'
-                    else: s='2'
-                ls_outputVals[i_ind]=ls_outputVals[i_ind]+s+','
-            if len(s)>0: ls_outputVals[i_ind]=ls_outputVals[i_ind][:-1]
-            lb_outputs[i_ind]=False
-
-    # Get CFD contaminants.
-    i_ind=17
-    if lb_outputs[i_ind]:  
-        if not lb_outputs[lli_needs[i_ind][1]]:
-            ls_outputVals[i_ind]=ls_outputs[i_ind]+':\n'
-            i_zn=0
-            for s_cfd in ls_outputVals[lli_needs[i_ind][1]].split('=')[1].split(','):
-                i_zn+=1
-                if len(s_cfd)==0:
-                    s=''
-                else:
-                    f_cfd=open(s_cfd,'r')
-                    i_numContam=0
-                    s=''
-                    for s_cfdLine in f_cfd:
-                        ls_cfdLine=s_cfdLine.strip().split()
-                        if ls_cfdLine[0]=='*contaminants(':
-                            i_numContam=int(ls_cfdLine[1])
-                            if i_numContam==0: 
-                                s='none'
-                                break
-                        elif i_numContam>0:
-                            s=s+ls_cfdLine[0]+','
-                            i_numContam-=1
-                            if i_numContam==0:
-                                s=s[:-1]
-                                break
-                    f_cfd.close()
-                ls_outputVals[i_ind]=ls_outputVals[i_ind]+'  zone#'+str(i_zn)+'='+s+'\n'
-            lb_outputs[i_ind]=False
-
-    # Get radiance viewpoint names.
-    i_ind=8
-    if lb_outputs[i_ind]:
-        if ls_line[0]=='*rif':
-            s_rcf=ls_line[1]
-            f_rcf=open(s_cfgPath+'/'+s_rcf,'r')
-            ls=getLine(f_rcf,5)
-            f_rcf.close()
-            assert ls[0]=='*rnm'
-            f_rif=open(s_cfgPath+'/'+path.split(s_rcf)[0]+'/'+ls[1],'r')
-            first=1
-            for s_line in f_rif:
-                ls=s_line.split()
-                if ls[0]=='view=':
-                    if first:
-                        ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+ls[1]
-                        first=0
-                    else:                        
-                        ls_outputVals[i_ind]=ls_outputVals[i_ind]+','+ls[1]
-            f_rif.close()
-            lb_outputs[i_ind]=False
-
-    # Get radiance scene name.
-    i_ind=9
-    if lb_outputs[i_ind]:
-        if ls_line[0]=='*rif':
-            s_rcf=ls_line[1]
-            f_rcf=open(s_cfgPath+'/'+s_rcf,'r')
-            ls=getLine(f_rcf,7)
-            f_rcf.close()
-            assert ls[0]=='*srt'
-            ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+ls[1]
-            lb_outputs[i_ind]=False
-
-    # Get window constructions.
-    i_ind=10
-    if lb_outputs[i_ind]:
-        if ls_line[0]=='*geo':
-            s_geo=s_cfgPath+'/'+ls_line[1]
-            f_geo=open(s_geo,'r')
-            s='#'
-            while not s[0:5]=='*surf':
-                try:
-                    s=f_geo.readline()
-                    if s=='':
-                        sys.stderr.write('esp-query: could not find surfaces in file '+s_geo+'\n')
-                        sys.exit(1)
-                except:
-                    sys.stderr.write('esp-query error: unrecognised format in file '+s_geo+'\n')
-                    sys.exit(1)
-
-            i_surf=0
-            first=1
-            if i_numZonesDone==1:
-                ls_outputVals[i_ind]=ls_outputs[i_ind]+':\n'
-            s2=s
-            while True:
-                i_surf+=1
-                if s2[0:5]!='*surf': break
-                s=s2.strip()
-                s=s.split('#')[0]
-                ls=s.split(',')
-                s2=f_geo.readline()
-                if ls[7]=='OPAQUE' or ls[8]!='EXTERIOR': continue
-                s=str(i_surf)
-
-                if first:
-                    first=0
-                    ls_outputVals[i_ind]=ls_outputVals[i_ind]+'  zone#'+str(i_numZonesDone)+'='+s
-                else:
-                    ls_outputVals[i_ind]=ls_outputVals[i_ind]+','+s    
-
-            if first:
-                ls_outputVals[i_ind]=ls_outputVals[i_ind]+'  zone#'+str(i_numZonesDone)+'=none'
-
-            ls_outputVals[i_ind]=ls_outputVals[i_ind]+'\n'
-
-            if i_numZonesDone==int(ls_outputVals[lli_needs[i_ind][0]].split('=')[1]): 
-                lb_outputs[i_ind]=False
-
-            f_geo.close()
-
-    # Get air flow network.
-    i_ind=11
-    if lb_outputs[i_ind]:
-        if ls_line[0]=='*cnn':
-            i_afn=1
-        elif i_afn==1:
-            if ls_line[0]=='0':
-                ls_outputVals[i_ind]=ls_outputs[i_ind]+'='
-                lb_outputs[i_ind]=False
-            elif ls_line[0]=='1':
-                i_afn=2
-                i_afntyp=1
-            elif ls_line[0]=='3':
-                i_afn=2
-                i_afntyp=3
-        elif i_afn==2:
-            ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+ls_line[0]
-            lb_outputs[i_ind]=False
-
-    # Get contaminant network.
-    i_ind=12
-    if lb_outputs[i_ind]:
-        if ls_line[0]=='*ctm':
-            ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+ls_line[1]
-            lb_outputs[i_ind]=False
-
-    # Get number of contaminants.
-    i_ind=13
-    if lb_outputs[i_ind]:
-        if not lb_outputs[lli_needs[i_ind][0]]:
-            s_ctm=s_cfgPath+'/'+ls_outputVals[lli_needs[i_ind][0]].split('=')[1]
-            f_ctm=open(s_ctm,'r')
-            ls=getLine(f_ctm,5)
-            f_ctm.close()
-            ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+ls[0]
-            lb_outputs[i_ind]=False
-
-    # Get AFN zone node names.
-    i_ind=14
-    if lb_outputs[i_ind]:
-        if not lb_outputs[lli_needs[i_ind][0]]:
-            if i_afn==2:
-                i_afn=3
-            elif i_afn==3:
-                ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+ls_line[0]
-                i_afn+=1
-            elif i_afn>3:
-                ls_outputVals[i_ind]=ls_outputVals[i_ind]+ls_line[0]
-
-    # Get AFN zone node indices.
-    i_ind=15
-    if lb_outputs[i_ind]:
-        if i_afn>3:
-            ls_afnNods=ls_outputVals[lli_needs[i_ind][1]].split('=')[1].split(',')
-            s_afn=s_cfgPath+'/'+ls_outputVals[lli_needs[i_ind][0]].split('=')[1]
-            f_afn=open(s_afn,'r')
-            i_numNods=len(ls_afnNods)
-            ls_nodNums=['0']*i_numNods
-            ls_afnNods_tmp=ls_afnNods[:]
-            if i_afntyp==1:
-                i_nodNum=0
-                for s_line2 in f_afn:
-                    if s_line2[0:70]==' Node         Fld. Type   Height    Temperature    Data_1       Data_2':
-                        i_nodNum=1
-    #                elif s_line2[0:36]==' Component    Type C+ L+ Description':
-    #                    sys.stderr.write('esp-query error: could not find all AFN zone nodes in network\n')
-    #                    sys.exit(1)                    
-                    elif i_nodNum:
-                        ls_line2=s_line2.strip().split()
-                        if ls_line2[0] in ls_afnNods_tmp:
-                            ls_nodNums[ls_afnNods.index(ls_line2[0])]=(str(i_nodNum))
-                            ls_afnNods_tmp.remove(ls_line2[0])
-                            if len(ls_afnNods_tmp)==0:
-                                ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+','.join(ls_nodNums)
-                                break
-                        i_nodNum+=1
-            elif i_afntyp==3:
-                i_nodNum=1
-                for s_line2 in f_afn:
-                    if s_line2[0:5]=='*node':
-                        ls_line2=s_line2.strip().split(',')
-                        if ls_line2[1] in ls_afnNods_tmp:
-                            ls_nodNums[ls_afnNods.index(ls_line2[1])]=(str(i_nodNum))
-                            ls_afnNods_tmp.remove(ls_line2[1])
-                            if len(ls_afnNods_tmp)==0:
-                                ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+','.join(ls_nodNums)
-                                break
-                        i_nodNum+=1
-
-            f_afn.close()
-
-    # Get zone control flag.
-    i_ind=16
-    if lb_outputs[i_ind]:
-        if ls_line[0]=='*ctl':
-            s_ctl=s_cfgPath+'/'+ls_line[1]
-            ls_outputVals[i_ind]=ls_outputs[i_ind]+'=1'
-            lb_outputs[i_ind]=False
-        
-
-    # Get zone control setpoints.
-    i_ind=3
-    if lb_outputs[i_ind]:
-        if not lb_outputs[lli_needs[i_ind][0]] and ls_outputVals[lli_needs[i_ind][0]].split('=')[1]=='1':
-            if ls_line[0]=='*list':
-                i_numDayTypes=int(ls_line[1])
-                f_ctl=open(s_ctl,'r')
-                s=get_zone_setpoints(f_ctl,i_numDayTypes)
-                ls_outputVals[i_ind]=s
-                lb_outputs[i_ind]=False
-
-    # Get tdfa file.
-    i_ind=20
-    if lb_outputs[i_ind]:
-        if ls_line[0]=='*tdf':
-            s_tdfa=s_cfgPath+'/'+ls_line[1]
-            ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+ls_line[1]
-            lb_outputs[i_ind]=False
-
-    # Get tdfa time step.
-    i_ind=21
-    if lb_outputs[i_ind]:
-        if not lb_outputs[lli_needs[i_ind][0]]:
-            f_tdfa=open(s_tdfa,'r')
-            ls_tdfa=getLine(f_tdfa,3)
-            ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+ls_tdfa[2]
-            lb_outputs[i_ind]=False
-            f_tdfa.close()
-
-    # Get tdfa start day.
-    i_ind=22
-    if lb_outputs[i_ind]:
-        if not lb_outputs[lli_needs[i_ind][0]]:
-            f_tdfa=open(s_tdfa,'r')
-            ls_tdfa=getLine(f_tdfa,3)
-            ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+ls_tdfa[4]
-            lb_outputs[i_ind]=False
-            f_tdfa.close()
-
-    # Get tdfa end day.
-    i_ind=23
-    if lb_outputs[i_ind]:
-        if not lb_outputs[lli_needs[i_ind][0]]:
-            f_tdfa=open(s_tdfa,'r')
-            ls_tdfa=getLine(f_tdfa,3)
-            ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+ls_tdfa[5]
-            lb_outputs[i_ind]=False
-            f_tdfa.close()
-
-    # Get number of tdfa entities.
-    i_ind=24
-    if lb_outputs[i_ind]:
-        if not lb_outputs[lli_needs[i_ind][0]]:
-            f_tdfa=open(s_tdfa,'r')
-            ls_tdfa=getLine(f_tdfa,3)
-            ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+ls_tdfa[1]
-            lb_outputs[i_ind]=False
-            f_tdfa.close()
-
-    # Get uncertainties file.
-    i_ind=25
-    if lb_outputs[i_ind]:
-        if ls_line[0]=='*ual':
-            s_ual=s_cfgPath+'/'+ls_line[1]
-            ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+ls_line[1]
-            lb_outputs[i_ind]=False
-
-    # Get number of simulation presets.
-    i_ind=26
-    if lb_outputs[i_ind]:
-        if ls_line[0]=='*sps':
-            ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+ls_line[1]
-            lb_outputs[i_ind]=False
-
-
-            
-
-            
-
-f_cfg.close()
-
-# If any zone item booleans remain, add a null onto the end.
-#for i_ind in [2,6]:
-#    if lb_outputs[i_ind]:
-#        if int(ls_outputVals[lli_needs[i_ind][0]].split('=')[1])==1:        
-#            ls_outputVals[i_ind]=ls_outputs[i_ind]+'=0'
-#        else:
-#            ls_outputVals[i_ind]=ls_outputs[i_ind]+',0'
-#        lb_outputs[i_ind]=False
-
-# Function to add an entry if an item has not been found.
-# if "entry" is not defined, will add a blank entry.
-def addBlank(i_ind,s_entry=''):
-    if lb_outputs[i_ind]:
-        ls_outputVals[i_ind]=ls_outputs[i_ind]+'='+s_entry
-        lb_outputs[i_ind]=False
-
-addBlank(12)
-addBlank(13)
-if lb_outputs[14]:
-    if ls_outputVals[14]=='':
-        addBlank(14)
-        if lb_outputs[15]: addBlank(15)
+        else:
+            s=','.join(ls[2:2+int(ls[1])])
+        return '  zone#'+str(i_zone)+'='+s+'\n'
+    ls=getZoneValues('geo',fn)
+    if ls is None: return None
+    return 'zone_floor_surfs:\n'+''.join(ls)
+
+# Get window surface numbers (transparent exterior surfaces).
+def get_zone_win_surfs():
+    def fn(i_zone,s_file):
+        s_geo=s_cfgPath+'/'+s_file
+        f_geo=getFile(s_geo)
+        n=1
+        while not f_geo.line(n)[0:5]=='*surf':
+            if f_geo.line(n)=='':
+                sys.stderr.write('esp-query: could not find surfaces in file '+s_geo+'\n')
+                sys.exit(1)
+            n+=1
+        ls_surfs=[]
+        i_surf=0
+        while f_geo.line(n)[0:5]=='*surf':
+            i_surf+=1
+            ls=f_geo.line(n).strip().split('#')[0].split(',')
+            n+=1
+            if ls[7]=='OPAQUE' or ls[8]!='EXTERIOR': continue
+            ls_surfs.append(str(i_surf))
+        if not ls_surfs: ls_surfs=['none']
+        return '  zone#'+str(i_zone)+'='+','.join(ls_surfs)+'\n'
+    ls=getZoneValues('geo',fn)
+    if ls is None: return None
+    return 'zone_win_surfs:\n'+''.join(ls)
+
+# Get number of MRT sensors.
+def get_MRT_sensors():
+    def fn(i_zone,s_file):
+        if s_file=='': return '0'
+        return getFile(s_cfgPath+'/'+s_file).split(5)[0]
+    ls=getZoneValues('ivf',fn)
+    if ls is None: return None
+    return 'MRT_sensors='+','.join(ls)
+
+# Get MRT sensor names.
+def get_MRT_sensor_names():
+    def fn(i_zone,s_file):
+        ls2=[]
+        if s_file!='':
+            f_vwf=getFile(s_cfgPath+'/'+s_file)
+            i=0
+            i_countdown1=0
+            i_countdown2=0
+            active1=0
+            active2=0
+            j=0
+            ls3=[]
+            while f_vwf.line(i+1)!='':
+                s_line=f_vwf.line(i+1)
+                i+=1
+                if i_countdown1>0:
+                    i_countdown1-=1
+                    if i_countdown1==0: active1=1
+                if i_countdown2>0:
+                    i_countdown2-=1
+                    if i_countdown2==0: active2=1
+                if i==5:
+                    ls=s_line.strip().split()
+                    i_nsen=int(ls[0])
+                    i_nsur=int(ls[1])
+                elif s_line.strip()=='*MRT_SENSOR':
+                    i_countdown1=2
+                elif active1:
+                    ls=s_line.strip().split()
+                    ls2.append(ls[8])
+                    if len(ls2)==i_nsen: 
+                        break
+                    active1=0
+                elif s_line.strip()=='*MRTVIEW':
+                    i_countdown2=1
+                elif active2:
+                    ls4=s_line.strip().split(',')
+                    if ls4[-1]=='': 
+                        ls4.pop()
+                    ls3+=ls4
+                    if len(ls3)==i_nsur:
+                        ls3=[]
+                        j+=1
+                        if j==6: 
+                            active1=1
+                            active2=0
+                            j=0
+        return '  zone#'+str(i_zone)+'='+','.join(ls2)+'\n'
+    ls=getZoneValues('ivf',fn)
+    if ls is None: return None
+    return 'MRT_sensor_names:\n'+''.join(ls)
+
+# Get CFD domain files.
+def get_CFD_domain_files():
+    def fn(i_zone,s_file):
+        if s_file=='': return ''
+        return s_cfgPath+'/'+s_file
+    ls=getZoneValues('cfd',fn)
+    if ls is None: return None
+    return 'CFD_domain_files='+','.join(ls)
+
+# Get CFD domain indicators.
+def get_CFD_domains():
+    s=getOutput('CFD_domain_files')
+    if s is None: return None
+    ls=[]
+    for s_cfd in s.split('=')[1].split(','):
+        if len(s_cfd)==0:
+            ls.append('0')
+        elif getFile(s_cfd).split(2)[1]=='0':
+            ls.append('1')
+        else:
+            ls.append('2')
+    return 'CFD_domains='+','.join(ls)
+
+# Get CFD contaminants.
+def get_CFD_contaminants():
+    s=getOutput('CFD_domain_files')
+    if s is None: return None
+    s_out='CFD_contaminants:\n'
+    for i_zn,s_cfd in enumerate(s.split('=')[1].split(',')):
+        s=''
+        if len(s_cfd)>0:
+            f_cfd=getFile(s_cfd)
+            i_numContam=0
+            n=1
+            while f_cfd.line(n)!='':
+                ls_cfdLine=f_cfd.split(n)
+                n+=1
+                if not ls_cfdLine: continue
+                if ls_cfdLine[0]=='*contaminants(':
+                    i_numContam=int(ls_cfdLine[1])
+                    if i_numContam==0: 
+                        s='none'
+                        break
+                elif i_numContam>0:
+                    s=s+ls_cfdLine[0]+','
+                    i_numContam-=1
+                    if i_numContam==0:
+                        s=s[:-1]
+                        break
+        s_out=s_out+'  zone#'+str(i_zn+1)+'='+s+'\n'
+    return s_out
+
+# Get radiance viewpoint names.
+def get_rad_viewpoints():
+    i=findCfg('*rif')
+    if i<0: return None
+    s_rcf=getCfg()[i][1]
+    ls=getFile(s_cfgPath+'/'+s_rcf).split(5)
+    assert ls[0]=='*rnm'
+    ls_views=[]
+    for s_line in getFile(s_cfgPath+'/'+path.split(s_rcf)[0]+'/'+ls[1]).lines():
+        ls=s_line.split()
+        if ls and ls[0]=='view=': ls_views.append(ls[1])
+    if not ls_views: return ''
+    return 'rad_viewpoints='+','.join(ls_views)
+
+# Get radiance scene name.
+def get_rad_scene():
+    i=findCfg('*rif')
+    if i<0: return None
+    ls=getFile(s_cfgPath+'/'+getCfg()[i][1]).split(7)
+    assert ls[0]=='*srt'
+    return 'rad_scene='+ls[1]
+
+# Get air flow network.
+def get_afn_network():
+    t=getAFN()
+    if t is None: return None
+    i_afntyp,i=t
+    if i_afntyp==0: return 'afn_network='
+    lls_cfg=getCfg()
+    if i>=len(lls_cfg) or not lls_cfg[i]: return None
+    return 'afn_network='+lls_cfg[i][0]
+
+# Get the first items of the cfg lines after the air flow network file name.
+# These hold the AFN node names of zones. All the remaining lines are taken,
+# and are joined without separators.
+def getAFNzoneNodeItems():
+    i=getAFN()[1]
+    return [ls_line[0] for ls_line in getCfg()[i+1:] if ls_line]
+
+# Get AFN zone node names.
+def get_afn_zone_nodes():
+    s=getOutput('afn_network')
+    if s is None: return None
+    if s=='afn_network=': return 'afn_zone_nodes='
+    return 'afn_zone_nodes='+''.join(getAFNzoneNodeItems())
+
+# Get AFN zone node indices. The indices are found for the node names from
+# the first line after the network, then the first two lines and so on; the
+# last time that all the nodes are found gives the output.
+def get_afn_zon_nod_nums():
+    s=getOutput('afn_zone_nodes')
+    if s is None or getOutput('number_zones') is None: return None
+    if s=='afn_zone_nodes=': return 'afn_zon_nod_nums='
+    i_afntyp=getAFN()[0]
+    ls_afnLines=getFile(s_cfgPath+'/'+getOutput('afn_network').split('=')[1]).lines()
+    ls_items=getAFNzoneNodeItems()
+    s_out=''
+    for k in range(1,len(ls_items)+1):
+        ls_afnNods=''.join(ls_items[:k]).split(',')
+        ls_nodNums=['0']*len(ls_afnNods)
+        ls_afnNods_tmp=ls_afnNods[:]
+        if i_afntyp==1:
+            i_nodNum=0
+            for s_line2 in ls_afnLines:
+                if s_line2[0:70]==' Node         Fld. Type   Height    Temperature    Data_1       Data_2':
+                    i_nodNum=1
+                elif i_nodNum:
+                    ls_line2=s_line2.strip().split()
+                    if not ls_line2: continue
+                    if ls_line2[0] in ls_afnNods_tmp:
+                        ls_nodNums[ls_afnNods.index(ls_line2[0])]=(str(i_nodNum))
+                        ls_afnNods_tmp.remove(ls_line2[0])
+                        if len(ls_afnNods_tmp)==0:
+                            s_out='afn_zon_nod_nums='+','.join(ls_nodNums)
+                            break
+                    i_nodNum+=1
+        elif i_afntyp==3:
+            i_nodNum=1
+            for s_line2 in ls_afnLines:
+                if s_line2[0:5]=='*node':
+                    ls_line2=s_line2.strip().split(',')
+                    if ls_line2[1] in ls_afnNods_tmp:
+                        ls_nodNums[ls_afnNods.index(ls_line2[1])]=(str(i_nodNum))
+                        ls_afnNods_tmp.remove(ls_line2[1])
+                        if len(ls_afnNods_tmp)==0:
+                            s_out='afn_zon_nod_nums='+','.join(ls_nodNums)
+                            break
+                    i_nodNum+=1
+    return s_out
+
+# Get contaminant network.
+def get_ctm_network():
+    i=findCfg('*ctm')
+    if i<0: return 'ctm_network='
+    return 'ctm_network='+getCfg()[i][1]
+
+# Get number of contaminants.
+def get_number_ctm():
+    s=getOutput('ctm_network')
+    if s=='ctm_network=': return 'number_ctm='
+    return 'number_ctm='+getFile(s_cfgPath+'/'+s.split('=')[1]).split(5)[0]
+
+# Get zone control flag.
+def get_zone_control():
+    if findCfg('*ctl')<0: return 'zone_control=0'
+    return 'zone_control=1'
+
+# Get zone control setpoints, from the control file and the number of
+# calender day types (first *list line after *ctl).
+def get_zone_setpoints():
+    if getOutput('zone_control')=='zone_control=0': return 'zone_setpoints='
+    i_ctl=findCfg('*ctl')
+    i=findCfg('*list',i_ctl+1)
+    if i<0: return None
+    f_ctl=io.StringIO(''.join(getFile(s_cfgPath+'/'+getCfg()[i_ctl][1]).lines()))
+    return scan_zone_setpoints(f_ctl,int(getCfg()[i][1]))
+
+# Get tdfa file, and values from its header.
+def get_tdfa_file():
+    i=findCfg('*tdf')
+    if i<0: return 'tdfa_file='
+    return 'tdfa_file='+getCfg()[i][1]
+
+def getTdfaHeader(s_name,i):
+    s=getOutput('tdfa_file')
+    if s=='tdfa_file=': return s_name+'='
+    return s_name+'='+getFile(s_cfgPath+'/'+s.split('=')[1]).split(3)[i]
+
+def get_tdfa_timestep(): return getTdfaHeader('tdfa_timestep',2)
+def get_tdfa_startday(): return getTdfaHeader('tdfa_startday',4)
+def get_tdfa_endday(): return getTdfaHeader('tdfa_endday',5)
+def get_tdfa_entities(): return getTdfaHeader('tdfa_entities',1)
+
+# Get uncertainties file.
+def get_uncertainties_file():
+    i=findCfg('*ual')
+    if i<0: return 'uncertainties_file='
+    return 'uncertainties_file='+getCfg()[i][1]
+
+# Get number of simulation presets.
+def get_number_presets():
+    i=findCfg('*sps')
+    if i<0: return 'number_presets=0'
+    return 'number_presets='+getCfg()[i][1]
+
+dict_values={}
+
+# Files read and warnings written by the outputs being evaluated, as a stack
+# of (set of files, list of warnings), one for each output.
+lt_evaluating=[]
+
+# FUNCTION getOutput
+# Get an output by name, from the index or by evaluating it if not already
+# done.
+def getOutput(s_output):
+    global b_indexChanged
+    if s_output not in dict_values:
+        dict_entry=getIndexed(s_output)
+        if dict_entry is not None:
+            for s in dict_entry['warnings']:
+                warn(s)
+            for set_files,ls_warnings in lt_evaluating:
+                set_files.update(dict_entry['files'])
+            dict_values[s_output]=dict_entry['value']
+        else:
+            lt_evaluating.append((set([path.abspath(s_cfgPath+'/'+s_cfgFile)]),[]))
+            s=globals()['get_'+s_output]()
+            set_files,ls_warnings=lt_evaluating.pop()
+            for set_parent,ls_parent in lt_evaluating:
+                set_parent.update(set_files)
+            if s_indexFile and s is not None:
+                dict_model['outputs'][s_output]={'value':s,'warnings':ls_warnings,
+                                                 'files':{s_file:getStat(s_file) for s_file in set_files}}
+                b_indexChanged=True
+            dict_values[s_output]=s
+    return dict_values[s_output]
+# END FUNCTION
+
+
+# FUNCTION evaluateOutputs
+# Get the requested outputs.
+# Returns a list of outputs (or outputs they need) that have not been found.
+def evaluateOutputs():
+    global lb_display,li_order,ls_outputVals
+    i_numOutputs=len(ls_outputs)
+    lb_display=[False]*i_numOutputs
+    li_order=[0]*i_numOutputs
+    ls_outputVals=['']*i_numOutputs
+    for i,s_output in enumerate(ls_outputs):
+        if s_output in ls_inOutputs:
+            lb_display[i]=True
+            li_order[i]=ls_inOutputs.index(s_output)
+            s=getOutput(s_output)
+            if s is not None: ls_outputVals[i]=s
+    writeIndex()
+    return [s for s in ls_outputs if s in dict_values and dict_values[s] is None]
+# END FUNCTION
+
+# FUNCTION queryModel
+# Query one model of a batch, in a new process. s_model is a cfg file or a
+# model archive.
+# Returns a dictionary of {"model": s_model} and the JSON outputs (see
+# toJSON), with "warnings" listing any warnings, or if the model could not be
+# queried, {"model": s_model, "error": "[error text]"}.
+def queryModel(s_model):
+    global archive,s_inCfgFile,s_cfgPath,s_cfgFile
+    # Keep errors and warnings for the JSON line.
+    sys.stderr=io.StringIO()
+    dict_out={'model':s_model}
+    try:
+        if s_model.endswith(('.zip','.tar','.tar.gz','.tgz')):
+            archive=ModelArchive(s_model)
+            s_inCfgFile=archive.findCfg()
+        else:
+            s_inCfgFile=s_model
+        s_cfgPath,s_cfgFile=path.split(s_inCfgFile)
+        if s_cfgPath=='': s_cfgPath='.'
+        ls_errors=evaluateOutputs()
+        if len(ls_errors)>0:
+            dict_out['error']='some information could not be retrieved - '+','.join(ls_errors)
+        else:
+            dict_out.update(toJSON())
+    except SystemExit:
+        # Error text has been written.
+        dict_out['error']=''
+    except Exception as e:
+        dict_out['error']=str(e)
+    ls_messages=sys.stderr.getvalue().splitlines()
+    if 'error' in dict_out:
+        dict_out['error']=' '.join(ls_messages+[dict_out['error']]).strip()
+    elif ls_messages:
+        dict_out['warnings']=ls_messages
+    return dict_out
+# END FUNCTION
+
+
+if b_batch:
+# Query each model in its own process, writing JSON lines as they finish.
+    if s_inCfgFile=='-':
+        f_list=sys.stdin
     else:
-        lb_outputs[14]=False
-        if lb_outputs[15]: lb_outputs[15]=False
-        
-if lb_outputs[lli_needs[3][0]]: addBlank(3)
-addBlank(16,s_entry='0')
-addBlank(20)
-addBlank(21)
-addBlank(22)
-addBlank(23)
-addBlank(24)
-addBlank(25)
-addBlank(26,s_entry='0')
-
-# If any booleans remain, something has not been found - throw an error.
-if True in lb_outputs:
+        f_list=open(s_inCfgFile,'r')
+    ls_models=[s.strip() for s in f_list if s.strip()!='' and not s.startswith('#')]
+    if not f_list is sys.stdin: f_list.close()
+    b_failed=False
+    pool=get_context('fork').Pool(args.processes or cpu_count(),maxtasksperchild=1)
+    for dict_out in pool.imap_unordered(queryModel,ls_models):
+        if 'error' in dict_out: b_failed=True
+        s=json.dumps(dict_out)
+        if s_outputFile:
+            f_output.write(s+'\n')
+            f_output.flush()
+        else:
+            print(s,flush=True)
+    pool.close()
+    pool.join()
+    if b_failed: sys.exit(1)
+    sys.exit(0)
+
+# Get requested outputs.
+ls_errors=evaluateOutputs()
+
+# If any output (or an output it needs) has not been found, throw an error.
+if len(ls_errors)>0:
     sys.stderr.write('esp-query error: some information could not be retrieved -\n')
-    li_errors=[a for a,b in enumerate(lb_outputs) if b]
-    for i in li_errors:
-        sys.stderr.write(ls_outputs[i]+'\n')
+    for s in ls_errors:
+        sys.stderr.write(s+'\n')
     sys.exit(1)
+elif b_json:
+# Write JSON output.
+    s=json.dumps(toJSON(),indent=1)
+    if s_outputFile:
+        f_output.write(s+'\n')
+    else:
+        print(s)
 else:
 # Write output.
+    ls_outputText=['']*len(ls_inOutputs)
     for i,b in enumerate(lb_display):
         if b:
             ls_outputText[li_order[i]]=ls_outputVals[i]
@@ -804,4 +1083,3 @@ else:
         f_output.write('\n\n'.join(ls_outputText))
     else:
         print('\n\n'.join(ls_outputText))
-
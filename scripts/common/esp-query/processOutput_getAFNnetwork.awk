@@ -1,10 +0,0 @@
-BEGIN {
-  FS="="
-}
-
-{
-  if ($1=="afn_network") { 
-    print $2
-    exit
-  }
-}
@@ -1,10 +0,0 @@
-BEGIN {
-  FS="="
-}
-
-{
-  if ($1=="model_description") { 
-    print $2
-    exit
-  }
-}
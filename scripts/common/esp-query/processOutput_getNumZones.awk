@@ -1,10 +0,0 @@
-BEGIN {
-  FS="="
-}
-
-{ 
-  if ($1=="number_zones") {
-    print $2
-    exit
-  }
-}
@@ -1,10 +0,0 @@
-BEGIN {
-  FS="="
-}
-
-{
-  if ($1=="uncertainties_file") { 
-    print $2
-    exit
-  }
-}
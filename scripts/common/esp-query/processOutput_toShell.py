@@ -0,0 +1,63 @@
+#! /usr/bin/env python3
+
+# processOutput_toShell.py
+# Script to convert the JSON output of esp-query.py (-j) into bash variable
+# assignments, so that a PAM can load every output with one process:
+#   eval "$(processOutput_toShell.py query_results.json)"
+# Each output becomes a variable named query_[key], and outputs in a group
+# query_[group]_[key] (e.g. query_tdfa_timestep). Lists are space separated,
+# flags are 1 or 0, and blank values are empty. Per-zone outputs become bash
+# arrays named query_zone_[key], indexed by zone number (from 1), e.g.
+# ${query_zone_floor_surfs[2]} or ${query_zone_MRT_sensors[*]}. Outputs with
+# nested lists (zone_setpoints) are not converted.
+
+import sys,json,shlex
+
+# FUNCTION toShell
+# Convert a JSON value to a shell word, or None if it cannot be converted.
+def toShell(v):
+    if v is None:
+        return ''
+    elif isinstance(v,bool):
+        return '1' if v else '0'
+    elif isinstance(v,list):
+        ls=[toShell(a) for a in v]
+        if None in ls: return None
+        return ' '.join(ls)
+    elif isinstance(v,dict):
+        return None
+    else:
+        return str(v)
+# END FUNCTION
+
+# FUNCTION assignments
+# Get the assignments for a dictionary of outputs, with variable names
+# prefixed by s_prefix.
+def assignments(dict_in,s_prefix):
+    ls_out=[]
+    for s_key,v in dict_in.items():
+        if s_key=='zones':
+            for s_zoneKey in v[0] if v else []:
+                if s_zoneKey=='index': continue
+                ls=[]
+                for dict_zone in v:
+                    s=toShell(dict_zone[s_zoneKey])
+                    if s is not None:
+                        ls.append('['+str(dict_zone['index'])+']='+shlex.quote(s))
+                ls_out.append(s_prefix+'zone_'+s_zoneKey+'=('+' '.join(ls)+')')
+        elif isinstance(v,dict) and s_key!='zone_setpoints':
+            ls_out+=assignments(v,s_prefix+s_key+'_')
+        else:
+            s=toShell(v)
+            if s is not None:
+                ls_out.append(s_prefix+s_key+'='+shlex.quote(s))
+    return ls_out
+# END FUNCTION
+
+if len(sys.argv)!=2:
+    sys.stderr.write('Usage: processOutput_toShell.py query_results.json\n')
+    sys.exit(1)
+f_json=open(sys.argv[1],'r')
+dict_query=json.load(f_json)
+f_json.close()
+print('\n'.join(assignments(dict_query,'query_')))
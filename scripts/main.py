@@ -16,52 +16,98 @@
 # -d, --debug - service prints debug information to standard out,
 #               and jobs print debug information to "[jobID].log"
 #               in the job folder (../jobs/job_[jobID]).
+# --max-jobs=N - maximum number of jobs to run at once (default: number
+#                of CPUs); further requested jobs are queued.
+# --worker-id=ID - identifies this instance of the service when several
+#                  share the same database (default: host name).
+# --cache-size=MB - size limit of each of the results and model caches in
+#                   megabytes (default: 10240); 0 disables the caches.
+# --pam-limit=PAM=N - maximum number of jobs of assessment PAM to run at once
+#                     (default: 4 for wireframe, 2 for visual_comfort, no
+#                     limit other than --max-jobs for others); can be given
+#                     more than once.
 
 # Command line arguments:
 # 1: path to shared folder
 # 2: [optional] dispatch interval in seconds
 
 import sys
-from os.path import isfile,isdir,realpath,dirname,basename
-from os import devnull,makedirs,chdir,kill,remove,rename
+from os.path import isfile,isdir,realpath,relpath,dirname,basename,getmtime,getsize
+from os import devnull,makedirs,chdir,kill,remove,rename,walk,utime,stat,cpu_count,read,close,O_NONBLOCK,O_CLOEXEC
 from subprocess import run,Popen,PIPE,STDOUT
 from time import sleep,time
+from select import select
 from multiprocessing import Process,Pipe
+from multiprocessing.connection import wait
+import json
 import re
+import hashlib
 from datetime import datetime
 from shutil import copytree,copyfile,rmtree,move
 from glob import glob
 import signal
+import fcntl
+from socket import gethostname
 from mysql import connector
+from mysql.connector import pooling
 import ctypes
 from setproctitle import setproctitle
+sys.path.insert(0,dirname(realpath(__file__))+'/common/autocal')
+import espcfg
 
 ### FUNCTION: runJob
 # This runs a performance assessment on an ESP-r model. This should be run in a
 # seperate process, otherwise errors will terminate the main script. If
 # debugging is active, a log file will be written out to "[jobID].log". If the
 # job fails due to an error, a file called "[jobID.err]" will be written out
-# containing the error message.
+# containing the error message. The job records each stage it completes in
+# "checkpoints.json" in the job folder; if the job folder already holds a
+# manifest for the same job parameters (i.e. the job is being restarted,
+# whether it was running or queued again), completed stages whose files are
+# unchanged are skipped.
+# If i_cacheLimit is more than 0, extracted models and results are looked up
+# in and stored in the model and results caches (see modelCacheKey and
+# resultsCacheKey), each of which is kept under i_cacheLimit bytes.
 
-def runJob(s_jobID,s_tarball,s_MD5,s_building,s_estate,s_simStart,s_simStop,s_PAM,b_debug,con,s_shareDir):
+def runJob(s_jobID,s_tarball,s_MD5,s_building,s_estate,s_simStart,s_simStop,s_PAM,b_debug,con,s_shareDir,i_cacheLimit=0):
 
     setproctitle('APASS'+s_jobID)
 
+    # Check for a valid checkpoint manifest from the last run of this job, if
+    # any. Stages recorded in it will not be repeated.
     s_jobDir=getJobDir(s_jobID)
+    s_params='|'.join([s_tarball,str(s_MD5),s_estate,s_simStart,s_simStop,s_PAM])
+    dict_ckpt=None
     if isdir(s_jobDir):
-        rmtree(s_jobDir)
-    makedirs(s_jobDir)
-    chdir(s_jobDir)
+        dict_ckpt=readCheckpoints(s_jobDir+'/checkpoints.json',s_params)
 
-    # Create a directory for the outputs.
-    makedirs('outputs')
+    if dict_ckpt is None:
+        if isdir(s_jobDir):
+            rmtree(s_jobDir)
+        makedirs(s_jobDir)
+        chdir(s_jobDir)
 
-    # Create temporary directory.
-    makedirs('tmp')
+        # Create a directory for the outputs.
+        makedirs('outputs')
+
+        # Create temporary directory.
+        makedirs('tmp')
+
+        dict_ckpt={'file':s_jobDir+'/checkpoints.json','params':s_params,'stages':[]}
+    else:
+        chdir(s_jobDir)
+    ls_done=[dict_stage['name'] for dict_stage in dict_ckpt['stages']]
+    dict_data={}
+    for dict_stage in dict_ckpt['stages']:
+        dict_data.update(dict_stage['data'])
 
     curDateTime=datetime.now()
     if b_debug:
-        f_log=open(s_jobID+'.log','w')
+        if ls_done:
+            f_log=open(s_jobID+'.log','a')
+            f_log.write('\n*** JOB RESUMED, completed stages: '+', '.join(ls_done)+' ***\n')
+        else:
+            f_log=open(s_jobID+'.log','w')
         s_dateTime=curDateTime.strftime('%a %b %d %X %Y')
         f_log.write('*** JOB STARTED @ '+s_dateTime+' ***\nJobID: '+s_jobID+'\n')
     else:
@@ -83,205 +129,277 @@ def runJob(s_jobID,s_tarball,s_MD5,s_building,s_estate,s_simStart,s_simStop,s_PA
     s_modelFile=s_shareDir+'/Models/'+s_tarball
     s_ext=s_tarball.split('.',1)[1]
 
-    # Get model.
-    if b_debug: f_log.write('Retrieving model file '+s_modelFile+'\n')
-
-    # # If there is an MD5 checksum passed from the front end, get checksum of the model file and compare them.
-    # # Wait up to 100 seconds for model to appear and checksums to match.  
-    # if not s_MD5sum is None:
-    #     if b_debug: f_log.write('Checking MD5 checksum ...\n')  
-    #     if b_debug: f_log.write('Checksum from front end: '+s_MD5sum+'\n')
-    #     s_MD5sum=s_MD5sum.strip()
-    #     i_count=0
-    #     s_modelMD5=''
-    #     while True:
-    #         try:
-    #             s_modelMD5=run(['md5sum',s_modelFile],check=True,sdtout=PIPE,text=True).stdout.split()[0]
-    #         except:
-    #             pass            
-    #         if b_debug:f_log.write('Local checksum: '+s_modelMD5+'\n')
-    #         if s_modelMD5==s_MD5sum: break
-    #         i_count+=1
-    #         if i_count>10:            
-    #             # Timeout.
-    #             jobError(s_jobID,'Timeout while waiting for model file "'+s_model+'"',11,b_debug,f_log,s_shareDir)
-    #         if b_debug: f_log.write('Checksum does not match, waiting ...\n')
-    #         sleep(10)
-    #     if b_debug: f_log.write('Checksum verified.\n')
-    # else:
-    #     if b_debug: f_log.write('MD5 checksum not found.\n')
-
-    # Now get the model.
-    try:
-        copyfile(s_modelFile,'./'+s_tarball)
-    except:
-        # Error - cannot find model.
-        jobError(s_jobID,'error retrieving model "'+s_tarball+'"',11,b_debug,f_log,s_shareDir)
+    # Each stage below records a checkpoint when it completes. Stages already
+    # recorded are skipped, restoring whatever values later stages need.
+    # Stage: model.
+    if 'model' in ls_done:
+        s_cfg=dict_data['cfg']
+        if b_debug: f_log.write('Resuming: model already retrieved, cfg file: '+s_cfg+'\n')
     else:
-        if s_ext=='zip':
-            ls_extract=['unzip']
-        elif s_ext=='tar' or s_ext=='tar.gz':
-            ls_extract=['tar','-xf']
-        elif s_ext=='xml':
-            ls_extract=['../../scripts/common/gbXMLconv/gbXMLconv.sh']
-        else:
-            jobError(s_jobID,'unrecognised model archive format (.zip, .tar, .tar.gz and .xml (gbXML) supported)',16,b_debug,f_log,s_shareDir)
-        try:
-            run(ls_extract+[s_tarball],check=True)
-            remove(s_tarball)
-        except:
-            jobError(s_jobID,'failed to extract model',16,b_debug,f_log,s_shareDir)
-        
-    # Move model into folder called "model".
-    ls_dirs=[a for a in glob('./*') if not a=='./tmp' and not a=='./outputs' and isdir(a)]
-    makedirs('model')
-    if len(ls_dirs)==1:
-    # One directory found, probably means the model directories are inside this.
-        try:
-            run(['mv','-t','model']+glob('./'+ls_dirs[0]+'/*'),check=True)
-        except:
-            jobError(s_jobID,'failed to extract model',16,b_debug,f_log,s_shareDir)
-        rmtree(ls_dirs[0])
-    else:
-        try:
-            run(['mv','-t','model']+ls_dirs,check=True)  
-        except:
-            jobError(s_jobID,'failed to extract model',16,b_debug,f_log,s_shareDir)
-
-    # Find cfg file. Must be only one in the cfg directory.
-    ls_cfg=glob('model/cfg/*.cfg')
-    if len(ls_cfg)==0:
-        jobError(s_jobID,'cfg file not found in model cfg directory',13,b_debug,f_log,s_shareDir)
-    elif len(ls_cfg)>1:
-        jobError(s_jobID,'more than one cfg file found in model cfg directory',14,b_debug,f_log,s_shareDir)
-    s_cfg=ls_cfg[0]
-    if b_debug: f_log.write('Building: '+s_building+'\nModel: '+s_modelFile+'\ncfg file: '+s_cfg+'\n\n')
+        # Get model.
+        if b_debug: f_log.write('Retrieving model file '+s_modelFile+'\n')
+
+        # # If there is an MD5 checksum passed from the front end, get checksum of the model file and compare them.
+        # # Wait up to 100 seconds for model to appear and checksums to match.  
+        # if not s_MD5sum is None:
+        #     if b_debug: f_log.write('Checking MD5 checksum ...\n')  
+        #     if b_debug: f_log.write('Checksum from front end: '+s_MD5sum+'\n')
+        #     s_MD5sum=s_MD5sum.strip()
+        #     i_count=0
+        #     s_modelMD5=''
+        #     while True:
+        #         try:
+        #             s_modelMD5=run(['md5sum',s_modelFile],check=True,sdtout=PIPE,text=True).stdout.split()[0]
+        #         except:
+        #             pass            
+        #         if b_debug:f_log.write('Local checksum: '+s_modelMD5+'\n')
+        #         if s_modelMD5==s_MD5sum: break
+        #         i_count+=1
+        #         if i_count>10:            
+        #             # Timeout.
+        #             jobError(s_jobID,'Timeout while waiting for model file "'+s_model+'"',11,b_debug,f_log,s_shareDir)
+        #         if b_debug: f_log.write('Checksum does not match, waiting ...\n')
+        #         sleep(10)
+        #     if b_debug: f_log.write('Checksum verified.\n')
+        # else:
+        #     if b_debug: f_log.write('MD5 checksum not found.\n')
+
+        # Look for the extracted model in the model cache.
+        s_modelKey=None
+        b_modelCached=False
+        if i_cacheLimit>0:
+            try:
+                s_modelKey=modelCacheKey(s_modelFile,s_MD5)
+                b_modelCached=fetchCachedModel(s_modelKey)
+            except Exception as e:
+                if isdir('model'): rmtree('model')
+                if b_debug: f_log.write('Model cache lookup failed: '+str(e)+'\n')
+            if b_modelCached:
+                updateCacheStats('models',{'hits':1})
+                if b_debug: f_log.write('Model found in model cache, key '+s_modelKey+'\n')
+            else:
+                updateCacheStats('models',{'misses':1})
+
+        if not b_modelCached:
+            # Now get the model.
+            try:
+                copyfile(s_modelFile,'./'+s_tarball)
+            except:
+                # Error - cannot find model.
+                jobError(s_jobID,'error retrieving model "'+s_tarball+'"',11,b_debug,f_log,s_shareDir)
+            else:
+                if s_ext=='zip':
+                    ls_extract=['unzip']
+                elif s_ext=='tar' or s_ext=='tar.gz':
+                    ls_extract=['tar','-xf']
+                elif s_ext=='xml':
+                    ls_extract=['../../scripts/common/gbXMLconv/gbXMLconv.sh']
+                else:
+                    jobError(s_jobID,'unrecognised model archive format (.zip, .tar, .tar.gz and .xml (gbXML) supported)',16,b_debug,f_log,s_shareDir)
+                try:
+                    run(ls_extract+[s_tarball],check=True)
+                    remove(s_tarball)
+                except:
+                    jobError(s_jobID,'failed to extract model',16,b_debug,f_log,s_shareDir)
+
+            # Move model into folder called "model".
+            ls_dirs=[a for a in glob('./*') if not a=='./tmp' and not a=='./outputs' and isdir(a)]
+            makedirs('model')
+            if len(ls_dirs)==1:
+            # One directory found, probably means the model directories are inside this.
+                try:
+                    run(['mv','-t','model']+glob('./'+ls_dirs[0]+'/*'),check=True)
+                except:
+                    jobError(s_jobID,'failed to extract model',16,b_debug,f_log,s_shareDir)
+                rmtree(ls_dirs[0])
+            else:
+                try:
+                    run(['mv','-t','model']+ls_dirs,check=True)  
+                except:
+                    jobError(s_jobID,'failed to extract model',16,b_debug,f_log,s_shareDir)
+
+            # Store the extracted model in the model cache.
+            if not s_modelKey is None:
+                try:
+                    storeCachedModel(s_modelKey,s_jobID,i_cacheLimit)
+                except Exception as e:
+                    if b_debug: f_log.write('Failed to store model in model cache: '+str(e)+'\n')
+
+        # Find cfg file. Must be only one in the cfg directory.
+        ls_cfg=glob('model/cfg/*.cfg')
+        if len(ls_cfg)==0:
+            jobError(s_jobID,'cfg file not found in model cfg directory',13,b_debug,f_log,s_shareDir)
+        elif len(ls_cfg)>1:
+            jobError(s_jobID,'more than one cfg file found in model cfg directory',14,b_debug,f_log,s_shareDir)
+        s_cfg=ls_cfg[0]
+        if b_debug: f_log.write('Building: '+s_building+'\nModel: '+s_modelFile+'\ncfg file: '+s_cfg+'\n\n')
+
+        writeCheckpoint(dict_ckpt,'model',['model/cfg'],{'cfg':s_cfg})
     s_cfgdir=dirname(s_cfg)
 
+    # Working directory for chips, so that jobs for the same estate do not
+    # share any files.
+    s_chipsDir=s_jobDir+'/tmp/chips'
+
     # Take estate "NUI Galway" to mean "NUIG".
     if s_estate=='NUI Galway': s_estate='NUIG'
 
-    # If estate is "Challenger" or "NUIG", try running chips to get weather from BEMserver.
-    if s_estate=='Challenger' or s_estate=='NUIG':
-        if b_debug: f_log.write(s_estate+' estate detected, attempting to gather weather data from BEMserver ...\n')
-        try:
-            run('../../scripts/common/chips/get_H2G_clm.sh '+s_estate+' '+s_simStart+' '+s_simStop+' >tmp/chips.out 2>&1',shell=True,check=True)
-        except:            
-            if b_debug: f_log.write('Failed, will use weather data referenced in cfg file.\n\n')
-        else:
-            if b_debug: f_log.write('Done.\n')
-            # Grab the climate file that we've created and dump it in the model/dbs folder.
-            move('../../scripts/common/chips/'+s_estate+'.clm',s_cfgdir+'/../dbs/'+s_estate+'.clm')
-            # Change the climate file reference in the model cfg file.
-            run(['sed','-e','s/^\*\(std\)*clm .*$/*clm ..\/dbs\/'+s_estate+'.clm/','-i',s_cfg])            
-            if b_debug: f_log.write('Climate file reference in cfg file changed to ../dbs/'+s_estate+'.clm\n\n')
-
-    # If estate is "NUIG", and running a thermal comfort PAM, try running chips to get measured data for calibration.
-    # i_calStatus: 
-    #  -2 = no calibration attempted, no uncertainties
-    #  -1 = no calibration attempted, estate not recognised
-    #   0 = calibration success
-    #   1 = error in chips (most likely data unavailable)
-    #   2 = error in calibro
-    #   3 = error in autocal
-    #   4 = error in esp-query
-    #   5 = error in service
-
-    if s_estate=='NUIG' and (s_PAM=='ISO7730_thermal_comfort' or s_PAM=='CIBSE_thermal_comfort'):
-        i_calStatus=0
-        if b_debug: f_log.write(s_estate+' estate and thermal comfort PAM detected, attempting to calibrate with measured data ...\n')
-
-        # Run esp-query.
-        if b_debug: f_log.write('Runnung esp-query ...\n')
-        try:
-            output=run(['../../scripts/common/esp-query/esp-query.py',s_cfg,'tdfa_file','tdfa_timestep','tdfa_entities','uncertainties_file','number_presets'],check=True,stdout=PIPE,encoding='utf-8').stdout
-        except:
-            i_calStatus=4
-            if b_debug: f_log.write('Failed.\n')
-        else:
-            if b_debug: f_log.write('Success.\n')
-
-        # Check for uncertainties definition.
-        if not i_calStatus:
-            if b_debug: f_log.write('Checking for uncetainties ...\n')
+    # Stage: climate.
+    if 'climate' in ls_done:
+        if b_debug: f_log.write('Resuming: climate stage already complete.\n')
+    else:
+        # If estate is "Challenger" or "NUIG", try running chips to get weather from BEMserver.
+        if s_estate=='Challenger' or s_estate=='NUIG':
+            if b_debug: f_log.write(s_estate+' estate detected, attempting to gather weather data from BEMserver ...\n')
             try:
-                m=re.search(r'^uncertainties_file=(\S*)$',output,re.M)  
-                if m.group(1)=='':
-                    i_calStatus=-2
-                    if b_debug: f_log.write('Not found, cannot calibrate.\n')
-                elif isfile(s_cfgdir+'/'+m.group(1)):
-                    if b_debug: f_log.write('Found.\n')
-                else:
-                    i_calStatus=5
-                    if b_debug: f_log.write('Failed.\n')
+                run('../../scripts/common/chips/get_H2G_clm.sh '+s_estate+' '+s_simStart+' '+s_simStop+' '+s_chipsDir+' >tmp/chips.out 2>&1',shell=True,check=True)
+            except:            
+                if b_debug: f_log.write('Failed, will use weather data referenced in cfg file.\n\n')
+            else:
+                if b_debug: f_log.write('Done.\n')
+                # Grab the climate file that we've created and dump it in the model/dbs folder.
+                move(s_chipsDir+'/'+s_estate+'.clm',s_cfgdir+'/../dbs/'+s_estate+'.clm')
+                # Change the climate file reference in the model cfg file.
+                run(['sed','-e','s/^\*\(std\)*clm .*$/*clm ..\/dbs\/'+s_estate+'.clm/','-i',s_cfg])            
+                if b_debug: f_log.write('Climate file reference in cfg file changed to ../dbs/'+s_estate+'.clm\n\n')
+
+        writeCheckpoint(dict_ckpt,'climate',['model/cfg','model/dbs'],{})
+
+    # Stage: calibration.
+    if 'calibration' in ls_done:
+        s_cfg=dict_data['cfg']
+        i_calStatus=dict_data['calStatus']
+        if b_debug: f_log.write('Resuming: calibration stage already complete, cfg file: '+s_cfg+'\n')
+    else:
+        # If estate is "NUIG", and running a thermal comfort PAM, try running chips to get measured data for calibration.
+        # i_calStatus: 
+        #  -2 = no calibration attempted, no uncertainties
+        #  -1 = no calibration attempted, estate not recognised
+        #   0 = calibration success
+        #   1 = error in chips (most likely data unavailable)
+        #   2 = error in calibro
+        #   3 = error in autocal
+        #   4 = error in esp-query
+        #   5 = error in service
+
+        if s_estate=='NUIG' and (s_PAM=='ISO7730_thermal_comfort' or s_PAM=='CIBSE_thermal_comfort'):
+            i_calStatus=0
+            if b_debug: f_log.write(s_estate+' estate and thermal comfort PAM detected, attempting to calibrate with measured data ...\n')
+
+            # Run esp-query.
+            if b_debug: f_log.write('Runnung esp-query ...\n')
+            try:
+                dict_query=json.loads(run(['../../scripts/common/esp-query/esp-query.py','-c','tmp/esp-query_index.json','-j',s_cfg,'tdfa_file','tdfa_timestep','uncertainties_file'],check=True,stdout=PIPE,encoding='utf-8').stdout)
             except:
-                i_calStatus=5
+                i_calStatus=4
                 if b_debug: f_log.write('Failed.\n')
+            else:
+                if b_debug: f_log.write('Success.\n')
 
-        # Check if the model has an existing tdfa file.
-        if not i_calStatus:
-            if b_debug: f_log.write('Checking for existing temporal data ...\n')
-            try:
-                m=re.search(r'^tdfa_file=(\S*)$',output,re.M)
-                if m.group(1)=='':
-                    is_tdfa=False
-                    s_tdfaTimestep='1'
-                    if b_debug: f_log.write('Not found.\n')
-                elif isfile(s_cfgdir+'/'+m.group(1)):
-                    is_tdfa=True
-                    s_tdfaFile=s_cfgdir+'/'+m.group(1)
-                    m=re.search(r'^tdfa_timestep=(\S*)$',output,re.M)
-                    s_tdfaTimestep=m.group(1)
-                    m=re.search(r'^tdfa_entities=(\S*)$',output,re.M)
-                    s_tdfaEntities=m.group(1)
-                    if b_debug: f_log.write('Found.\n')
-                else:
+            # Check for uncertainties definition.
+            if not i_calStatus:
+                if b_debug: f_log.write('Checking for uncetainties ...\n')
+                try:
+                    s_ual=dict_query['uncertainties_file']
+                    if s_ual is None:
+                        i_calStatus=-2
+                        if b_debug: f_log.write('Not found, cannot calibrate.\n')
+                    elif isfile(s_cfgdir+'/'+s_ual):
+                        if b_debug: f_log.write('Found.\n')
+                    else:
+                        i_calStatus=5
+                        if b_debug: f_log.write('Failed.\n')
+                except:
                     i_calStatus=5
                     if b_debug: f_log.write('Failed.\n')
-            except:
-                i_calStatus=5
-                if b_debug: f_log.write('Failed.\n')
 
-        # Fetch data from BEMserver.
-        if not i_calStatus:
-            if b_debug: f_log.write('Fetching data from H2G platform ...\n')
-            try:
-                run('../../scripts/common/chips/get_H2G_cal.sh '+s_estate+' '+s_simStart+' '+s_simStop+' '+s_tdfaTimestep+' >tmp/chips.out 2>&1',shell=True,check=True)
-            except:            
-                i_calStatus=1
-                if b_debug: f_log.write('Failed.\n\n')
-            else:
-                if b_debug: f_log.write('Success.\n')
-        
-        # Put data into tdfa.
-        if not i_calStatus:
-            if is_tdfa:
-                if b_debug: f_log.write('Adding measured data to existing tdfa ...\n')
+            # Check if the model has an existing tdfa file.
+            if not i_calStatus:
+                if b_debug: f_log.write('Checking for existing temporal data ...\n')
                 try:
-                    run(['../../scripts/common/autocal/createTdfa.py',s_estate,s_simStart,s_simStop,s_tdfaTimestep],check=True)
-                    assert isfile(s_cfgdir+'/../dbs/measured_data.tdfa')
+                    dict_tdfa=dict_query['tdfa']
+                    if dict_tdfa['file'] is None:
+                        is_tdfa=False
+                        s_tdfaTimestep='1'
+                        if b_debug: f_log.write('Not found.\n')
+                    elif isfile(s_cfgdir+'/'+dict_tdfa['file']):
+                        is_tdfa=True
+                        s_tdfaFile=s_cfgdir+'/'+dict_tdfa['file']
+                        s_tdfaTimestep=str(dict_tdfa['timestep'])
+                        if b_debug: f_log.write('Found.\n')
+                    else:
+                        i_calStatus=5
+                        if b_debug: f_log.write('Failed.\n')
                 except:
-                    i_calStatus=3
+                    i_calStatus=5
+                    if b_debug: f_log.write('Failed.\n')
+
+            # Fetch data from BEMserver.
+            if not i_calStatus:
+                if b_debug: f_log.write('Fetching data from H2G platform ...\n')
+                try:
+                    run('../../scripts/common/chips/get_H2G_cal.sh '+s_estate+' '+s_simStart+' '+s_simStop+' '+s_tdfaTimestep+' '+s_chipsDir+' >tmp/chips.out 2>&1',shell=True,check=True)
+                except:            
+                    i_calStatus=1
                     if b_debug: f_log.write('Failed.\n\n')
                 else:
                     if b_debug: f_log.write('Success.\n')
-            else:
-                if b_debug: f_log.write('Converting measured data to new tdfa ...\n')
+        
+            # Put data into tdfa.
+            # i_calItem is the index of the first measured data item in the tdfa.
+            if not i_calStatus:
+                if is_tdfa:
+                    if b_debug: f_log.write('Adding measured data to existing tdfa ...\n')
+                    try:
+                        # addToTdfa.py prints the index of the item, which may have
+                        # replaced an existing item with the same tag.
+                        res=run(['../../scripts/common/autocal/addToTdfa.py',s_estate,s_simStart,s_simStop,s_tdfaTimestep,s_tdfaFile,s_chipsDir+'/measured_data.csv'],check=True,encoding='utf-8',stdout=PIPE)
+                        i_calItem=int(res.stdout.split()[-1])
+                    except:
+                        i_calStatus=3
+                        if b_debug: f_log.write('Failed.\n\n')
+                    else:
+                        if b_debug: f_log.write('Success.\n')
+                else:
+                    if b_debug: f_log.write('Converting measured data to new tdfa ...\n')
+                    try:
+                        run(['../../scripts/common/autocal/createTdfa.py',s_estate,s_simStart,s_simStop,s_tdfaTimestep,s_chipsDir+'/measured_data.csv'],check=True)
+                        assert isfile(s_cfgdir+'/../dbs/measured_data.tdfa')
+                        i_calItem=1
+                    except:
+                        i_calStatus=3
+                        if b_debug: f_log.write('Failed.\n\n')
+                    else:
+                        if b_debug: f_log.write('Success.\n')
+
+            # Reference a new tdfa and add a simulation preset in the model cfg
+            # file. This is done directly (see espcfg.py), and the cfg file is
+            # only written if the changes validate.
+            if not i_calStatus:
+                if b_debug: f_log.write('Adding tdfa and simulation preset to model ...\n')
                 try:
-                    run(['../../scripts/common/autocal/createTdfa.py',s_estate,s_simStart,s_simStop,s_tdfaTimestep],check=True)
-                    assert isfile(s_cfgdir+'/../dbs/measured_data.tdfa')
-                except:
+                    dict_cfg=espcfg.read(s_cfg)
+                    if not is_tdfa: espcfg.set_tdf(dict_cfg,'../dbs/measured_data.tdfa')
+                    i_numPresets=len(espcfg.get_presets(dict_cfg))
+                    if b_debug: f_log.write('... '+str(i_numPresets)+' existing presets detected ...\n')
+                    s_presetName='H2Gcal'
+                    s_presetLetter=chr(ord('a')+i_numPresets)
+                    i_startup=5
+                    t_simStart=(int(s_simStart[0:2]),int(s_simStart[3:5]))
+                    t_simStop=(int(s_simStop[0:2]),int(s_simStop[3:5]))
+                    espcfg.add_preset(dict_cfg,s_presetName,i_startup,int(s_tdfaTimestep),t_simStart,t_simStop)
+                    espcfg.write(dict_cfg)
+                except (OSError,ValueError,IndexError) as e:
                     i_calStatus=3
-                    if b_debug: f_log.write('Failed.\n\n')
+                    if b_debug: f_log.write('Failed: '+str(e)+'\n\n')
                 else:
                     if b_debug: f_log.write('Success.\n')
 
-        # Associate new tdfa with model.
-        if not i_calStatus:
-            if is_tdfa:
+            # Associate the measured data item with the model.
+            if not i_calStatus:
                 if b_debug: f_log.write('Addding association to model ...\n')
                 try:
-                    res=run(['../../scripts/common/autocal/addCalAssociation.sh',s_estate,str(int(s_tdfaEntities)+1)],check=True,text=True,stdout=PIPE,stderr=STDOUT)
+                    res=run(['../../scripts/common/autocal/addCalAssociation.sh',s_estate,str(i_calItem)],check=True,text=True,stdout=PIPE,stderr=STDOUT)
                 except:
                     i_calStatus=3
                     if b_debug: 
@@ -289,80 +407,60 @@ def runJob(s_jobID,s_tarball,s_MD5,s_building,s_estate,s_simStart,s_simStop,s_PA
                         f_log.write(res.stdout)
                 else:
                     if b_debug: f_log.write('Success.\n')
-            else:
-                if b_debug: f_log.write('Associating tdfa with model ...\n')
+
+            # We should now be ready to calibrate.
+            if not i_calStatus:
+                if b_debug: f_log.write('Running calibration ...\n')
                 try:
-                    res=run(['../../scripts/common/autocal/associateTdfa.sh',s_estate],check=True,encoding='utf-8',stdout=PIPE,stderr=STDOUT)
+                    res=run(['../../scripts/common/autocal/runCalibration.sh',s_estate,s_presetLetter,s_presetName,s_ual],check=True,encoding='utf-8',stdout=PIPE,stderr=STDOUT)
                 except:
-                    i_calStatus=3
+                    i_calStatus=2
                     if b_debug: 
                         f_log.write('Failed, output follows ...\n')
                         f_log.write(res.stdout)
                 else:
                     if b_debug: f_log.write('Success.\n')
 
-        # Create a simulation preset.
-        # First, detect how many existing presets.
-        if not i_calStatus:
-            if b_debug: f_log.write('Adding a simulation preset ...\n')
-            try:
-                m=re.search(r'^number_presets=(\S*)$',output,re.M)  
-                if m.group(1)=='':
-                    i_calStatus=5
-                    if b_debug: f_log.write('Failed to find number of existing presets.\n')
-                else:
-                    s_numPresets=m.group(1)
-                    i_numPresets=int(m.group(1))
-                    assert i_numPresets>=0
-                    if b_debug: f_log.write('... '+s_numPresets+' existing presets detected ...\n')
-            except:
-                i_calStatus=5
-                if b_debug: f_log.write('Failed to find number of existing presets.\n')
+            # If calibration succesfull, use calibrated model for PAM, 
+            # and copy calibro outputs to outputs folder.
+            if not i_calStatus:
+                s_cfg=s_cfg.rsplit('.')[0]+'_cal.cfg'
+                copyfile(s_cfgdir+'/calibro_report.pdf','outputs/calibro_report.pdf')
+                copyfile(s_cfgdir+'/calibro_report.json','outputs/calibro_report.json')
 
-        if not i_calStatus:
-            try:
-                s_presetName='H2Gcal'
-                s_presetLetter=chr(ord('a')+i_numPresets)
-                s_startup='5'
-                s_simStartDayMonth=s_simStart[0:2]+' '+s_simStart[3:5]
-                s_simStopDayMonth=s_simStop[0:2]+' '+s_simStop[3:5]
-                if i_numPresets==0:
-                    s_isExisting='false'
-                else:
-                    s_isExisting='true'
-                res=run(['../../scripts/common/autocal/createSimulationPreset.sh',s_presetName,s_presetLetter,s_startup,s_tdfaTimestep,s_simStartDayMonth,s_simStopDayMonth,s_isExisting],check=True,encoding='utf-8',stdout=PIPE,stderr=STDOUT)
-            except:
-                i_calStatus=3
-                if b_debug: 
-                    f_log.write('Failed to add a preset, output follows ...\n')
-                    f_log.write(res.stdout)
-            else:
-                if b_debug: f_log.write('Success.\n')
+            if b_debug: f_log.write('\n')
 
-        # We should now be ready to calibrate.
-        if not i_calStatus:
-            if b_debug: f_log.write('Running calibration ...\n')
-            try:
-                res=run(['../../scripts/common/autocal/runCalibration.sh',s_estate,s_presetLetter],check=True,encoding='utf-8',stdout=PIPE,stderr=STDOUT)
-            except:
-                i_calStatus=2
-                if b_debug: 
-                    f_log.write('Failed, output follows ...\n')
-                    f_log.write(res.stdout)
-            else:
-                if b_debug: f_log.write('Success.\n')
-
-        # If calibration succesfull, use calibrated model for PAM, 
-        # and copy calibro outputs to outputs folder.
-        if not i_calStatus:
-            s_cfg=s_cfg.rsplit('.')[0]+'_cal.cfg'
-            copyfile(s_cfgdir+'/calibro_report.pdf','outputs/calibro_report.pdf')
-            copyfile(s_cfgdir+'/calibro_report.json','outputs/calibro_report.json')
+        else:
+            i_calStatus=-1
 
-        if b_debug: f_log.write('\n')
 
+        writeCheckpoint(dict_ckpt,'calibration',['model/cfg','outputs'],{'cfg':s_cfg,'calStatus':i_calStatus})
+    # Stage: cache.
+    # Look for results of an identical job in the results cache. This is done
+    # after calibration, so that any climate or measured data fetched for the
+    # job is part of the model and therefore part of the key.
+    if 'cache' in ls_done:
+        s_cacheKey=dict_data['cacheKey']
+        b_cacheHit=dict_data['cacheHit']
     else:
-        i_calStatus=-1
+        s_cacheKey=None
+        b_cacheHit=False
+        if i_cacheLimit>0 and s_PAM!='wireframe':
+            try:
+                s_cacheKey=resultsCacheKey(s_PAM,s_simStart,s_simStop,s_estate,s_building)
+                dict_meta=fetchCachedResults(s_cacheKey,s_jobID)
+            except Exception as e:
+                dict_meta=None
+                if b_debug: f_log.write('Results cache lookup failed: '+str(e)+'\n')
+            if dict_meta is None:
+                updateCacheStats('results',{'misses':1})
+                if b_debug: f_log.write('Results cache miss, key '+str(s_cacheKey)+'\n\n')
+            else:
+                b_cacheHit=True
+                dict_data['pflag']=dict_meta['pflag']
+                updateCacheStats('results',{'hits':1})
+                if b_debug: f_log.write('Results cache hit, key '+s_cacheKey+', results from job '+dict_meta['jobID']+'\n\n')
+        writeCheckpoint(dict_ckpt,'cache',['outputs','tmp/cached'],{'cacheKey':s_cacheKey,'cacheHit':b_cacheHit,'pflag':dict_data.get('pflag')})
 
     if i_calStatus<0:
         s_calStatus='Not attempted'
@@ -428,106 +526,135 @@ Calibration: '''+s_calStatus+''' \\\\
     if b_debug: 
         f_log.write('calling performance assessment with command: '+' '.join([s_PAMscript]+ls_args)+'\n')
 
-    # Send running signal.
-    i_prgv=2
-    con.send(i_prgv)
+    # Stage: assessment.
+    if 'assessment' in ls_done:
+        if b_debug: f_log.write('Resuming: performance assessment already complete.\n')
+    elif b_cacheHit:
+        if b_debug: f_log.write('Using cached results, performance assessment not needed.\n')
 
-    # Run PAM.
-    proc=Popen([s_PAMscript]+ls_args,stdout=PIPE,stderr=PIPE,preexec_fn=set_pdeathsig(signal.SIGKILL))
-
-    # Read file tmp/progress.txt every second to keep track of progress.
-    # Progress = ...
-    # 1: job started
-    # 2: starting PAM
-    # 3: PAM checkpoint 1 (e.g. simulating)
-    # 4: PAM checkpoint 2 (e.g. extracting results)
-    # 5: PAM checkpoint 3 (e.g. post-processing results)
-    # 6: PAM checkpoint 4 (e.g. further simulations)
-    # 7: PAM checkpoint 5 (e.g. further post-processing)
-    # 8: PAM generating reports
-    # 9: uploading results
-    # 0: job complete
-    s_prg='tmp/progress.txt'
-    i_prgp=i_prgv
-    while proc.poll()==None:
-        sleep(1)
-        if isfile(s_prg):
-            f_prg=open(s_prg,'r')
-            i_prgv=int(f_prg.readline().strip())
-            f_prg.close()
-        if i_prgv>i_prgp:
-            con.send(i_prgv)
-            i_prgp=i_prgv
+        # The cached reports carry the preamble of the job that made them, so
+        # rebuild them with this job's preamble. If that fails, run the
+        # assessment after all.
+        if b_debug: f_log.write('Rebuilding cached reports ...\n')
+        try:
+            rebuildCachedReports()
+        except Exception as e:
+            b_cacheHit=False
+            if b_debug: f_log.write('Failed: '+str(e)+'\n')
+        else:
+            if b_debug: f_log.write('Success.\n')
 
-    # Final progress value.
-    if isfile(s_prg):
-        f_prg=open(s_prg,'r')
-        i_prgv=int(f_prg.readline().strip())
-        f_prg.close()
-    if i_prgv>i_prgp:
+    if not ('assessment' in ls_done or b_cacheHit):
+        # Send running signal.
+        i_prgv=2
         con.send(i_prgv)
 
-    t_tmp=(proc.stdout.read(),proc.stderr.read())
+        # Run PAM, keeping track of progress through file tmp/progress.txt.
+        # Progress = ...
+        # 1: job started
+        # 2: starting PAM
+        # 3: PAM checkpoint 1 (e.g. simulating)
+        # 4: PAM checkpoint 2 (e.g. extracting results)
+        # 5: PAM checkpoint 3 (e.g. post-processing results)
+        # 6: PAM checkpoint 4 (e.g. further simulations)
+        # 7: PAM checkpoint 5 (e.g. further post-processing)
+        # 8: PAM generating reports
+        # 9: uploading results
+        # 0: job complete
+        (i_PAMexit,i_prgv)=runPAM([s_PAMscript]+ls_args,'tmp/progress.txt',i_prgv,con,'tmp/PAM.out','tmp/PAM.err',set_pdeathsig(signal.SIGKILL))
+
+        t_tmp=[]
+        for s_file in ['tmp/PAM.out','tmp/PAM.err']:
+            f=open(s_file,'r',errors='replace')
+            t_tmp.append(f.read())
+            f.close()
+
+        if b_debug:
+            f_log.write('\nPerformance assessment finished, output follows:\n'+t_tmp[0]+'\n')
+        if i_PAMexit!=0:
+            jobError(s_jobID,'Performance assessment failed.\n\nstderr:\n'+t_tmp[1]+'\n\nstdout:\n'+t_tmp[0]+'\n\n',i_PAMexit,b_debug,f_log,s_shareDir)
+
+        # This also overrides a cache hit whose reports could not be rebuilt.
+        writeCheckpoint(dict_ckpt,'assessment',['tmp/pflag.txt','outputs','simulation_results.*'],{'cacheHit':False})
+
+    # Stage: results.
+    if 'results' in ls_done or b_cacheHit:
+        if b_debug and not b_cacheHit: f_log.write('Resuming: results already processed.\n')
+        if not b_dummy: i_pFlag=dict_data['pflag']
+    else:
+        # Get performance flag.
+        if not b_dummy:
+            proc=Popen(['awk','-f','../../scripts/common/get_performanceFlag.awk','tmp/pflag.txt'],stdout=PIPE)
+            t_tmp=proc.communicate()
+            s_pFlag=t_tmp[0].decode().strip()
+            if s_pFlag=='0':
+                i_pFlag=0
+            elif s_pFlag=='1':
+                i_pFlag=1
+            else:
+                jobError(s_jobID,'Unrecognised compliance flag "'+s_pFlag+'"\n',18,b_debug,f_log,s_shareDir)
 
-    if b_debug:
-        f_log.write('\nPerformance assessment finished, output follows:\n'+t_tmp[0].decode()+'\n')
-    if proc.returncode!=0:
-        jobError(s_jobID,'Performance assessment failed.\n\nstderr:\n'+t_tmp[1].decode()+'\n\nstdout:\n'+t_tmp[0].decode()+'\n\n',proc.returncode,b_debug,f_log,s_shareDir)
-
-    # Get performance flag.
-    if not b_dummy:
-        proc=Popen(['awk','-f','../../scripts/common/get_performanceFlag.awk','tmp/pflag.txt'],stdout=PIPE)
-        t_tmp=proc.communicate()
-        s_pFlag=t_tmp[0].decode().strip()
-        if s_pFlag=='0':
-            i_pFlag=0
-        elif s_pFlag=='1':
-            i_pFlag=1
-        else:
-            jobError(s_jobID,'Unrecognised compliance flag "'+s_pFlag+'"\n',18,b_debug,f_log,s_shareDir)
+            # Write model and output URLs to JSON.
+            run(['sed','-e','s/"report": "",/"report": "https:\/\/mae-esru.mecheng.strath.ac.uk\/liveservices\/APASS\/Results\/'+s_jobID+'\/report.pdf",/','-i',s_tmpjson])
+            run(['sed','-e','s/"results libraries": ""/"results libraries": "https:\/\/mae-esru.mecheng.strath.ac.uk\/liveservices\/APASS\/Results\/'+s_jobID+'\/res.tar.gz"/','-i',s_tmpjson])
 
-        # Write model and output URLs to JSON.
-        run(['sed','-e','s/"report": "",/"report": "https:\/\/mae-esru.mecheng.strath.ac.uk\/liveservices\/APASS\/Results\/'+s_jobID+'\/report.pdf",/','-i',s_tmpjson])
-        run(['sed','-e','s/"results libraries": ""/"results libraries": "https:\/\/mae-esru.mecheng.strath.ac.uk\/liveservices\/APASS\/Results\/'+s_jobID+'\/res.tar.gz"/','-i',s_tmpjson])
+        writeCheckpoint(dict_ckpt,'results',['outputs'],{'pflag':None if b_dummy else i_pFlag})
 
-    # Upload job results.
-    # Send uploading signal.
-    i_prgv=9
-    con.send(i_prgv)
+    # Stage: upload.
+    if 'upload' in ls_done:
+        if b_debug: f_log.write('Resuming: outputs already uploaded.\n')
+        s_DBjobDir=s_shareDir+'/Results/'+s_jobID
+    else:
+        # Upload job results.
+        # Send uploading signal.
+        i_prgv=9
+        con.send(i_prgv)
 
-    # If not a dummy PAM, create tarball of simulation results and model (because you need the model to view results).
-    if not b_dummy:
-        ls_simRes=glob('simulation_results.*')
-        try:
-            run(['tar','-czf','res.tar.gz','model']+ls_simRes,check=True)
-        except:
-            jobError(s_jobID,'Could not create simulation results tarball\n',18,b_debug,f_log,s_shareDir)
-        else:
-            run(['mv','-t','outputs','res.tar.gz'])
-            run(['rm']+ls_simRes)
+        # If not a dummy PAM, create tarball of simulation results and model (because you need the model to view results).
+        # Cached results already include the tarball.
+        if not b_dummy and not b_cacheHit:
+            ls_simRes=glob('simulation_results.*')
+            try:
+                run(['tar','-czf','res.tar.gz','model']+ls_simRes,check=True)
+            except:
+                jobError(s_jobID,'Could not create simulation results tarball\n',18,b_debug,f_log,s_shareDir)
+            else:
+                run(['mv','-t','outputs','res.tar.gz'])
+                run(['rm']+ls_simRes)
 
-    # TEMPORARY
-    # Overwrite report with detailed report.
-    rename('outputs/detailed_report.pdf','outputs/report.pdf')
+        # TEMPORARY
+        # Overwrite report with detailed report.
+        if isfile('outputs/detailed_report.pdf'):
+            rename('outputs/detailed_report.pdf','outputs/report.pdf')
 
-    if b_debug: f_log.write('Copying outputs to shared folder ...\n')
-    s_DBjobDir=s_shareDir+'/Results/'+s_jobID
-    try:
-        rmtree(s_DBjobDir)
-    except OSError:
-        pass
-    makedirs(s_DBjobDir)
-    ls_outputs=glob('outputs/*')
-    for s_output in ls_outputs:
-        if b_debug: f_log.write('Copying '+basename(s_output)+' ...\n')
-        if isfile(s_output):
-            copyfile(s_output,s_DBjobDir+'/'+basename(s_output))
-        elif isdir(s_output):            
-            copytree(s_output,s_DBjobDir+'/'+basename(s_output))
-        else:            
-            jobError(s_jobID,'Could not copy file "'+s_output+'"\n',18,b_debug,f_log,s_shareDir)
-
-    if b_debug: f_log.write('Done.\n')
+        # Store results in the results cache.
+        if not s_cacheKey is None and not b_cacheHit:
+            if b_debug: f_log.write('Storing results in results cache ...\n')
+            try:
+                storeCachedResults(s_cacheKey,s_jobID,i_pFlag,i_cacheLimit)
+            except Exception as e:
+                if b_debug: f_log.write('Failed: '+str(e)+'\n')
+
+        if b_debug: f_log.write('Copying outputs to shared folder ...\n')
+        s_DBjobDir=s_shareDir+'/Results/'+s_jobID
+        try:
+            rmtree(s_DBjobDir)
+        except OSError:
+            pass
+        makedirs(s_DBjobDir)
+        ls_outputs=glob('outputs/*')
+        for s_output in ls_outputs:
+            if b_debug: f_log.write('Copying '+basename(s_output)+' ...\n')
+            if isfile(s_output):
+                copyfile(s_output,s_DBjobDir+'/'+basename(s_output))
+            elif isdir(s_output):            
+                copytree(s_output,s_DBjobDir+'/'+basename(s_output))
+            else:            
+                jobError(s_jobID,'Could not copy file "'+s_output+'"\n',18,b_debug,f_log,s_shareDir)
+
+        if b_debug: f_log.write('Done.\n')
+
+        writeCheckpoint(dict_ckpt,'upload',['outputs'],{})
 
     curDateTime=datetime.now()
     s_dateTime=curDateTime.strftime('%a %b %d %X %Y')
@@ -553,6 +680,113 @@ Calibration: '''+s_calStatus+''' \\\\
 ### END FUNCTION
 
 
+### FUNCTION: runPAM
+# Runs a performance assessment script (command ls_cmd), and sends progress
+# values to pipe connection con as the script writes them to progress file
+# s_prg. i_prgv is the last progress value sent. Changes to the progress file
+# are picked up as they happen, using inotify on the directory containing it;
+# if inotify is not available, the file is checked every second instead.
+# The script's stdout and stderr are streamed into files s_out and s_err while
+# it runs, so it can never stall on a full pipe. Each file is capped at
+# i_logLimit bytes, further output is discarded.
+# Returns the script's exit code and the final progress value.
+def runPAM(ls_cmd,s_prg,i_prgv,con,s_out,s_err,preexec_fn,i_logLimit=10485760):
+
+    # Set up inotify watch for files written in the progress file's directory.
+    # Flags from sys/inotify.h.
+    IN_CLOSE_WRITE=0x00000008
+    IN_MOVED_TO=0x00000080
+    libc=ctypes.CDLL('libc.so.6',use_errno=True)
+    i_inotify=libc.inotify_init1(O_NONBLOCK|O_CLOEXEC)
+    if i_inotify>=0:
+        s_dir=dirname(s_prg)
+        if s_dir=='': s_dir='.'
+        if libc.inotify_add_watch(i_inotify,s_dir.encode(),IN_CLOSE_WRITE|IN_MOVED_TO)<0:
+            close(i_inotify)
+            i_inotify=-1
+
+    proc=Popen(ls_cmd,stdout=PIPE,stderr=PIPE,preexec_fn=preexec_fn)
+
+    # Output files and number of bytes received, by pipe file descriptor.
+    dict_streams={proc.stdout.fileno():[open(s_out,'wb'),0],
+                  proc.stderr.fileno():[open(s_err,'wb'),0]}
+    li_fds=list(dict_streams)
+    if i_inotify>=0: li_fds.append(i_inotify)
+
+    i_prgp=i_prgv
+    r_checked=time()
+    while True:
+        li_ready=select(li_fds,[],[],1.0)[0]
+        b_check=False
+        for i_fd in li_ready:
+            if i_fd==i_inotify:
+                # Drain events; we only need to know that something was written.
+                try:
+                    while read(i_inotify,4096): pass
+                except BlockingIOError:
+                    pass
+                b_check=True
+                continue
+            by_out=read(i_fd,65536)
+            if not by_out:
+                # End of file, script has closed this stream.
+                li_fds.remove(i_fd)
+                continue
+            l_stream=dict_streams[i_fd]
+            if l_stream[1]<i_logLimit:
+                l_stream[0].write(by_out[:i_logLimit-l_stream[1]])
+                if l_stream[1]+len(by_out)>i_logLimit:
+                    l_stream[0].write(b'\n[... output truncated ...]\n')
+            l_stream[1]+=len(by_out)
+
+        if i_inotify<0 and time()-r_checked>=1.0:
+            b_check=True
+        if b_check:
+            r_checked=time()
+            i_prgv=readProgress(s_prg,i_prgv)
+            if i_prgv>i_prgp:
+                con.send(i_prgv)
+                i_prgp=i_prgv
+
+        # Finish once both streams are closed, or if the script has exited
+        # and nothing more is arriving (e.g. a background process it left
+        # behind is holding the streams open).
+        if not any([a in li_fds for a in dict_streams]): break
+        if len(li_ready)==0 and proc.poll()!=None: break
+
+    proc.wait()
+    for l_stream in dict_streams.values():
+        l_stream[0].close()
+    proc.stdout.close()
+    proc.stderr.close()
+    if i_inotify>=0: close(i_inotify)
+
+    # Final progress value.
+    i_prgv=readProgress(s_prg,i_prgv)
+    if i_prgv>i_prgp:
+        con.send(i_prgv)
+
+    return proc.returncode,i_prgv
+
+### END FUNCTION
+
+
+### FUNCTION: readProgress
+# Reads a progress value from progress file s_prg. If the file does not exist
+# or does not contain an integer (e.g. it is part way through being written),
+# returns the previous value i_prgv.
+def readProgress(s_prg,i_prgv):
+    try:
+        f_prg=open(s_prg,'r')
+        s_prgv=f_prg.readline().strip()
+        f_prg.close()
+        return int(s_prgv)
+    except (OSError,ValueError):
+        return i_prgv
+
+### END FUNCTION
+
+
 ### FUNCTION: jobError
 # Writes an error file for a simulation job and exits with a fail code.
 # If debugging, closes the log file. 
@@ -614,18 +848,27 @@ def jobError(s_jobID,s_message,i_errorCode,b_debug,f_log,s_shareDir):
 ### END FUNCTION
 
 
-### FUNCTION: sleepTilNext
-# Checks the time elapsed since startTime (obtained from time() built-in),
-# compares it with r_interval, and sleeps for any remaining time.
-def sleepTilNext(start_time,r_interval,b_debug):
+### FUNCTION: waitTilNext
+# Checks the time elapsed since start_time (obtained from time() built-in),
+# then waits until time r_nextPoll, when the next scheduled dispatch is due.
+# If any of the job pipe connections or process sentinels in l_waitables
+# become ready first (i.e. a job sends a signal or exits), returns early with
+# a list of those that are ready. Otherwise, returns an empty list.
+def waitTilNext(start_time,r_nextPoll,l_waitables,b_debug):
     end_time=time()
     time_taken=end_time-start_time
     if b_debug: print("APASS: dispatch took "+'{:.2f}'.format(time_taken)+" seconds")
-    if time_taken<r_interval:
-        if b_debug: print('APASS: sleeping for '+'{:.2f}'.format(r_interval-time_taken)+' seconds')
-        sleep(r_interval-time_taken)
-    else:
+    r_wait=r_nextPoll-end_time
+    if r_wait<=0:
         if b_debug: print("APASS: I'm late! I'm late!")
+        return []
+    if b_debug: print('APASS: waiting for up to '+'{:.2f}'.format(r_wait)+' seconds')
+    if len(l_waitables)==0:
+        sleep(r_wait)
+        return []
+    l_ready=wait(l_waitables,timeout=r_wait)
+    if b_debug and len(l_ready)>0: print('APASS: job activity detected')
+    return l_ready
 
 ### END FUNCTION
 
@@ -641,6 +884,389 @@ def getJobDir(s_jobID):
 ### END FUNCTION
 
 
+### FUNCTION: readCheckpoints
+# Reads the checkpoint manifest s_file left in a job directory by an earlier
+# run of the job. Returns None if there is no usable manifest, or if it was
+# written for different job parameters s_params. Otherwise, the last stage
+# whose recorded files are unchanged is taken as the point to resume from,
+# and the manifest is returned with any stages after it dropped.
+def readCheckpoints(s_file,s_params):
+    try:
+        f=open(s_file,'r')
+        dict_ckpt=json.load(f)
+        f.close()
+    except (OSError,ValueError):
+        return None
+    if dict_ckpt.get('params')!=s_params:
+        return None
+    s_dir=dirname(s_file)
+    ls_stages=dict_ckpt.get('stages',[])
+    for i in range(len(ls_stages),0,-1):
+        dict_stage=ls_stages[i-1]
+        if hashPaths(s_dir,dict_stage['paths'])==dict_stage['hash']:
+            dict_ckpt['stages']=ls_stages[:i]
+            dict_ckpt['file']=s_file
+            return dict_ckpt
+    return None
+
+### END FUNCTION
+
+### FUNCTION: writeCheckpoint
+# Records completion of stage s_stage in the checkpoint manifest dict_ckpt,
+# with a hash of the files it produced (ls_paths) and any values later stages
+# need (dict_data). The manifest file is replaced atomically.
+def writeCheckpoint(dict_ckpt,s_stage,ls_paths,dict_data):
+    s_file=dict_ckpt['file']
+    dict_ckpt['stages'].append({'name':s_stage,'paths':ls_paths,'hash':hashPaths(dirname(s_file),ls_paths),'data':dict_data})
+    f=open(s_file+'.tmp','w')
+    json.dump({'params':dict_ckpt['params'],'stages':dict_ckpt['stages']},f,indent=1)
+    f.close()
+    rename(s_file+'.tmp',s_file)
+
+### END FUNCTION
+
+### FUNCTION: hashPaths
+# Returns a SHA-1 hash of the names and contents of files at paths ls_paths,
+# relative to directory s_dir. Paths may be glob patterns or directories,
+# which are descended into.
+def hashPaths(s_dir,ls_paths):
+    h=hashlib.sha1()
+    for s_path in ls_paths:
+        h.update((s_path+'\0').encode())
+        ls_files=[]
+        for s_match in sorted(glob(s_dir+'/'+s_path)):
+            if isdir(s_match):
+                for s_root,ls_subdirs,ls_names in walk(s_match):
+                    if '__pycache__' in ls_subdirs: ls_subdirs.remove('__pycache__')
+                    ls_subdirs.sort()
+                    ls_files+=[s_root+'/'+s_name for s_name in sorted(ls_names)]
+            else:
+                ls_files.append(s_match)
+        for s_file in ls_files:
+            h.update((relpath(s_file,s_dir)+'\0').encode())
+            try:
+                f=open(s_file,'rb')
+                while True:
+                    chunk=f.read(1048576)
+                    if not chunk: break
+                    h.update(chunk)
+                f.close()
+            except OSError:
+                h.update(b'\0')
+    return h.hexdigest()
+
+### END FUNCTION
+
+### FUNCTION: getCacheDir
+# Returns the directory of cache s_cache ("results" or "models"). Like the job
+# directories, this is relative to the location of this script, i.e.
+# "../cache/[s_cache]".
+def getCacheDir(s_cache):
+    s_cacheDir=dirname(realpath(__file__))+'/../cache/'+s_cache
+    return s_cacheDir
+
+### END FUNCTION
+
+### FUNCTION: resultsCacheKey
+# Returns the results cache key for a job, run from the job directory once
+# the model is ready for assessment. The key is a hash of the job parameters,
+# the model and any outputs so far (which include any climate or measured
+# data fetched for the job), and the assessment scripts and this script, so
+# that changes to any of them invalidate cached results.
+def resultsCacheKey(s_PAM,s_simStart,s_simStop,s_estate,s_building):
+    s_scriptDir=dirname(realpath(__file__))
+    h=hashlib.sha1()
+    h.update('|'.join([s_PAM,s_simStart,s_simStop,s_estate,s_building]).encode())
+    h.update(hashPaths('.',['model','outputs']).encode())
+    h.update(hashPaths(s_scriptDir,['main.py','assessments','common/esp-query','common/get_performanceFlag.awk']).encode())
+    return h.hexdigest()
+
+### END FUNCTION
+
+### FUNCTION: fetchCachedResults
+# Copies cached results for key s_key into the outputs directory of job
+# s_jobID, run from the job directory. URLs in data.json are changed to point
+# at this job's results, and the report sources are copied to tmp/cached for
+# rebuildCachedReports. Returns the cache entry's metadata (source job ID and
+# performance flag), or None if there is no entry.
+def fetchCachedResults(s_key,s_jobID):
+    s_entry=getCacheDir('results')+'/'+s_key
+    try:
+        f=open(s_entry+'/meta.json','r')
+        dict_meta=json.load(f)
+        f.close()
+    except (OSError,ValueError):
+        return None
+
+    # Mark entry as recently used.
+    utime(s_entry+'/meta.json')
+
+    for s_file in glob(s_entry+'/outputs/*'):
+        s_output='outputs/'+basename(s_file)
+        if isdir(s_file):
+            if isdir(s_output): rmtree(s_output)
+            copytree(s_file,s_output)
+        else:
+            copyfile(s_file,s_output)
+
+    if isfile('outputs/data.json'):
+        f=open('outputs/data.json','r')
+        s=f.read()
+        f.close()
+        f=open('outputs/data.json','w')
+        f.write(s.replace('/Results/'+dict_meta['jobID']+'/','/Results/'+s_jobID+'/'))
+        f.close()
+
+    if isdir('tmp/cached'): rmtree('tmp/cached')
+    if isdir(s_entry+'/tmp'): copytree(s_entry+'/tmp','tmp/cached/tmp')
+
+    return dict_meta
+
+### END FUNCTION
+
+### FUNCTION: reportSources
+# Returns the files in the tmp directory of a job, run from the job
+# directory, that its reports are built from: the preamble, the latex files,
+# and the files these include (referenced as {tmp/...}).
+def reportSources():
+    ls_files=['tmp/preamble.txt']
+    for s_tex in ['tmp/report.tex','tmp/detailed_report.tex']:
+        if not isfile(s_tex): continue
+        ls_files.append(s_tex)
+        f=open(s_tex,'r')
+        s=f.read()
+        f.close()
+        for s_file in re.findall(r'\{(tmp/[^{}]+)\}',s):
+            if isfile(s_file) and not s_file in ls_files: ls_files.append(s_file)
+    return ls_files
+
+### END FUNCTION
+
+### FUNCTION: rebuildCachedReports
+# Rebuilds the pdf reports of cached results with this job's preamble (which
+# holds the request time, model name etc.), run from the job directory after
+# the preamble is written. The report sources are those copied to tmp/cached
+# by fetchCachedResults; the latex files are stamped copies, so this can be
+# repeated if the job is resumed. Raises ValueError if there are no sources,
+# or their preamble is not found in them, and CalledProcessError if lualatex
+# fails.
+def rebuildCachedReports():
+    s_dir='tmp/cached'
+    if not isfile(s_dir+'/tmp/report.tex'):
+        raise ValueError('no cached report sources')
+    f=open(s_dir+'/tmp/preamble.txt','r')
+    s_old=f.read()
+    f.close()
+    f=open('tmp/preamble.txt','r')
+    s_new=f.read()
+    f.close()
+    for s_name in ['report','detailed_report']:
+        if not isfile(s_dir+'/tmp/'+s_name+'.tex'): continue
+        f=open(s_dir+'/tmp/'+s_name+'.tex','r')
+        s=f.read()
+        f.close()
+        if not s_old in s:
+            raise ValueError('preamble not found in cached '+s_name+'.tex')
+        s_stamped='tmp/'+s_name+'_stamped'
+        f=open(s_dir+'/'+s_stamped+'.tex','w')
+        f.write(s.replace(s_old,s_new))
+        f.close()
+
+        # Compile three times, as the PAMs do, for longtable.
+        if isfile(s_dir+'/'+s_stamped+'.aux'): remove(s_dir+'/'+s_stamped+'.aux')
+        for i in range(3):
+            run(['lualatex','-halt-on-error','-output-directory=tmp',s_stamped+'.tex'],cwd=s_dir,stdout=PIPE,stderr=STDOUT,check=True)
+        copyfile(s_dir+'/'+s_stamped+'.pdf','outputs/'+s_name+'.pdf')
+
+### END FUNCTION
+
+### FUNCTION: storeCachedResults
+# Stores the outputs directory of job s_jobID, run from the job directory, in
+# the results cache under key s_key, with performance flag i_pFlag, along with
+# the report sources (see reportSources) so a hit can rebuild the reports with
+# its own preamble. Entries
+# are written to a temporary directory and renamed into place, so a partly
+# written entry is never used. Least recently used entries are then evicted
+# until the cache is no bigger than i_limit bytes.
+def storeCachedResults(s_key,s_jobID,i_pFlag,i_limit):
+    s_cacheDir=getCacheDir('results')
+    s_entry=s_cacheDir+'/'+s_key
+    if isdir(s_entry): return
+    s_tmp=s_cacheDir+'/.'+s_key+'.'+s_jobID
+    if isdir(s_tmp): rmtree(s_tmp)
+    makedirs(s_tmp)
+    copytree('outputs',s_tmp+'/outputs')
+    for s_file in reportSources():
+        makedirs(s_tmp+'/'+dirname(s_file),exist_ok=True)
+        copyfile(s_file,s_tmp+'/'+s_file)
+    f=open(s_tmp+'/meta.json','w')
+    json.dump({'jobID':s_jobID,'pflag':i_pFlag},f)
+    f.close()
+    try:
+        rename(s_tmp,s_entry)
+    except OSError:
+        # Another job stored the same results first.
+        rmtree(s_tmp)
+        return
+    updateCacheStats('results',{'stores':1})
+    i_evicted=evictCache(s_cacheDir,i_limit)
+    if i_evicted>0: updateCacheStats('results',{'evictions':i_evicted})
+
+### END FUNCTION
+
+### FUNCTION: evictCache
+# Removes least recently used entries from cache directory s_cacheDir until
+# it is no bigger than i_limit bytes. Each entry is a directory, and is
+# marked as used by the modification time of its "meta.json" file.
+# Returns the number of entries removed.
+def evictCache(s_cacheDir,i_limit):
+    ls_entries=[]
+    i_total=0
+    for s_dir in glob(s_cacheDir+'/*/'):
+        try:
+            i_size=sum([getsize(s_root+'/'+s_name) for s_root,ls_subdirs,ls_names in walk(s_dir) for s_name in ls_names])
+            ls_entries.append((getmtime(s_dir+'meta.json'),i_size,s_dir))
+        except OSError:
+            continue
+        i_total+=i_size
+    ls_entries.sort()
+    i_evicted=0
+    for (r_used,i_size,s_dir) in ls_entries:
+        if i_total<=i_limit: break
+        rmtree(s_dir,ignore_errors=True)
+        i_total-=i_size
+        i_evicted+=1
+    return i_evicted
+
+### END FUNCTION
+
+### FUNCTION: modelCacheKey
+# Returns the model cache key for model archive s_modelFile: a hash of the
+# archive's MD5 checksum and format, and for gbXML models, the converter. The
+# checksum is s_MD5 from the models table if there is one, so the archive is
+# only read if there is not.
+def modelCacheKey(s_modelFile,s_MD5):
+    if s_MD5 is None or str(s_MD5).strip()=='':
+        h=hashlib.md5()
+        f=open(s_modelFile,'rb')
+        while True:
+            chunk=f.read(1048576)
+            if not chunk: break
+            h.update(chunk)
+        f.close()
+        s_MD5=h.hexdigest()
+    h=hashlib.md5()
+    s_ext=basename(s_modelFile).split('.',1)[1]
+    h.update((s_ext+'\0'+str(s_MD5).strip().lower()).encode())
+    if s_ext=='xml':
+        h.update(hashPaths(dirname(realpath(__file__)),['common/gbXMLconv']).encode())
+    return h.hexdigest()
+
+### END FUNCTION
+
+### FUNCTION: statTree
+# Returns a dictionary of [size, modification time (ns)] of each file under
+# directory s_dir, by path relative to s_dir.
+def statTree(s_dir):
+    dict_files={}
+    for s_root,ls_subdirs,ls_names in walk(s_dir):
+        for s_name in ls_names:
+            st=stat(s_root+'/'+s_name,follow_symlinks=False)
+            dict_files[relpath(s_root+'/'+s_name,s_dir)]=[st.st_size,st.st_mtime_ns]
+    return dict_files
+
+### END FUNCTION
+
+### FUNCTION: copyTree
+# Copies directory s_src to s_dst (which must not exist), keeping file times.
+# Files are reflinked (copy on write) where the file system supports it, so a
+# copy is quick and takes no space until a file is changed, and otherwise
+# copied. Either way, changes to one copy never reach the other, whichever
+# tool makes them and however (e.g. prj rewriting a file in place).
+def copyTree(s_src,s_dst):
+    run(['cp','-a','--reflink=auto',s_src,s_dst],check=True)
+
+### END FUNCTION
+
+### FUNCTION: fetchCachedModel
+# Creates directory "model" in the job directory from the model cache entry
+# for key s_key, if there is one, as a copy (see copyTree). The entry's files
+# are first checked against the sizes and times recorded when it was stored;
+# an entry that has changed since is removed and not used.
+# Returns True if the model was found.
+def fetchCachedModel(s_key):
+    s_entry=getCacheDir('models')+'/'+s_key
+    if not isfile(s_entry+'/meta.json'):
+        return False
+    f=open(s_entry+'/meta.json','r')
+    dict_meta=json.load(f)
+    f.close()
+    if statTree(s_entry+'/model')!=dict_meta.get('files'):
+        rmtree(s_entry,ignore_errors=True)
+        return False
+
+    # Mark entry as recently used.
+    utime(s_entry+'/meta.json')
+
+    copyTree(s_entry+'/model','model')
+    return True
+
+### END FUNCTION
+
+### FUNCTION: storeCachedModel
+# Stores directory "model" of the job directory in the model cache under key
+# s_key, as a copy (see copyTree), with the sizes and times of its files (see
+# fetchCachedModel). Least recently used entries are then evicted until the
+# cache is no bigger than i_limit bytes.
+def storeCachedModel(s_key,s_jobID,i_limit):
+    s_cacheDir=getCacheDir('models')
+    s_entry=s_cacheDir+'/'+s_key
+    if isdir(s_entry): return
+    s_tmp=s_cacheDir+'/.'+s_key+'.'+s_jobID
+    if isdir(s_tmp): rmtree(s_tmp)
+    makedirs(s_tmp)
+    copyTree('model',s_tmp+'/model')
+    f=open(s_tmp+'/meta.json','w')
+    json.dump({'jobID':s_jobID,'files':statTree(s_tmp+'/model')},f)
+    f.close()
+    try:
+        rename(s_tmp,s_entry)
+    except OSError:
+        # Another job stored the same model first.
+        rmtree(s_tmp)
+        return
+    updateCacheStats('models',{'stores':1})
+    i_evicted=evictCache(s_cacheDir,i_limit)
+    if i_evicted>0: updateCacheStats('models',{'evictions':i_evicted})
+
+### END FUNCTION
+
+### FUNCTION: updateCacheStats
+# Adds counts in dict_counts (e.g. {'hits':1}) to the statistics of cache
+# s_cache, in "stats.json" in the cache directory. The file is locked while
+# it is updated, because jobs update it concurrently.
+def updateCacheStats(s_cache,dict_counts):
+    s_cacheDir=getCacheDir(s_cache)
+    try:
+        makedirs(s_cacheDir,exist_ok=True)
+        f=open(s_cacheDir+'/stats.json','a+')
+        fcntl.flock(f,fcntl.LOCK_EX)
+        f.seek(0)
+        try:
+            dict_stats=json.load(f)
+        except ValueError:
+            dict_stats={}
+        for s_count in dict_counts:
+            dict_stats[s_count]=dict_stats.get(s_count,0)+dict_counts[s_count]
+        f.seek(0)
+        f.truncate()
+        json.dump(dict_stats,f)
+        f.close()
+    except OSError:
+        pass
+
+### END FUNCTION
+
 ### FUNCTION: printError
 # Prints a timestamped error message to the error log, and to the terminal if in debug mode.
 def printError(s_msg,s_errlog,b_debug):    
@@ -654,6 +1280,188 @@ def printError(s_msg,s_errlog,b_debug):
 ### END FUNCTION
 
 
+### FUNCTION: claimJob
+# Claims job i_jobID for worker s_worker (an instance of the service), so that
+# no other instance sharing the database will run it. The job's row is locked
+# with SELECT ... FOR UPDATE SKIP LOCKED, so if another instance is claiming
+# it at the same moment this claim fails rather than waits. The claim
+# succeeds if the job is unowned, already owned by s_worker, or its owner's
+# lease has expired; the lease is then set to expire in i_lease seconds.
+# Returns True if the job was claimed.
+# Requires columns worker, lease_expires and heartbeat in table results, added
+# by sql/add_job_leases.sql (see checkSQLschema).
+def claimJob(cnx,i_jobID,s_worker,i_lease):
+    cursor=cnx.cursor()
+    try:
+        # End any transaction left open by earlier queries, so that the claim
+        # is a transaction of its own.
+        cnx.commit()
+        cursor.execute('SELECT id FROM results WHERE id = %s AND '
+                       '(worker IS NULL OR worker = %s OR lease_expires < NOW()) '
+                       'FOR UPDATE SKIP LOCKED',(i_jobID,s_worker))
+        b_claimed=len(cursor.fetchall())==1
+        if b_claimed:
+            cursor.execute('UPDATE results SET worker = %s, lease_expires = NOW() + INTERVAL %s SECOND, heartbeat = NOW() '
+                           'WHERE id = %s',(s_worker,i_lease,i_jobID))
+        cnx.commit()
+    except connector.Error:
+        try:
+            cnx.rollback()
+        except connector.Error:
+            pass
+        b_claimed=False
+    cursor.close()
+    return b_claimed
+
+### END FUNCTION
+
+
+### FUNCTION: renewLeases
+# Renews worker s_worker's leases on the jobs it is running (li_jobIDs), and
+# records a heartbeat. Returns a list of those jobs that are no longer owned
+# by s_worker (i.e. the lease expired and another instance claimed the job).
+# Raises an error if the database could not be updated.
+def renewLeases(cnx,li_jobIDs,s_worker,i_lease):
+    if len(li_jobIDs)==0: return []
+    s_in=','.join(['%s']*len(li_jobIDs))
+    cursor=cnx.cursor()
+    try:
+        cursor.execute('UPDATE results SET lease_expires = NOW() + INTERVAL %s SECOND, heartbeat = NOW() '
+                       'WHERE worker = %s AND id IN ('+s_in+')',[i_lease,s_worker]+li_jobIDs)
+        cnx.commit()
+        cursor.execute('SELECT id FROM results WHERE worker = %s AND id IN ('+s_in+')',[s_worker]+li_jobIDs)
+        li_owned=[a[0] for a in cursor.fetchall()]
+    finally:
+        cursor.close()
+    return [a for a in li_jobIDs if not a in li_owned]
+
+### END FUNCTION
+
+
+### FUNCTION: flushSQLupdates
+# Writes queued job status updates (dict_updates, job ID -> new "result" value)
+# to the SQL database as a single statement in one transaction. If that fails,
+# the transaction is rolled back and each update is retried on its own. Written
+# updates are removed from dict_updates; any that still fail are left in it to
+# be retried later. Returns the number of updates written.
+# Jobs owned by a worker other than s_worker (see claimJob) are not updated.
+def flushSQLupdates(cnx,dict_updates,s_worker,s_errlog,b_debug):
+    if len(dict_updates)==0: return 0
+    li_jobIDs=list(dict_updates)
+    l_params=[]
+    for i_jobID in li_jobIDs:
+        l_params+=[i_jobID,dict_updates[i_jobID]]
+    l_params+=li_jobIDs+[s_worker]
+    s_query=('UPDATE results SET result = CASE id '+' '.join(['WHEN %s THEN %s']*len(li_jobIDs))+
+             ' END WHERE id IN ('+','.join(['%s']*len(li_jobIDs))+') AND (worker IS NULL OR worker = %s)')
+
+    cursor=cnx.cursor()
+    try:
+        cursor.execute(s_query,l_params)
+        cnx.commit()
+    except connector.Error:
+        try:
+            cnx.rollback()
+        except connector.Error:
+            pass
+        printError('failed to batch update SQL database, retrying updates individually',s_errlog,b_debug)
+        i_written=0
+        for i_jobID in li_jobIDs:
+            try:
+                cursor.execute('UPDATE results SET result = %s WHERE id = %s AND (worker IS NULL OR worker = %s)',(dict_updates[i_jobID],i_jobID,s_worker))
+                cnx.commit()
+            except connector.Error:
+                try:
+                    cnx.rollback()
+                except connector.Error:
+                    pass
+                printError('failed to update SQL database for job ID {:d}, will retry'.format(i_jobID),s_errlog,b_debug)
+            else:
+                del dict_updates[i_jobID]
+                i_written+=1
+    else:
+        i_written=len(li_jobIDs)
+        dict_updates.clear()
+    cursor.close()
+    return i_written
+
+### END FUNCTION
+
+
+### FUNCTION: checkSQLschema
+# Checks that table results has the columns this service needs (see
+# claimJob), which older databases do not have until sql/add_job_leases.sql
+# is applied.
+# Returns a list of the missing columns.
+def checkSQLschema(cnx):
+    cursor=cnx.cursor(buffered=True)
+    cursor.execute('SHOW COLUMNS FROM results')
+    ls_columns=[t[0] for t in cursor.fetchall()]
+    cursor.close()
+    return [s for s in ['worker','lease_expires','heartbeat'] if not s in ls_columns]
+
+### END FUNCTION
+
+
+### FUNCTION: readSQLconfig
+# Reads SQL database details from file s_SQLfile, one per line:
+# IP, user, password, database name, error log file.
+# Returns them as a list of strings in that order.
+def readSQLconfig(s_SQLfile):
+    f_SQL=open(s_SQLfile,'r')
+    ls_config=[f_SQL.readline().strip() for i in range(5)]
+    f_SQL.close()
+    return ls_config
+
+### END FUNCTION
+
+
+### FUNCTION: getSQLconnection
+# Gets a connection from the service's SQL connection pool, which persists
+# between dispatches. The SQL details file is only re-read if it has changed
+# on disk since the last dispatch; if so, the pool is reconfigured and pooled
+# connections reconnect with the new details when next handed out. Pooled
+# connections are health checked (pinged) when handed out, and reconnected if
+# dead. If this fails, retries with exponential backoff, and raises the last
+# error if all attempts fail.
+# dict_SQL holds the pool state, see main().
+def getSQLconnection(dict_SQL,r_interval,b_debug):
+    r_mtime=getmtime(dict_SQL['file'])
+    if r_mtime!=dict_SQL['mtime']:
+        (s_SQLIP,s_SQLuser,s_SQLpwd,s_SQLdbs,s_errlog)=readSQLconfig(dict_SQL['file'])
+        if b_debug: print('APASS: SQL details read, database at IP '+s_SQLIP)
+        dict_SQL['errlog']=s_errlog
+        dict_SQL['config']=dict(user=s_SQLuser,
+            password=s_SQLpwd,
+            host=s_SQLIP,
+            database=s_SQLdbs,
+            connection_timeout=r_interval)
+        if not dict_SQL['pool'] is None:
+            dict_SQL['pool'].set_config(**dict_SQL['config'])
+        dict_SQL['mtime']=r_mtime
+
+    r_delay=dict_SQL['backoff']
+    for i_attempt in range(dict_SQL['attempts']):
+        if i_attempt>0:
+            if b_debug: print('APASS: SQL connection failed, retrying in '+'{:.1f}'.format(r_delay)+' seconds')
+            sleep(r_delay)
+            r_delay=r_delay*2
+        try:
+            if dict_SQL['pool'] is None:
+                # The pool opens its connections on creation.
+                dict_SQL['pool']=pooling.MySQLConnectionPool(pool_name='APASS',
+                    pool_size=dict_SQL['size'],
+                    **dict_SQL['config'])
+            cnx=dict_SQL['pool'].get_connection()
+        except connector.Error as e:
+            e_last=e
+        else:
+            return cnx
+    raise e_last
+
+### END FUNCTION
+
+
 
         
 
@@ -670,6 +1478,30 @@ def main():
     # Set up PAM lookup table.
     ls_PAMs=['wireframe','ISO7730_thermal_comfort','visual_comfort','indoor_air_quality','CIBSE_thermal_comfort']
 
+    # Job admission control.
+    # i_maxJobs      - maximum number of jobs running at once, not counting
+    #                  fast lane PAMs (can be set on the command line)
+    # ls_fastPAMs    - cheap PAMs that run in a fast lane; these are admitted
+    #                  ahead of other jobs and do not count towards i_maxJobs
+    # dict_PAMlimits - maximum number of jobs running at once for individual PAMs
+    #                  (can be set on the command line)
+    i_maxJobs=cpu_count()
+    ls_fastPAMs=['wireframe']
+    dict_PAMlimits={'wireframe':4,'visual_comfort':2}
+
+    # Job ownership, so that several instances of the service can share the
+    # same database and shared folder (see claimJob).
+    # s_worker - identifies this instance (can be set on the command line)
+    # i_lease  - seconds for which a claim on a job lasts without renewal;
+    #            set after the command line is parsed, to outlast several
+    #            dispatch intervals
+    s_worker=gethostname()
+
+    # Results and model caches (see resultsCacheKey and modelCacheKey).
+    # i_cacheLimit - size limit of each cache in bytes, 0 disables them (can
+    #                be set on the command line in megabytes)
+    i_cacheLimit=10240*1048576
+
     # Parse command line.
     i_argCount=0
     for arg in sys.argv[1:]:
@@ -689,13 +1521,23 @@ directory tree, see documentation for details.
 
 Usage:
 ./main.py -h
-./main.py [-d] path-to-shared-folder [dispatch-interval]
+./main.py [-d] [--max-jobs=N] [--worker-id=ID] [--cache-size=MB] [--pam-limit=PAM=N ...] path-to-shared-folder [dispatch-interval]
 
 Command line options:
 -h, --help  - displays help text
 -d, --debug - service prints debug information to standard out,
               and jobs print debug information to "[jobID].log"
               in the job folder (../jobs/job_[jobID]).
+--max-jobs=N - maximum number of jobs to run at once (default: number
+               of CPUs); further requested jobs are queued.
+--worker-id=ID - identifies this instance of the service when several
+                 share the same database (default: host name).
+--cache-size=MB - size limit of each of the results and model caches in
+                  megabytes (default: 10240); 0 disables the caches.
+--pam-limit=PAM=N - maximum number of jobs of assessment PAM to run at once
+                    (default: 4 for wireframe, 2 for visual_comfort, no
+                    limit other than --max-jobs for others); can be given
+                    more than once.
 
 Command line arguments:
 1: path to shared folder
@@ -703,6 +1545,34 @@ Command line arguments:
                 sys.exit(0)
             elif arg=='-d' or arg=='--debug':
                 b_debug=True
+            elif arg[:11]=='--max-jobs=':
+                try:
+                    i_maxJobs=int(arg[11:])
+                    assert i_maxJobs>0
+                except (ValueError,AssertionError):
+                    print('APASS error: maximum number of jobs is not a positive integer',file=sys.stderr)
+                    sys.exit(1)
+            elif arg[:12]=='--worker-id=':
+                s_worker=arg[12:]
+                if s_worker=='':
+                    print('APASS error: worker ID is empty',file=sys.stderr)
+                    sys.exit(1)
+            elif arg[:13]=='--cache-size=':
+                try:
+                    i_cacheLimit=int(arg[13:])*1048576
+                    assert i_cacheLimit>=0
+                except (ValueError,AssertionError):
+                    print('APASS error: cache size is not a non-negative integer',file=sys.stderr)
+                    sys.exit(1)
+            elif arg[:12]=='--pam-limit=':
+                try:
+                    s_PAM,s_limit=arg[12:].rsplit('=',1)
+                    assert s_PAM!=''
+                    dict_PAMlimits[s_PAM]=int(s_limit)
+                    assert dict_PAMlimits[s_PAM]>0
+                except (ValueError,AssertionError):
+                    print('APASS error: PAM limit is not of the form PAM=N, with N a positive integer',file=sys.stderr)
+                    sys.exit(1)
             else:
                 print('APASS error: unknown command line option "'+arg+'"',file=sys.stderr)
                 sys.exit(1)
@@ -722,17 +1592,127 @@ Command line arguments:
         print('APASS error: script accepts 1 or 2 argument(s)',file=sys.stderr)
         sys.exit(1)
 
+    i_lease=max(60,int(4*r_interval))
+
     # Main program.
 
     curDateTime=datetime.now()
     s_dateTime=curDateTime.strftime('%a %b %d %X %Y')
     if b_debug: print('APASS: SERVICE START @ '+s_dateTime)
+    for s_cache in ['results','models']:
+        if b_debug and i_cacheLimit>0 and isfile(getCacheDir(s_cache)+'/stats.json'):
+            f=open(getCacheDir(s_cache)+'/stats.json','r')
+            print('APASS: '+s_cache+' cache statistics: '+f.read())
+            f.close()
 
     # Create dictionaries to hold all running processes and pipe connections.
     # They can be retrieved by job ID (string).
     dict_proc=dict()
     dict_pipe=dict()
 
+    # SQL connection pool state.
+    # The pool and its connections are kept for the life of the service.
+    # file     - SQL details file (see readSQLconfig)
+    # mtime    - modification time of the file when it was last read
+    # config   - connection arguments
+    # errlog   - error log file
+    # size     - number of pooled connections
+    # attempts - number of connection attempts per dispatch
+    # backoff  - delay in seconds before the first retry, doubled thereafter
+    dict_SQL={'file':'.SQL.txt','mtime':None,'config':None,'pool':None,
+              'errlog':readSQLconfig('.SQL.txt')[4],'size':1,'attempts':3,'backoff':1.0}
+
+    # Job status updates waiting to be written to the SQL database, by job ID (int).
+    # Updates that fail to be written are kept and retried at the next dispatch.
+    dict_updates=dict()
+    # Counters for job status updates.
+    # queued    - updates requested
+    # coalesced - updates that replaced an earlier update for the same job before it was written
+    # written   - updates written to the database
+    dict_SQLstats={'queued':0,'coalesced':0,'written':0}
+
+    # Jobs waiting to be started, by job ID (string).
+    # Entries are lists: [priority, job ID (int), PAM, runJob arguments, SQL state].
+    # Jobs are started in order of priority, then job ID, as limits allow.
+    dict_waiting=dict()
+    # PAM of each started job, by job ID (string).
+    dict_jobPAM=dict()
+
+    ### FUNCTION: startJob
+    # Starts a job in a new process, with a pipe for the process to
+    # communicate its status.
+    def startJob(s_jobID,s_PAM,t_args):
+        # Open a unidirectional pipe (slave->master) so the process can communicate its status.
+        con,sender=Pipe(False)
+        proc=Process(target=runJob,name='jobID_'+s_jobID,args=t_args[:9]+(sender,)+t_args[9:])
+        proc.start()
+        # Put the process and pipe connections into a dictionary for later retrieval.
+        dict_proc[s_jobID]=proc
+        dict_pipe[s_jobID]=(con,sender)
+        dict_jobPAM[s_jobID]=s_PAM
+
+    ### FUNCTION: queueJob
+    # Adds a job to the waiting queue, if it is not already there, or updates
+    # its state and whether this instance holds its lease (b_owned, see
+    # claimJob).
+    # Fast lane PAMs get priority 0, restarted jobs priority 1, others priority 2.
+    def queueJob(i_jobID,s_PAM,t_args,i_state,b_owned,b_restart=False):
+        s_jobID=str(i_jobID)
+        if s_jobID in dict_waiting:
+            dict_waiting[s_jobID][4]=i_state
+            dict_waiting[s_jobID][5]=b_owned
+            return
+        if s_PAM in ls_fastPAMs:
+            i_priority=0
+        elif b_restart:
+            i_priority=1
+        else:
+            i_priority=2
+        dict_waiting[s_jobID]=[i_priority,i_jobID,s_PAM,t_args,i_state,b_owned]
+
+    ### FUNCTION: admitJobs
+    # Starts waiting jobs in priority order while the concurrency limits allow,
+    # and reports the queue position of jobs still waiting through their SQL
+    # state (21-29, see below). Each job is claimed (see claimJob) before it is
+    # started; jobs claimed by another instance are dropped from the queue.
+    # Queue positions are only reported for jobs whose lease this instance
+    # holds, as other instances see the same unclaimed jobs in their own
+    # queues, at other positions.
+    # Returns a list of (job ID, new state) tuples.
+    def admitJobs(cnx):
+        lt_updates=[]
+        i_numRunning=len([a for a in dict_proc if not dict_jobPAM[a] in ls_fastPAMs])
+        dict_numPAM=dict()
+        for s_jobID in dict_proc:
+            dict_numPAM[dict_jobPAM[s_jobID]]=dict_numPAM.get(dict_jobPAM[s_jobID],0)+1
+        i_position=0
+        for l_job in sorted(dict_waiting.values(),key=lambda a:(a[0],a[1])):
+            [i_priority,i_jobID,s_PAM,t_args,i_state,b_owned]=l_job
+            s_jobID=str(i_jobID)
+            b_fast=s_PAM in ls_fastPAMs
+            if (b_fast or i_numRunning<i_maxJobs) and dict_numPAM.get(s_PAM,0)<dict_PAMlimits.get(s_PAM,i_maxJobs):
+                if not claimJob(cnx,i_jobID,s_worker,i_lease):
+                    if b_debug: print('APASS: job with ID '+s_jobID+' claimed by another worker, removed from queue')
+                    del dict_waiting[s_jobID]
+                    continue
+                if b_debug:
+                    print('APASS: *** starting queued job ***')
+                    print('APASS:   jobID - '+s_jobID)
+                    print('APASS:   performance assessment - '+s_PAM)
+                startJob(s_jobID,s_PAM,t_args)
+                del dict_waiting[s_jobID]
+                if not b_fast: i_numRunning+=1
+                dict_numPAM[s_PAM]=dict_numPAM.get(s_PAM,0)+1
+                lt_updates.append((i_jobID,1))
+            else:
+                i_position+=1
+                i_queued=20+min(i_position,9)
+                if i_queued!=i_state and b_owned:
+                    l_job[4]=i_queued
+                    lt_updates.append((i_jobID,i_queued))
+        if b_debug: print('APASS: {:d} job(s) running, {:d} job(s) queued'.format(len(dict_proc),len(dict_waiting)))
+        return lt_updates
+
     ### FUNCTION: killItWithFire
     # Kills a job with extreme prejudice. Sends a SIGKILL and erases the job directory.
     # This can be used if a job starts to look fishy.
@@ -748,85 +1728,112 @@ Command line arguments:
         del dict_pipe[s_jobID]
 
     # Dispatch in infinite loop.
+    # Dispatches are scheduled every r_interval seconds, but happen early if a
+    # running job sends a signal or exits, so that progress and completion
+    # reach the SQL database straight away.
+    # l_ready - pipe connections and process sentinels that triggered an early dispatch
+    # l_stale - those that were still ready after the dispatch they triggered
+    #           (e.g. job no longer active in the database); these are not waited
+    #           on until the next scheduled dispatch, to avoid dispatching in a
+    #           tight loop
+    # b_schemaChecked - whether the database columns have been checked (see
+    #           checkSQLschema)
     i_failCount=0
+    r_nextPoll=time()
+    b_schemaChecked=False
+    l_ready=[]
+    l_stale=[]
     while True:
         curDateTime=datetime.now()
         s_dateTime=curDateTime.strftime('%a %b %d %X %Y')
-        if b_debug: print('APASS: --------------------\nAPASS: starting dispatch @ '+s_dateTime)
         # Get current time, to time how long dispatch takes.
         start_time=time()
+        if start_time>=r_nextPoll:
+            r_nextPoll=start_time+r_interval
+            l_stale=[]
+            if b_debug: print('APASS: --------------------\nAPASS: starting dispatch @ '+s_dateTime)
+        else:
+            if b_debug: print('APASS: --------------------\nAPASS: starting early dispatch @ '+s_dateTime)
 
-        # Get SQL database IP from file.
-        f_SQL=open('.SQL.txt','r')
-        s_SQLIP=f_SQL.readline().strip()
-        s_SQLuser=f_SQL.readline().strip()
-        s_SQLpwd=f_SQL.readline().strip()
-        s_SQLdbs=f_SQL.readline().strip()
-        s_errlog=f_SQL.readline().strip()
-        f_SQL.close()
-        if b_debug: print('APASS: connecting to SQL database at IP '+s_SQLIP)
-
-        # Connect to SQL database.
+        # Get a connection to the SQL database from the pool.
         try:
-            cnx=connector.connect(user=s_SQLuser,
-                password=s_SQLpwd,
-                host=s_SQLIP,
-                database=s_SQLdbs,
-                connection_timeout=r_interval)
+            cnx=getSQLconnection(dict_SQL,r_interval,b_debug)
         except:
-            printError('failed to connect to SQL database, skipping dispatch',s_errlog,b_debug)
-            sleepTilNext(start_time,r_interval,b_debug)
+            printError('failed to connect to SQL database, skipping dispatch',dict_SQL['errlog'],b_debug)
+            l_ready=waitTilNext(start_time,r_nextPoll,[],b_debug)
             continue
-        cursor=cnx.cursor(buffered=True)
+        s_errlog=dict_SQL['errlog']
 
-        ### FUNCTION: sql_update
-        # Updates the sql table with a new "result" value.
-        def sql_update(i_update,i_jobID):
+        # On the first connection, check that the database has been migrated
+        # for this version of the service. If not, every dispatch would fail,
+        # so stop now.
+        if not b_schemaChecked:
             try:
-                cursor.execute("UPDATE results SET result = {:d} WHERE id = {:d}".format(i_update,i_jobID))
-                cnx.commit()
+                ls_missing=checkSQLschema(cnx)
             except:
-                printError('failed to update SQL database',s_errlog,b_debug)
-            else:
-                if b_debug: print('APASS: successfully updated the SQL database')
+                printError('failed to check SQL database columns, skipping dispatch',s_errlog,b_debug)
+                cnx.close()
+                l_ready=waitTilNext(start_time,r_nextPoll,[],b_debug)
+                continue
+            if ls_missing:
+                s_msg='table results has no column(s) '+', '.join(ls_missing)+'; apply sql/add_job_leases.sql to the database'
+                printError(s_msg,s_errlog,b_debug)
+                print('APASS error: '+s_msg,file=sys.stderr)
+                cnx.close()
+                sys.exit(1)
+            b_schemaChecked=True
+
+        cursor=cnx.cursor(buffered=True)
 
-        # Retrieve job list from SQL database.
+        ### FUNCTION: sql_update
+        # Queues a new "result" value for a job. Queued updates are written to
+        # the sql table together at the end of the dispatch (see flushSQLupdates).
+        # A later update for the same job replaces an earlier one.
+        def sql_update(i_update,i_jobID):
+            if i_jobID in dict_updates: dict_SQLstats['coalesced']+=1
+            dict_updates[i_jobID]=i_update
+            dict_SQLstats['queued']+=1
+
+        # Retrieve list of actionable jobs from SQL database, along with their
+        # model and estate details, in a single query. Finished jobs (states
+        # 2-6, 8 and 9) are filtered out so that the cost of a dispatch scales
+        # with the number of active jobs, not the size of the job history.
+        # Jobs owned by other workers are also filtered out, unless their
+        # lease has expired (see claimJob).
+        # Suggested index to support the filter:
+        #   CREATE INDEX results_result ON results (result);
         try:
-            cursor.execute("SELECT id,sim_start,sim_stop,model,pam,result FROM results")
+            cursor.execute("SELECT r.id,r.sim_start,r.sim_stop,r.model,r.pam,r.result,r.worker,"
+                                  "m.tarball,m.name,m.estate,m.md5,e.name "
+                           "FROM results r "
+                           "LEFT JOIN models m ON m.id = r.model "
+                           "LEFT JOIN estates e ON e.id = m.estate "
+                           "WHERE (r.result IS NULL OR r.result IN (0,1,7) OR r.result BETWEEN 11 AND 29) "
+                           "AND (r.worker IS NULL OR r.worker = %s OR r.lease_expires < NOW())",(s_worker,))
             query=cursor.fetchall()
         except:
             printError('failed to query SQL database, skipping dispatch',s_errlog,b_debug)
-            sleepTilNext(start_time,r_interval,b_debug)
+            cnx.close()
+            l_ready=waitTilNext(start_time,r_nextPoll,[],b_debug)
             continue
         else:
-            if b_debug: print('APASS: successfully queried the SQL database')
+            if b_debug: print('APASS: successfully queried the SQL database, '+str(len(query))+' active jobs')
 
         # Check for required actions on jobs
-        for (i_jobID,s_simStart,s_simStop,i_model,i_PAM,i_progress) in query:
+        ls_seen=[]
+        for (i_jobID,s_simStart,s_simStop,i_model,i_PAM,i_progress,s_owner,s_tarball,s_building,i_estate,s_MD5,s_estate) in query:
 
-            # Retrieve model details.
-            try:
-                cursor.execute("SELECT tarball,name,estate,md5 FROM models WHERE id = "+str(i_model))
-                model_query=cursor.fetchall()
-            except:
+            # Check model and estate details were found.
+            if s_tarball is None:
                 i_update=9
-                printError('failed to retrieve model details for job ID {:d}'.format(i_model),s_errlog,b_debug)
+                printError('failed to retrieve model details for job ID {:d}'.format(i_jobID),s_errlog,b_debug)
                 sql_update(i_update,i_jobID)
                 continue
-            else:
-                (s_tarball,s_building,i_estate,s_MD5)=model_query[0]
-
-            # Retrieve estate name.
-            try:
-                cursor.execute("SELECT name FROM estates WHERE id = "+str(i_estate))
-                model_query=cursor.fetchall()
-            except:
+            if s_estate is None:
                 i_update=9
                 printError('failed to retrieve name of estate ID {:d}'.format(i_estate),s_errlog,b_debug)
                 sql_update(i_update,i_jobID)
                 continue
-            else:
-                (s_estate,)=model_query[0]
 
             # Lookup PAM.
             # 0 = wireframe
@@ -844,13 +1851,16 @@ Command line arguments:
 
             # Check stage of this job.
             s_jobID=str(i_jobID)
+            ls_seen.append(s_jobID)
             i_update=-1
+            t_args=(s_jobID,s_tarball,s_MD5,s_building,s_estate,s_simStart,s_simStop,s_PAM,b_debug,s_shareDir,i_cacheLimit)
 
             # i_update values:
             # None: pending (not submitted yet)
             # 0: run requested
             # 1: running
             # 11 - 19: running with progress indicator
+            # 21 - 29: queued, at position 1 - 9 (29 = 9th or later)
             # 2: job failed
             # 3: job complete, compliant
             # 4: job complete, major problem
@@ -867,8 +1877,8 @@ Command line arguments:
                     print('APASS:   building - '+s_building)
                     print('APASS:   performance assessment - '+s_PAM)
 
-            elif i_progress==0:
-                # Start a job - python multiprocessing.
+            elif i_progress==0 or (i_progress>20 and i_progress<30):
+                # Queue a job to be started - python multiprocessing.
                 # Check that a job with this ID doesn't already exist.
                 if s_jobID in dict_proc:
                     if b_debug: print('APASS: job with ID '+s_jobID+' already exists')
@@ -877,19 +1887,16 @@ Command line arguments:
                     continue
 
                 if b_debug:
-                    print('APASS: *** starting new job ***')
+                    if s_jobID in dict_waiting:
+                        print('APASS: *** queued job ***')
+                    else:
+                        print('APASS: *** queueing new job ***')
                     print('APASS:   jobID - '+s_jobID)
                     print('APASS:   building - '+s_building)
                     print('APASS:   performance assessment - '+s_PAM)
 
-                # Open a unidirectional pipe (slave->master) so the process can communicate its status.
-                con,sender=Pipe(False)
-                proc=Process(target=runJob,name='jobID_'+s_jobID,args=(s_jobID,s_tarball,s_MD5,s_building,s_estate,s_simStart,s_simStop,s_PAM,b_debug,sender,s_shareDir))
-                proc.start()
-                # Put the process and pipe connections into a dictionary for later retrieval.
-                dict_proc[s_jobID]=proc
-                dict_pipe[s_jobID]=(con,sender)
-                i_update=1
+                # Jobs are started after all rows have been checked, see admitJobs.
+                queueJob(i_jobID,s_PAM,t_args,i_progress,s_owner==s_worker)
 
             elif i_progress==1 or (i_progress>10 and i_progress<20):
 
@@ -903,7 +1910,8 @@ Command line arguments:
                 # Retrieve job and connection objects from dictionaries.
                 if not s_jobID in dict_proc or not s_jobID in dict_pipe:
                     # Job says it is running, but it not registered.
-                    # This probably means the service crashed and has been restarted.
+                    # This probably means the service crashed and has been restarted,
+                    # or the job's owner stopped renewing its lease (see claimJob).
                     # Restart the job ... unless there is a kill file in the job directory.
                     if b_debug: print('APASS:   jobID not registered')
 
@@ -917,12 +1925,9 @@ Command line arguments:
 
                     if s_jobID in dict_proc: del dict_proc[s_jobID]
                     if s_jobID in dict_pipe: del dict_pipe[s_jobID]
-                    con,sender=Pipe(False)
-                    proc=Process(target=runJob,name='jobID_'+s_jobID,args=(s_jobID,s_tarball,s_MD5,s_building,s_estate,s_simStart,s_simStop,s_PAM,b_debug,sender,s_shareDir))
-                    proc.start()
-                    # Put the process and pipe connections into a dictionary for later retrieval.
-                    dict_proc[s_jobID]=proc
-                    dict_pipe[s_jobID]=(con,sender)                    
+                    # Restarted jobs are queued ahead of new jobs, and resume
+                    # from their last completed stage (see runJob).
+                    queueJob(i_jobID,s_PAM,t_args,i_progress,s_owner==s_worker,b_restart=True)
                     continue
 
             # Check for an admin kill command (a file called "kill.it" in the job directory).
@@ -1062,6 +2067,9 @@ Command line arguments:
                     print('APASS:   performance assessment - '+s_PAM)
                 # Retrieve job and connection objects from dictionaries.
                 if not s_jobID in dict_proc or not s_jobID in dict_pipe:
+                    if s_jobID in dict_waiting:
+                        if b_debug: print('APASS: *** queued job removed from queue ***')
+                        del dict_waiting[s_jobID]
                     if b_debug: print('APASS:   jobID not registered')
                     if b_debug: print('APASS: *** non-existent job flagged as cancelled ***')
                     i_update=8
@@ -1140,9 +2148,41 @@ Command line arguments:
             if i_update>0:
                 sql_update(i_update,i_jobID)
 
+        # Forget waiting jobs that are no longer requested, e.g. deleted by the front end.
+        for s_jobID in [a for a in dict_waiting if not a in ls_seen]:
+            del dict_waiting[s_jobID]
+        for s_jobID in [a for a in dict_jobPAM if not a in dict_proc]:
+            del dict_jobPAM[s_jobID]
+
+        # Renew leases on running jobs. If another worker has taken over a job
+        # (because this worker failed to renew the lease in time), stop running it here.
+        try:
+            li_lost=renewLeases(cnx,[int(a) for a in dict_proc],s_worker,i_lease)
+        except connector.Error:
+            printError('failed to renew job leases',s_errlog,b_debug)
+        else:
+            for i_jobID in li_lost:
+                printError('job ID {:d} claimed by another worker; killed'.format(i_jobID),s_errlog,b_debug)
+                killItWithFire(str(i_jobID))
+
+        # Start queued jobs as limits allow, and report queue positions.
+        for (i_jobID,i_update) in admitJobs(cnx):
+            sql_update(i_update,i_jobID)
+
+        # Write all queued job status updates.
+        i_written=flushSQLupdates(cnx,dict_updates,s_worker,s_errlog,b_debug)
+        dict_SQLstats['written']+=i_written
+        if b_debug: 
+            print('APASS: {:d} job status update(s) written, {:d} pending'.format(i_written,len(dict_updates)))
+            print('APASS: since service start, {:d} update(s) queued, {:d} coalesced, {:d} written'.format(dict_SQLstats['queued'],dict_SQLstats['coalesced'],dict_SQLstats['written']))
+
+        # Return the connection to the pool.
         cnx.close()
 
-        # Check that dispatch has not been running for longer than the interval.
-        sleepTilNext(start_time,r_interval,b_debug)
+        # Wait for the next scheduled dispatch, or job activity.
+        l_waitables=[dict_pipe[a][0] for a in dict_pipe]+[dict_proc[a].sentinel for a in dict_proc]
+        l_ready=[a for a in l_ready if a in l_waitables]
+        if len(l_ready)>0: l_stale+=wait(l_ready,timeout=0)
+        l_ready=waitTilNext(start_time,r_nextPoll,[a for a in l_waitables if not a in l_stale],b_debug)
 
 if __name__=='__main__': main()
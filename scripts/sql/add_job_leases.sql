@@ -0,0 +1,9 @@
+-- Adds the job ownership columns used by main.py (see claimJob), so that
+-- several instances of the service can share one database. main.py checks
+-- for these columns when it starts, and stops if they are missing.
+-- Apply once, e.g.:
+--   mysql -h [IP] -u [user] -p [database] < sql/add_job_leases.sql
+
+ALTER TABLE results ADD COLUMN worker VARCHAR(64) NULL,
+                    ADD COLUMN lease_expires DATETIME NULL,
+                    ADD COLUMN heartbeat DATETIME NULL;